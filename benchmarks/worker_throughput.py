@@ -0,0 +1,92 @@
+"""
+Measure worker throughput (tasks/sec) for each execution pool.
+
+Enqueues a batch of trivial tasks and drives a pool the same way the
+task_worker command does, timing how long it takes to drain the queue.
+
+Usage:
+    python benchmarks/worker_throughput.py [--tasks 200] [--concurrency 1]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+DB_FILE = os.path.join(tempfile.gettempdir(), "django_simple_queue_bench.db")
+
+settings.configure(
+    DATABASES={
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": DB_FILE,
+            # Children write concurrently: take the write lock up front and
+            # wait for it instead of failing with "database is locked"
+            "OPTIONS": {"timeout": 30, "transaction_mode": "IMMEDIATE"},
+        }
+    },
+    INSTALLED_APPS=[
+        "django.contrib.contenttypes",
+        "django_simple_queue",
+    ],
+    DEFAULT_AUTO_FIELD="django.db.models.BigAutoField",
+)
+django.setup()
+
+from django.core.management import call_command
+
+from django_simple_queue.management.commands.task_worker import Command
+from django_simple_queue.models import Task
+from django_simple_queue.pool import PreforkPool, ProcessPool
+
+
+def run(pool, n_tasks):
+    """Enqueue ``n_tasks`` tasks and return the tasks/sec achieved by ``pool``."""
+    Task.objects.all().delete()
+    for _ in range(n_tasks):
+        Task.objects.create(task="django_simple_queue.test_tasks.return_hello", args="{}")
+
+    buffer = deque()
+    start = time.perf_counter()
+    done = 0
+    while done < n_tasks:
+        pool.reap()
+        Command.fill_pool(pool, buffer)
+        Command.wait_for_pool(pool, 0.1)
+        done = Task.objects.filter(status=Task.COMPLETED).count()
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return n_tasks / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    options = parser.parse_args()
+
+    if os.path.exists(DB_FILE):
+        os.remove(DB_FILE)
+    call_command("migrate", verbosity=0)
+
+    pools = {
+        "fork": lambda: ProcessPool(options.concurrency, None),
+        "prefork": lambda: PreforkPool(options.concurrency, None),
+        "thread": lambda: PreforkPool(options.concurrency, None, threads=10),
+    }
+    try:
+        for name, make_pool in pools.items():
+            rate = run(make_pool(), options.tasks)
+            print(f"{name:>8}: {rate:8.1f} tasks/sec")
+    finally:
+        os.remove(DB_FILE)
+
+
+if __name__ == "__main__":
+    main()
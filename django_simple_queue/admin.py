@@ -6,13 +6,32 @@ Provides a customized admin interface for viewing and managing tasks.
 from __future__ import annotations
 
 from django.contrib import admin, messages
+from django.db import IntegrityError, connections, transaction
 from django.db.models import QuerySet
 from django.http import HttpRequest
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.safestring import SafeString
 from django.utils.translation import ngettext
-from django_simple_queue.models import Task
+from django_simple_queue.models import PeriodicTask, Task, TaskResult
+from django_simple_queue.notify import notify_workers
+
+
+class TaskResultInline(admin.StackedInline):
+    """
+    Read-only output, error and log of a task.
+
+    Only loaded on the change page, so the list view never reads the
+    (possibly large) result rows.
+    """
+
+    model = TaskResult
+    fields = readonly_fields = ('output', 'error', 'log')
+    can_delete = False
+
+    def has_add_permission(self, request: HttpRequest, obj=None) -> bool:
+        return False
 
 
 @admin.register(Task)
@@ -24,8 +43,10 @@ class TaskAdmin(admin.ModelAdmin):
         - All fields are read-only when editing an existing task
         - Status column links to the task status page
         - "Enqueue" action to re-queue selected tasks
+        - Actions to set the priority of selected tasks
         - Search by task ID, callable path, and output
-        - Filter by status, created, and modified dates
+        - Output, error and log shown inline from the task's TaskResult
+        - Filter by status, queue, priority, created, and modified dates
 
     Note:
         Tasks are generally created programmatically via ``create_task()``,
@@ -64,21 +85,105 @@ class TaskAdmin(admin.ModelAdmin):
         Admin action to re-queue selected tasks.
 
         Changes the status of selected tasks back to QUEUED so they will
-        be picked up by a worker. Useful for retrying failed tasks.
+        be picked up by a worker. Useful for retrying failed tasks; the
+        tasks get their full number of automatic retries again.
 
         Args:
             request: The HTTP request.
             queryset: QuerySet of selected Task instances.
         """
-        updated = queryset.update(status=Task.QUEUED)
+        try:
+            with transaction.atomic(using=queryset.db):
+                if not connections[queryset.db].features.supports_partial_indexes:
+                    # No dsq_task_active_dedupe_uniq (MySQL, MariaDB): check by hand
+                    self._check_dedupe_keys(queryset)
+                updated = queryset.update(
+                    status=Task.QUEUED, enqueued_at=timezone.now(), attempts=0
+                )
+        except IntegrityError:
+            self.message_user(
+                request,
+                'Nothing was enqueued: an active task already has the '
+                'deduplication key of a selected task.',
+                messages.ERROR,
+            )
+            return
+        if updated:
+            notify_workers()
         self.message_user(request, ngettext(
             '%d task was successfully enqueued.',
             '%d tasks were successfully enqueued.',
             updated,
         ) % updated, messages.SUCCESS)
 
+    @staticmethod
+    def _check_dedupe_keys(queryset: QuerySet[Task]) -> None:
+        """
+        Raise IntegrityError if enqueueing ``queryset`` would leave two
+        active tasks with the same ``dedupe_key``. The active holders are
+        locked until the end of the transaction.
+        """
+        keys = list(
+            queryset.exclude(dedupe_key=None).values_list('dedupe_key', flat=True)
+        )
+        if len(keys) != len(set(keys)):
+            raise IntegrityError('Selected tasks share a deduplication key.')
+        taken = (
+            Task.objects.using(queryset.db)
+            .select_for_update()
+            .filter(
+                dedupe_key__in=keys,
+                status__in=(Task.QUEUED, Task.PROGRESS, Task.SCHEDULED),
+            )
+            .exclude(pk__in=list(queryset.values_list('pk', flat=True)))
+        )
+        if taken.exists():
+            raise IntegrityError('An active task holds a deduplication key.')
+
+    def _set_priority(self, request: HttpRequest, queryset: QuerySet[Task], priority: int) -> None:
+        """Set ``priority`` on the selected tasks and report how many changed."""
+        updated = queryset.update(priority=priority)
+        self.message_user(request, ngettext(
+            'Priority of %d task was updated.',
+            'Priority of %d tasks was updated.',
+            updated,
+        ) % updated, messages.SUCCESS)
+
+    @admin.action(description='Set priority: high')
+    def set_priority_high(self, request: HttpRequest, queryset: QuerySet[Task]) -> None:
+        """Admin action to claim the selected tasks before normal ones."""
+        self._set_priority(request, queryset, Task.PRIORITY_HIGH)
+
+    @admin.action(description='Set priority: normal')
+    def set_priority_normal(self, request: HttpRequest, queryset: QuerySet[Task]) -> None:
+        """Admin action to reset the selected tasks to the default priority."""
+        self._set_priority(request, queryset, Task.PRIORITY_NORMAL)
+
+    @admin.action(description='Set priority: low')
+    def set_priority_low(self, request: HttpRequest, queryset: QuerySet[Task]) -> None:
+        """Admin action to claim the selected tasks after normal ones."""
+        self._set_priority(request, queryset, Task.PRIORITY_LOW)
+
     ordering = ['-modified', ]
-    list_display = ('id', 'created', 'modified', 'task', 'status_page_link')
-    list_filter = ('status', 'created', 'modified')
-    search_fields = ('id', 'task', 'output')
-    actions = ['enqueue_tasks']
+    list_display = ('id', 'created', 'enqueued_at', 'modified', 'task', 'queue', 'priority', 'status_page_link')
+    list_filter = ('status', 'queue', 'priority', 'created', 'modified')
+    search_fields = ('id', 'task', 'result__output')
+    inlines = [TaskResultInline]
+    actions = ['enqueue_tasks', 'set_priority_high', 'set_priority_normal', 'set_priority_low']
+
+
+@admin.register(PeriodicTask)
+class PeriodicTaskAdmin(admin.ModelAdmin):
+    """
+    Read-only view of when each periodic task last ran and runs next.
+
+    The schedules themselves are configured in
+    ``DJANGO_SIMPLE_QUEUE_PERIODIC_TASKS``.
+    """
+
+    list_display = ('name', 'last_run_at', 'next_run_at')
+    ordering = ['next_run_at', ]
+    readonly_fields = ('name', 'last_run_at', 'next_run_at')
+
+    def has_add_permission(self, request: HttpRequest) -> bool:
+        return False
@@ -0,0 +1,69 @@
+"""
+Exponential backoff helpers.
+
+Used by the task_worker command to slow down polling while the queue is
+empty and to go straight back to claiming as soon as there is work.
+"""
+from __future__ import annotations
+
+import random
+
+
+def exponential_backoff(
+    attempt: int, base: float, cap: float, jitter: bool = True
+) -> float:
+    """
+    Compute the delay before the given attempt.
+
+    The delay doubles with every attempt, starting at ``base`` and never
+    exceeding ``cap``. With jitter enabled, a random delay between half and
+    all of that value is returned so that many workers backing off at the
+    same time do not wake up in lockstep.
+
+    Args:
+        attempt: Zero-based attempt number.
+        base: Delay in seconds for the first attempt.
+        cap: Maximum delay in seconds.
+        jitter: Whether to randomize the delay.
+
+    Returns:
+        Delay in seconds.
+    """
+    delay = min(cap, base * (2 ** min(attempt, 64)))
+    if jitter:
+        delay = random.uniform(delay / 2, delay)
+    return delay
+
+
+class IdleBackoff:
+    """
+    Tracks how long a worker should sleep while the queue stays empty.
+
+    Each consecutive empty poll doubles the delay, from ``minimum`` up to
+    ``maximum`` seconds. Call ``reset()`` once a task has been claimed.
+
+    Args:
+        minimum: Delay after the first empty poll, in seconds.
+        maximum: Upper bound for the delay, in seconds.
+
+    Example:
+        backoff = IdleBackoff(0.5, 10)
+        backoff.next_delay()  # ~0.5
+        backoff.next_delay()  # ~1
+        backoff.reset()
+    """
+
+    def __init__(self, minimum: float, maximum: float):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        """Return the delay for the next empty poll and increase the backoff."""
+        delay = exponential_backoff(self.attempt, self.minimum, self.maximum)
+        self.attempt += 1
+        return max(self.minimum, delay)
+
+    def reset(self) -> None:
+        """Go back to the minimum delay."""
+        self.attempt = 0
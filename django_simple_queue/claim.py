@@ -0,0 +1,326 @@
+"""
+Claiming queued tasks for execution.
+
+A claim atomically moves queued tasks to PROGRESS and stamps them with the
+claiming worker's PID, so no two workers ever run the same task. Up to
+``limit`` tasks are claimed per call so a worker can fill all of its free
+slots (and a local prefetch buffer) in a single round trip.
+
+Tasks scheduled for later wait in SCHEDULED until ``enqueue_due_tasks`` moves
+them to QUEUED, so the claim query never has to skip rows that are not due.
+
+Workers subscribe to named queues; ``claim_from_queues`` spreads claims over
+several queues according to their weights.
+
+Tasks with a rate limit (``DJANGO_SIMPLE_QUEUE_RATE_LIMITS``) are only
+claimed while their shared token bucket has tokens; see ``ratelimit``.
+
+Tasks with a concurrency limit (``DJANGO_SIMPLE_QUEUE_CONCURRENCY_LIMITS``)
+are skipped while their path or key has as many tasks running as allowed;
+see ``concurrency``.
+
+Every claim also grants a lease (``lease_expires_at``) that the worker keeps
+renewing with ``extend_leases`` while the task runs; a task whose lease runs
+out is treated as orphaned by ``detect_orphaned_tasks``.
+"""
+from __future__ import annotations
+
+import os
+import random
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import F, Min, QuerySet
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+
+from django_simple_queue.concurrency import (
+    load_concurrency_limits,
+    over_limit,
+    saturated,
+)
+from django_simple_queue.conf import get_lease_duration
+from django_simple_queue.models import Task
+from django_simple_queue.monitor import host_identity
+from django_simple_queue.ratelimit import (
+    Rate,
+    exhausted_tasks,
+    load_rate_limits,
+    take_tokens,
+)
+
+
+def _supports_update_returning(connection) -> bool:
+    """Whether ``UPDATE ... RETURNING`` can be used on this connection."""
+    # PostgreSQL and SQLite >= 3.35 support RETURNING on both INSERT and
+    # UPDATE; MariaDB only supports it on INSERT/DELETE.
+    return (
+        connection.vendor in ("postgresql", "sqlite")
+        and connection.features.can_return_columns_from_insert
+    )
+
+
+def queued_tasks(using: str, queues: list[str] | None = None) -> QuerySet[Task]:
+    """
+    Queued tasks in the order they should be claimed, locked for update:
+    lowest ``priority`` first, then oldest first.
+
+    Rows already locked by another worker are skipped where the backend
+    supports ``SKIP LOCKED``.
+
+    Args:
+        using: Database alias.
+        queues: Only include tasks from these queues; None means any queue.
+    """
+    features = connections[using].features
+    qs = (
+        Task.objects.using(using)
+        .select_for_update(skip_locked=features.has_select_for_update_skip_locked)
+        .filter(status=Task.QUEUED)
+    )
+    if queues is not None:
+        qs = qs.filter(queue__in=queues)
+    return qs.order_by("priority", "enqueued_at")
+
+
+def claim_tasks(
+    limit: int = 1, worker_pid: int | None = None, queues: list[str] | None = None
+) -> list[uuid.UUID]:
+    """
+    Atomically claim up to ``limit`` queued tasks.
+
+    On PostgreSQL and SQLite the claim is a single
+    ``UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED LIMIT n)
+    RETURNING id`` statement. Other backends lock the rows with
+    ``select_for_update`` and update them in the same transaction.
+
+    Args:
+        limit: Maximum number of tasks to claim.
+        worker_pid: PID recorded on the claimed tasks; defaults to the
+            current process. The tasks also record this host's name and
+            boot ID.
+        queues: Only claim tasks from these queues; None means any queue.
+            A single queue is served by the ``dsq_task_queued_idx`` index.
+
+    Tasks whose rate limit is exhausted, or whose concurrency limit is
+    reached, are skipped, leaving their place in the queue to the next tasks.
+
+    Returns:
+        IDs of the claimed tasks, now in PROGRESS with their ``attempts``
+        incremented. The order within one batch is not guaranteed.
+    """
+    if limit < 1:
+        return []
+    using = router.db_for_write(Task)
+    connection = connections[using]
+    now = timezone.now()
+    hostname, boot_id = host_identity()
+    values = {
+        "status": Task.PROGRESS,
+        "worker_pid": worker_pid if worker_pid is not None else os.getpid(),
+        "worker_host": hostname,
+        "worker_boot_id": boot_id,
+        "lease_expires_at": now + timedelta(seconds=get_lease_duration()),
+        "attempts": F("attempts") + 1,
+        "modified": now,
+    }
+
+    caps = load_concurrency_limits()
+    limits = load_rate_limits()
+
+    with transaction.atomic(using=using):
+        candidates = queued_tasks(using, queues)
+        if caps:
+            full = saturated(using, caps)
+            if full is not None:
+                candidates = candidates.exclude(full)
+        if limits:
+            exhausted = exhausted_tasks(using, limits, now)
+            if exhausted:
+                candidates = candidates.exclude(task__in=exhausted)
+        if _supports_update_returning(connection):
+            query = (
+                Task.objects.using(using)
+                .filter(pk__in=candidates.values("pk")[:limit])
+                .query.chain(UpdateQuery)
+            )
+            query.add_update_values(values)
+            sql, params = query.get_compiler(using).as_sql()
+            pk_column = connection.ops.quote_name(Task._meta.pk.column)
+            with connection.cursor() as cursor:
+                cursor.execute(f"{sql} RETURNING {pk_column}", params)
+                rows = cursor.fetchall()
+            ids = [Task._meta.pk.to_python(value) for (value,) in rows]
+        else:
+            ids = list(candidates.values_list("pk", flat=True)[:limit])
+            if ids:
+                Task.objects.using(using).filter(pk__in=ids).update(**values)
+
+        if caps and ids:
+            refused = over_limit(using, ids, caps)
+            if refused:
+                _unclaim(using, refused)
+                ids = [pk for pk in ids if pk not in refused]
+        if limits and ids:
+            ids = _apply_rate_limits(using, ids, limits, now)
+        return ids
+
+
+def _unclaim(using: str, task_ids) -> None:
+    """
+    Undo the claim of tasks within the claim transaction, as if they had
+    never been claimed.
+    """
+    Task.objects.using(using).filter(pk__in=task_ids).update(
+        status=Task.QUEUED,
+        worker_pid=None,
+        worker_host=None,
+        worker_boot_id=None,
+        lease_expires_at=None,
+        attempts=F("attempts") - 1,
+    )
+
+
+def _apply_rate_limits(
+    using: str, ids: list[uuid.UUID], limits: dict[str, Rate], now: datetime
+) -> list[uuid.UUID]:
+    """
+    Take a token for every rate-limited task just claimed.
+
+    Tasks that get no token (another worker emptied the bucket since it was
+    checked) go back to the queue in the same transaction, as if never
+    claimed.
+
+    Returns:
+        IDs of the claimed tasks that may run.
+    """
+    by_path = defaultdict(list)
+    limited = Task.objects.using(using).filter(pk__in=ids, task__in=limits)
+    for pk, task_path in limited.values_list("pk", "task"):
+        by_path[task_path].append(pk)
+    refused = set()
+    for task_path, pks in by_path.items():
+        granted = take_tokens(using, task_path, limits[task_path], len(pks), now)
+        refused.update(pks[granted:])
+    if refused:
+        _unclaim(using, refused)
+    return [pk for pk in ids if pk not in refused]
+
+
+def claim_from_queues(
+    limit: int, weights: dict[str, float], worker_pid: int | None = None
+) -> list[uuid.UUID]:
+    """
+    Claim up to ``limit`` tasks from several queues, honouring their weights.
+
+    The queues are tried one at a time in a weighted random order, drawn
+    afresh for every call, until ``limit`` tasks are claimed: a queue with
+    weight 3 is tried first three times as often as one with weight 1, and
+    no queue is starved while the others are busy.
+
+    Args:
+        limit: Maximum number of tasks to claim.
+        weights: Queue names mapped to positive weights.
+        worker_pid: PID recorded on the claimed tasks.
+
+    Returns:
+        IDs of the claimed tasks, now in PROGRESS.
+    """
+    if len(weights) == 1:
+        return claim_tasks(limit, worker_pid, list(weights))
+    # Weighted random permutation (Efraimidis-Spirakis)
+    order = sorted(
+        weights, key=lambda queue: random.random() ** (1 / weights[queue]), reverse=True
+    )
+    claimed = []
+    for queue in order:
+        if len(claimed) >= limit:
+            break
+        claimed += claim_tasks(limit - len(claimed), worker_pid, [queue])
+    return claimed
+
+
+def enqueue_due_tasks() -> int:
+    """
+    Move scheduled tasks whose ``run_after`` has passed to the queue.
+
+    One ``UPDATE`` served by the ``dsq_task_scheduled_idx`` partial index.
+    A due task takes its place in the queue as if it had been enqueued at
+    its ``run_after`` time.
+
+    Returns:
+        The number of tasks queued.
+    """
+    now = timezone.now()
+    return Task.objects.filter(status=Task.SCHEDULED, run_after__lte=now).update(
+        status=Task.QUEUED, enqueued_at=F("run_after"), modified=now
+    )
+
+
+def next_due_time() -> datetime | None:
+    """Earliest ``run_after`` among scheduled tasks, or None if there are none."""
+    return Task.objects.filter(status=Task.SCHEDULED).aggregate(
+        next_due=Min("run_after")
+    )["next_due"]
+
+
+def release_tasks(task_ids: list[uuid.UUID]) -> int:
+    """
+    Put claimed tasks that never started back in the queue.
+
+    Used by a worker shutting down with tasks still in its prefetch buffer.
+    The tasks keep their ``enqueued_at``, and with it their place in the queue,
+    and the claim is not counted as an attempt.
+
+    Args:
+        task_ids: IDs of tasks claimed by this worker.
+
+    Returns:
+        The number of tasks re-queued.
+    """
+    if not task_ids:
+        return 0
+    return Task.objects.filter(pk__in=task_ids, status=Task.PROGRESS).update(
+        status=Task.QUEUED,
+        worker_pid=None,
+        worker_host=None,
+        worker_boot_id=None,
+        lease_expires_at=None,
+        attempts=F("attempts") - 1,
+        modified=timezone.now(),
+    )
+
+
+def extend_leases(
+    task_ids: list[uuid.UUID], worker_pid: int | None = None
+) -> int:
+    """
+    Renew the leases of tasks this worker is still running.
+
+    Called periodically by the worker as a heartbeat. Tasks that are no
+    longer in PROGRESS under this worker's claim (finished, already failed
+    after their lease expired, or re-queued and claimed by another worker)
+    are left alone.
+
+    Args:
+        task_ids: IDs of tasks claimed by this worker.
+        worker_pid: PID the tasks were claimed with; defaults to the
+            current process, as in ``claim_tasks``.
+
+    Returns:
+        The number of leases renewed.
+    """
+    if not task_ids:
+        return 0
+    hostname, boot_id = host_identity()
+    return Task.objects.filter(
+        pk__in=task_ids,
+        status=Task.PROGRESS,
+        worker_pid=worker_pid if worker_pid is not None else os.getpid(),
+        worker_host=hostname,
+        worker_boot_id=boot_id,
+    ).update(
+        lease_expires_at=timezone.now() + timedelta(seconds=get_lease_duration())
+    )
@@ -0,0 +1,174 @@
+"""
+Concurrency limits per task path.
+
+``DJANGO_SIMPLE_QUEUE_CONCURRENCY_LIMITS`` caps how many tasks of a path
+may be in PROGRESS at once across all workers, either for the path as a
+whole or separately for each value of one of its arguments (its key).
+
+``claim_tasks`` skips tasks whose path (or key) is at its limit, using the
+``dsq_task_running_key_idx`` partial index to count running rows. It then
+re-counts under a ``ConcurrencyLock`` row lock and puts back any task that
+a concurrent claim beat it to.
+"""
+from __future__ import annotations
+
+import uuid
+from collections import Counter, defaultdict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, Q
+
+from django_simple_queue.conf import get_concurrency_limits
+from django_simple_queue.models import ConcurrencyLock, Task
+
+
+class ConcurrencyLimit:
+    """
+    At most ``limit`` running tasks of a path, or per key if ``key`` names
+    one of the task's arguments.
+
+    Raises:
+        ValueError: If ``limit`` is not a positive integer.
+    """
+
+    def __init__(self, limit: int, key: str | None = None):
+        if not isinstance(limit, int) or limit < 1:
+            raise ValueError(f"Concurrency limit must be a positive integer, got {limit!r}")
+        self.limit = limit
+        self.key = key
+
+
+def load_concurrency_limits() -> dict[str, ConcurrencyLimit]:
+    """
+    Concurrency limits from settings, by task path.
+
+    Raises:
+        ImproperlyConfigured: If a limit is malformed.
+    """
+    limits = {}
+    for task_path, value in get_concurrency_limits().items():
+        try:
+            if isinstance(value, dict):
+                limits[task_path] = ConcurrencyLimit(**value)
+            else:
+                limits[task_path] = ConcurrencyLimit(value)
+        except (TypeError, ValueError) as e:
+            raise ImproperlyConfigured(
+                f"DJANGO_SIMPLE_QUEUE_CONCURRENCY_LIMITS[{task_path!r}]: {e}"
+            )
+    return limits
+
+
+def concurrency_key(
+    task_path: str, args: dict, limits: dict[str, ConcurrencyLimit] | None = None
+) -> str | None:
+    """
+    Key stored on a new task of ``task_path`` called with ``args``.
+
+    Args:
+        task_path: Dotted path of the task.
+        args: The task's keyword arguments.
+        limits: Limits already loaded with ``load_concurrency_limits``;
+            loaded from settings if omitted.
+
+    Returns:
+        The value of the limit's key argument as a string, or None if the
+        path has no per-key limit or the argument is missing.
+    """
+    if limits is None:
+        limits = load_concurrency_limits()
+    limit = limits.get(task_path)
+    if limit is None or limit.key is None or args.get(limit.key) is None:
+        return None
+    return str(args[limit.key])[:255]
+
+
+def _running_counts(using: str, task_paths) -> Counter:
+    """Running tasks per ``(task, concurrency_key)`` for the given paths."""
+    rows = (
+        Task.objects.using(using)
+        .filter(status=Task.PROGRESS, task__in=task_paths)
+        .values_list("task", "concurrency_key")
+        .annotate(running=Count("pk"))
+    )
+    return Counter({(task_path, key): running for task_path, key, running in rows})
+
+
+def _group(limit: ConcurrencyLimit, key: str | None) -> str | None:
+    """Key the limit is counted under: the task's key, or None for the whole path."""
+    return key if limit.key is not None else None
+
+
+def saturated(using: str, limits: dict[str, ConcurrencyLimit]) -> Q | None:
+    """
+    Filter matching queued tasks that cannot start because their path, or
+    their key, already has ``limit`` tasks running.
+
+    Returns:
+        A ``Q`` to exclude from the claim, or None if nothing is at its limit.
+    """
+    totals = Counter()
+    for (task_path, key), running in _running_counts(using, limits).items():
+        totals[task_path, _group(limits[task_path], key)] += running
+    condition = None
+    for (task_path, key), running in totals.items():
+        limit = limits[task_path]
+        if running < limit.limit:
+            continue
+        if limit.key is None:
+            match = Q(task=task_path)
+        elif key is None:
+            match = Q(task=task_path, concurrency_key__isnull=True)
+        else:
+            match = Q(task=task_path, concurrency_key=key)
+        condition = match if condition is None else condition | match
+    return condition
+
+
+def over_limit(
+    using: str, ids: list[uuid.UUID], limits: dict[str, ConcurrencyLimit]
+) -> set[uuid.UUID]:
+    """
+    Claimed tasks that would take their path or key over its limit.
+
+    Must be called inside the claim transaction: the ``ConcurrencyLock``
+    rows of the claimed paths stay locked until it ends, so concurrent
+    claims of the same path count each other's tasks.
+
+    Returns:
+        IDs of the tasks to put back in the queue: the ones furthest back
+        in it.
+    """
+    claimed = defaultdict(list)
+    rows = (
+        Task.objects.using(using)
+        .filter(pk__in=ids, task__in=limits)
+        .order_by("priority", "enqueued_at")
+    )
+    for pk, task_path, key in rows.values_list("pk", "task", "concurrency_key"):
+        claimed[task_path, _group(limits[task_path], key)].append(pk)
+    if not claimed:
+        return set()
+
+    task_paths = sorted({task_path for task_path, _ in claimed})
+    ConcurrencyLock.objects.using(using).bulk_create(
+        [ConcurrencyLock(task=task_path) for task_path in task_paths],
+        ignore_conflicts=True,
+    )
+    # Lock in a fixed order so claims of several paths cannot deadlock
+    list(
+        ConcurrencyLock.objects.using(using)
+        .select_for_update()
+        .filter(task__in=task_paths)
+        .order_by("task")
+    )
+
+    totals = Counter()
+    for (task_path, key), running in _running_counts(using, task_paths).items():
+        totals[task_path, _group(limits[task_path], key)] += running
+    refused = set()
+    for group, pks in claimed.items():
+        excess = totals[group] - limits[group[0]].limit
+        if excess > 0:
+            refused.update(pks[-excess:])
+    return refused
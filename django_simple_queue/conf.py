@@ -57,6 +57,89 @@ def get_max_output_size() -> int:
     return getattr(settings, "DJANGO_SIMPLE_QUEUE_MAX_OUTPUT_SIZE", 10 * 1024 * 1024)
 
 
+def get_output_flush_count() -> int:
+    """
+    Returns how many values a generator task may yield before they are
+    saved to the database.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_OUTPUT_FLUSH_COUNT = 10
+
+    Default: 100
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_OUTPUT_FLUSH_COUNT", 100)
+
+
+def get_output_flush_size() -> int:
+    """
+    Returns how many bytes a generator task may yield before they are
+    saved to the database.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_OUTPUT_FLUSH_SIZE = 16 * 1024
+
+    Default: 64KB
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_OUTPUT_FLUSH_SIZE", 64 * 1024)
+
+
+def get_output_flush_interval() -> float:
+    """
+    Returns after how many seconds values yielded by a generator task are
+    saved to the database, even below the count and size thresholds.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_OUTPUT_FLUSH_INTERVAL = 5
+
+    Checked whenever the task yields. Set to 0 to save every value as soon
+    as it is yielded.
+
+    Default: 1
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_OUTPUT_FLUSH_INTERVAL", 1)
+
+
+def get_max_log_size() -> int:
+    """
+    Returns the maximum size in bytes of the captured log kept for a task.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_MAX_LOG_SIZE = 100_000  # 100KB
+
+    Past this size only the first and last half of the log are kept, with
+    a marker saying how much was left out in between.
+
+    Default: 1MB
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_MAX_LOG_SIZE", 1024 * 1024)
+
+
+def get_log_flush_size() -> int:
+    """
+    Returns how many bytes of log a running task may write before they are
+    saved to the database.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_LOG_FLUSH_SIZE = 16 * 1024
+
+    Default: 64KB
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_LOG_FLUSH_SIZE", 64 * 1024)
+
+
+def get_log_flush_interval() -> float:
+    """
+    Returns the maximum number of seconds new log output of a running task
+    waits before it is saved to the database.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_LOG_FLUSH_INTERVAL = 1
+
+    Default: 5
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_LOG_FLUSH_INTERVAL", 5)
+
+
 def get_max_args_size() -> int:
     """
     Returns the maximum allowed args JSON size in bytes.
@@ -85,3 +168,222 @@ def get_task_timeout() -> int | None:
     if timeout is None or timeout <= 0:
         return None
     return timeout
+
+
+def get_max_tasks_per_child() -> int | None:
+    """
+    Returns how many tasks a prefork child runs before it is replaced.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_MAX_TASKS_PER_CHILD = 1000
+
+    Only used by ``task_worker --pool prefork``. If not set or set to None,
+    children are never recycled because of their task count.
+
+    Default: None
+    """
+    max_tasks = getattr(settings, "DJANGO_SIMPLE_QUEUE_MAX_TASKS_PER_CHILD", None)
+    if max_tasks is None or max_tasks <= 0:
+        return None
+    return max_tasks
+
+
+def get_max_memory_per_child() -> float | None:
+    """
+    Returns the resident memory (in MB) above which a prefork child is replaced.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_MAX_MEMORY_PER_CHILD = 200  # 200MB
+
+    Checked after every task when running ``task_worker --pool prefork``.
+    If not set or set to None, children are never recycled because of memory.
+
+    Default: None
+    """
+    max_memory = getattr(settings, "DJANGO_SIMPLE_QUEUE_MAX_MEMORY_PER_CHILD", None)
+    if max_memory is None or max_memory <= 0:
+        return None
+    return max_memory
+
+
+def get_min_poll_interval() -> float:
+    """
+    Returns the delay in seconds after the first poll that finds no task.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_MIN_POLL_INTERVAL = 0.5
+
+    While tasks are available the worker claims them back to back. Once the
+    queue is empty it sleeps this long, doubling the delay (with jitter) on
+    every further empty poll up to DJANGO_SIMPLE_QUEUE_MAX_POLL_INTERVAL.
+
+    Default: 0.5
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_MIN_POLL_INTERVAL", 0.5)
+
+
+def get_max_poll_interval() -> float:
+    """
+    Returns the longest delay in seconds between polls of an empty queue.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_MAX_POLL_INTERVAL = 30
+
+    Default: 10
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_MAX_POLL_INTERVAL", 10)
+
+
+def get_notify_channel() -> str | None:
+    """
+    Returns the PostgreSQL channel used to wake up idle workers.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_NOTIFY_CHANNEL = "myproject_tasks"
+
+    On PostgreSQL, enqueueing a task sends a NOTIFY on this channel and idle
+    workers LISTEN on it. Set to None to disable notifications and rely on
+    polling only. Ignored on other database backends.
+
+    Default: "django_simple_queue"
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_NOTIFY_CHANNEL", "django_simple_queue")
+
+
+def get_lease_duration() -> int:
+    """
+    Returns how long a claimed task stays leased to its worker, in seconds.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_LEASE_DURATION = 120
+
+    A worker renews the leases of its running tasks every third of this
+    duration. A PROGRESS task whose lease has run out is considered
+    orphaned and is marked FAILED by any worker, on any host. Keep it well
+    above the longest stall you expect between two worker polls.
+
+    Default: 60 seconds
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_LEASE_DURATION", 60)
+
+
+def get_orphan_check_interval() -> float:
+    """
+    Returns how often each worker looks for orphaned tasks, in seconds.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_ORPHAN_CHECK_INTERVAL = 60
+
+    Every check runs the lease sweep plus a PID check of the tasks claimed
+    on the worker's own host, so the database cost per worker stays flat
+    however often the worker polls.
+
+    Default: 30 seconds
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_ORPHAN_CHECK_INTERVAL", 30)
+
+
+def get_periodic_tasks() -> dict[str, dict]:
+    """
+    Returns the recurring tasks enqueued by the scheduler.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_PERIODIC_TASKS = {
+            "nightly-report": {
+                "task": "reports.tasks.nightly",
+                "schedule": "0 3 * * *",  # cron: every day at 03:00
+                "args": {"format": "pdf"},
+            },
+            "refresh-cache": {
+                "task": "myapp.tasks.refresh_cache",
+                "schedule": 300,  # seconds, or a timedelta
+                "queue": "maintenance",
+            },
+        }
+
+    Each entry needs a ``task`` and a ``schedule``; ``args``, ``queue`` and
+    ``priority`` are optional. Keys name the schedules and must stay stable,
+    since the time of the next run is stored under that name.
+
+    Default: {} (no periodic tasks)
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_PERIODIC_TASKS", {})
+
+
+def get_retry_policies() -> dict[str, dict]:
+    """
+    Returns the retry policies of tasks that are retried when they fail.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_RETRY_POLICIES = {
+            "myapp.tasks.call_partner_api": {
+                "max_retries": 5,
+                "backoff_base": 30,  # seconds before the first retry
+                "backoff_cap": 3600,
+                "jitter": True,
+                "retry_on": ["requests.RequestException", TimeoutError],
+            },
+        }
+
+    Keys are task paths; every option is optional (see ``RetryPolicy``).
+    Tasks without a policy fail on their first error unless created with
+    ``max_retries``.
+
+    Default: {} (no retries)
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_RETRY_POLICIES", {})
+
+
+def get_rate_limits() -> dict[str, str]:
+    """
+    Returns the rate limits of tasks, by task path.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_RATE_LIMITS = {
+            "myapp.tasks.call_partner": "50/m",
+            "myapp.tasks.send_sms": "5/s",
+        }
+
+    A rate is a number of tasks per second (``s``), minute (``m``), hour
+    (``h``) or day (``d``). Workers across all hosts together start at most
+    that many tasks of the path per period, with bursts of up to that number.
+
+    Default: {} (no rate limits)
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_RATE_LIMITS", {})
+
+
+def get_concurrency_limits() -> dict[str, int | dict]:
+    """
+    Returns the maximum number of tasks of a path running at the same time,
+    across all workers.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_CONCURRENCY_LIMITS = {
+            "myapp.tasks.rebuild_index": 2,
+            # At most one running task per value of the account_id argument
+            "myapp.tasks.sync_account": {"limit": 1, "key": "account_id"},
+        }
+
+    The key of a task is taken from its arguments when it is created.
+
+    Default: {} (no limits)
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_CONCURRENCY_LIMITS", {})
+
+
+def get_enqueue_on_commit() -> bool:
+    """
+    Returns whether ``create_task`` defers tasks created inside a
+    transaction until it commits.
+
+    Configure in settings.py:
+        DJANGO_SIMPLE_QUEUE_ENQUEUE_ON_COMMIT = True
+
+    Deferred tasks are inserted with one ``bulk_create`` per transaction
+    after it commits, and are never created if it rolls back. Can be
+    overridden per call with ``create_task(..., on_commit=...)``.
+
+    Default: False
+    """
+    return getattr(settings, "DJANGO_SIMPLE_QUEUE_ENQUEUE_ON_COMMIT", False)
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from django_simple_queue.scheduler import (
+    load_periodic_tasks,
+    next_periodic_run,
+    run_due_periodic_tasks,
+)
+
+
+class Command(BaseCommand):
+    help = "Enqueues the periodic tasks of DJANGO_SIMPLE_QUEUE_PERIODIC_TASKS when they are due."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-sleep",
+            type=float,
+            default=60,
+            help="Longest time in seconds between two checks of the schedule (default: 60).",
+        )
+
+    def handle(self, *args, **options):
+        definitions = load_periodic_tasks()
+        if not definitions:
+            print("No periodic tasks configured (DJANGO_SIMPLE_QUEUE_PERIODIC_TASKS).")
+        for name, definition in definitions.items():
+            print(f"Periodic task '{name}': {definition['task']}")
+
+        max_sleep = options.get("max_sleep") or 60
+        try:
+            while True:
+                enqueued = run_due_periodic_tasks()
+                if enqueued:
+                    print(f"{timezone.now()}: enqueued {enqueued} periodic task(s)")
+                next_run = next_periodic_run()
+                delay = max_sleep
+                if next_run is not None:
+                    delay = min(delay, (next_run - timezone.now()).total_seconds())
+                time.sleep(max(delay, 0.1))
+        except KeyboardInterrupt:
+            pass
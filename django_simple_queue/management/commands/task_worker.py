@@ -1,23 +1,45 @@
-import os
-import random
-import threading
+from __future__ import annotations
+
 import time
-from multiprocessing import Process
+from collections import deque
+from multiprocessing.connection import wait
 
+import django
 import psutil
-from django.core.management.base import BaseCommand
-from django.db import connections, transaction
-from django.db.utils import NotSupportedError
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 
-from django_simple_queue.conf import get_task_timeout
+from django_simple_queue.backoff import IdleBackoff
+from django_simple_queue.claim import (
+    claim_from_queues,
+    enqueue_due_tasks,
+    extend_leases,
+    next_due_time,
+    release_tasks,
+)
+from django_simple_queue.concurrency import load_concurrency_limits
+from django_simple_queue.conf import (
+    get_allowed_tasks,
+    get_lease_duration,
+    get_max_memory_per_child,
+    get_max_poll_interval,
+    get_max_tasks_per_child,
+    get_min_poll_interval,
+    get_orphan_check_interval,
+    get_task_timeout,
+)
+from django_simple_queue.loading import preload_tasks
 from django_simple_queue.models import Task
-from django_simple_queue.monitor import (
-    detect_orphaned_tasks,
-    handle_subprocess_exit,
-    handle_task_timeout,
+from django_simple_queue.monitor import detect_orphaned_tasks
+from django_simple_queue.notify import QueueListener, notify_workers
+from django_simple_queue.pool import PreforkPool, ProcessPool
+from django_simple_queue.ratelimit import load_rate_limits
+from django_simple_queue.retry import load_retry_policies
+from django_simple_queue.scheduler import (
+    load_periodic_tasks,
+    next_periodic_run,
+    run_due_periodic_tasks,
 )
-from django_simple_queue.worker import execute_task
 
 
 def log_memory_usage():
@@ -27,102 +49,298 @@ def log_memory_usage():
     return round(mem_info.rss / (1024 * 1024), 2)
 
 
+def parse_queues(value: str) -> dict[str, float]:
+    """
+    Parse a ``--queues`` option such as ``"emails:3,reports"``.
+
+    Returns:
+        Queue names mapped to their weight (1 when omitted).
+
+    Raises:
+        ValueError: If a weight is not a positive number or a name is empty.
+    """
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.strip().partition(":")
+        if not name:
+            raise ValueError(f"Invalid queue name in {value!r}")
+        weights[name] = float(weight) if weight else 1.0
+        if weights[name] <= 0:
+            raise ValueError(f"Queue weight must be positive: {item.strip()!r}")
+    return weights
+
+
 class Command(BaseCommand):
     help = "Executes the enqueued tasks."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Maximum number of tasks this worker runs at the same time (default: 1).",
+        )
+        parser.add_argument(
+            "--pool",
+            choices=["fork", "prefork", "thread", "async"],
+            default="fork",
+            help=(
+                "fork: a new child process per task (default). "
+                "prefork: long-lived child processes that run many tasks each. "
+                "thread: long-lived child processes that each run --threads "
+                "tasks at once, for I/O-bound tasks. "
+                "async: long-lived child processes that each run --async-tasks "
+                "tasks at once on an event loop, for async def tasks."
+            ),
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=10,
+            help="Tasks run at the same time by each child with --pool thread (default: 10).",
+        )
+        parser.add_argument(
+            "--async-tasks",
+            type=int,
+            default=100,
+            help="Tasks in flight at the same time in each child with --pool async (default: 100).",
+        )
+        parser.add_argument(
+            "--max-tasks-per-child",
+            type=int,
+            default=None,
+            help="Replace a prefork child after this many tasks.",
+        )
+        parser.add_argument(
+            "--max-memory-per-child",
+            type=float,
+            default=None,
+            help="Replace a prefork child once its RSS exceeds this many MB.",
+        )
+        parser.add_argument(
+            "--queues",
+            default=Task.DEFAULT_QUEUE,
+            help=(
+                "Comma-separated queues to take tasks from, each with an optional "
+                "weight, e.g. 'emails:3,reports' (default: 'default')."
+            ),
+        )
+        parser.add_argument(
+            "--scheduler",
+            action="store_true",
+            help=(
+                "Also enqueue the periodic tasks of DJANGO_SIMPLE_QUEUE_PERIODIC_TASKS, "
+                "instead of running a separate task_scheduler."
+            ),
+        )
+        parser.add_argument(
+            "--prefetch",
+            type=int,
+            default=0,
+            help=(
+                "Claim up to this many extra tasks ahead of free slots, so "
+                "freed slots are refilled without a database round trip (default: 0)."
+            ),
+        )
+        parser.add_argument(
+            "--preload",
+            action="store_true",
+            help=(
+                "Import every task of DJANGO_SIMPLE_QUEUE_ALLOWED_TASKS before "
+                "starting child processes, so they inherit the imported modules."
+            ),
+        )
+
     def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        if concurrency < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        prefetch = options.get("prefetch") or 0
+        if prefetch < 0:
+            raise CommandError("--prefetch must not be negative.")
+        if options.get("threads", 10) < 1:
+            raise CommandError("--threads must be at least 1.")
+        try:
+            queues = parse_queues(options.get("queues") or Task.DEFAULT_QUEUE)
+        except ValueError as e:
+            raise CommandError(f"--queues: {e}")
+        load_retry_policies()  # Fail early on a bad retry policy
+        load_rate_limits()
+        load_concurrency_limits()
+        scheduler = options.get("scheduler", False)
+        if scheduler:
+            load_periodic_tasks()  # Fail early on a bad schedule
+        preload = options.get("preload", False)
+        if preload and get_allowed_tasks() is None:
+            raise CommandError("--preload requires DJANGO_SIMPLE_QUEUE_ALLOWED_TASKS.")
+        if options.get("pool") == "async":
+            if options.get("async_tasks", 100) < 1:
+                raise CommandError("--async-tasks must be at least 1.")
+            if django.VERSION < (4, 2):
+                raise CommandError("--pool async requires Django 4.2 or later.")
+
+        pool = None
+        listener = None
+        buffer = deque()
         try:
-            sleep_interval = random.randint(3, 9)
             timeout = get_task_timeout()
             if timeout:
                 print(f"Task timeout configured: {timeout} seconds")
             else:
                 print("Task timeout: disabled (tasks can run indefinitely)")
+            if concurrency > 1:
+                print(f"Concurrency: {concurrency} tasks")
+            print(
+                "Queues: "
+                + ", ".join(f"{name} (weight {weight:g})" for name, weight in queues.items())
+            )
 
+            backoff = IdleBackoff(get_min_poll_interval(), get_max_poll_interval())
+            listener = QueueListener.create()
+            if listener is not None:
+                print(f"Listening for new tasks on channel '{listener.channel}'")
+            if preload:
+                loaded = preload_tasks(get_allowed_tasks())
+                print(f"Preloaded {loaded} task(s)")
+            pool = self.create_pool(concurrency, timeout, options)
+            lease_interval = get_lease_duration() / 3
+            next_lease_renewal = time.monotonic() + lease_interval
+            orphan_check_interval = get_orphan_check_interval()
+            next_orphan_check = time.monotonic()
+            delay = 0
+            last_heartbeat = None
             while True:
-                time.sleep(sleep_interval)
-                print(
-                    f"{timezone.now()}: [RAM Usage: {log_memory_usage()} MB] Heartbeat.."
-                )
-                task_id = None
-                # Use pessimistic locking to claim a single queued task
-                with transaction.atomic():
-                    try:
-                        qs = Task.objects.select_for_update(skip_locked=True)
-                    except NotSupportedError:
-                        # Fallback for DBs without skip_locked support
-                        qs = Task.objects.select_for_update()
-
-                    queued_task = (
-                        qs.filter(status=Task.QUEUED).order_by("modified").first()
+                self.wait_for_pool(pool, delay, listener)
+                if listener is not None and listener.closed:
+                    listener = None
+                now = time.monotonic()
+                if last_heartbeat is None or now - last_heartbeat >= backoff.maximum:
+                    last_heartbeat = now
+                    print(
+                        f"{timezone.now()}: [RAM Usage: {log_memory_usage()} MB] Heartbeat.."
                     )
-                    if queued_task:
-                        queued_task.status = Task.PROGRESS  # claim the task
-                        queued_task.worker_pid = os.getpid()
-                        queued_task.save(
-                            update_fields=["status", "modified", "worker_pid"]
-                        )
-                        task_id = queued_task.id
-
-                if task_id:
-                    # since parent connections are copied to the child process
-                    # avoid corruption by closing all connections
-                    connections.close_all()
-
-                    # Create pipe for capturing child stdout/stderr/logging
-                    read_fd, write_fd = os.pipe()
-                    p = Process(target=execute_task, args=(task_id, write_fd))
-                    p.start()
-                    os.close(write_fd)  # Parent doesn't write
-
-                    log_chunks = []
-
-                    def drain():
-                        with os.fdopen(read_fd, "r", closefd=True) as f:
-                            while True:
-                                chunk = f.read(4096)
-                                if not chunk:
-                                    break
-                                log_chunks.append(chunk)
-
-                    reader = threading.Thread(target=drain, daemon=True)
-                    reader.start()
-
-                    # Wait for process with optional timeout
-                    p.join(timeout=timeout)
-
-                    timed_out = False
-                    if p.is_alive():
-                        # Process is still running after timeout - terminate it
-                        timed_out = True
-                        print(
-                            f"Task {task_id} timed out after {timeout}s, terminating..."
-                        )
-                        p.terminate()
-                        p.join(timeout=5)  # Give it 5 seconds to terminate gracefully
-
-                        if p.is_alive():
-                            # Still alive? Force kill
-                            print(f"Task {task_id} did not terminate, killing...")
-                            p.kill()
-                            p.join(timeout=2)
+                pool.reap()
 
-                    reader.join(timeout=5)
+                if now >= next_lease_renewal:
+                    # Tell other workers our tasks are still alive
+                    extend_leases(pool.running_task_ids() + list(buffer))
+                    next_lease_renewal = now + lease_interval
 
-                    # Store log + clear PID (parent-owned fields only)
-                    log_text = "".join(log_chunks)
-                    task = Task.objects.get(id=task_id)
-                    task.log = log_text if log_text else None
-                    task.worker_pid = None
-                    task.save(update_fields=["log", "worker_pid", "modified"])
+                if scheduler:
+                    run_due_periodic_tasks()
+                if enqueue_due_tasks():
+                    notify_workers()
+                claimed = self.fill_pool(pool, buffer, prefetch, queues)
 
-                    if timed_out:
-                        handle_task_timeout(task_id, timeout)
-                    else:
-                        handle_subprocess_exit(task_id, p.exitcode)
+                if claimed:
+                    backoff.reset()
+                if pool.free_slots():
+                    # The queue ran dry: back off before polling again.
+                    # A listening worker is woken up by NOTIFY, so it only
+                    # polls as a safety net.
+                    delay = backoff.next_delay() if listener is None else backoff.maximum
+                    # Wake up when the next scheduled task becomes due
+                    due = next_due_time()
+                    if due is not None:
+                        delay = max(0, min(delay, (due - timezone.now()).total_seconds()))
+                else:
+                    # All slots busy: a finishing child wakes us up early
+                    delay = backoff.maximum
+                if scheduler:
+                    # Wake up when the next periodic task must be enqueued
+                    next_run = next_periodic_run()
+                    if next_run is not None:
+                        delay = max(
+                            0, min(delay, (next_run - timezone.now()).total_seconds())
+                        )
+                if buffer or not pool.is_idle():
+                    # Wake up in time to renew the leases
+                    delay = max(0, min(delay, next_lease_renewal - time.monotonic()))
 
                 # Check for orphaned tasks before polling for new ones
-                detect_orphaned_tasks()
+                if now >= next_orphan_check:
+                    detect_orphaned_tasks()
+                    next_orphan_check = now + orphan_check_interval
 
         except KeyboardInterrupt:
             pass
+        finally:
+            if buffer:
+                release_tasks(list(buffer))
+            if pool is not None:
+                pool.shutdown()
+            if listener is not None:
+                listener.close()
+
+    @staticmethod
+    def create_pool(concurrency, timeout, options):
+        """Build the execution pool selected by ``--pool``."""
+        pool = options.get("pool")
+        if pool in ("prefork", "thread", "async"):
+            threads = options.get("threads", 10) if pool == "thread" else 1
+            async_tasks = options.get("async_tasks", 100) if pool == "async" else None
+            max_tasks = options.get("max_tasks_per_child") or get_max_tasks_per_child()
+            max_memory = (
+                options.get("max_memory_per_child") or get_max_memory_per_child()
+            )
+            per_child = f"{async_tasks} async tasks" if async_tasks else f"{threads} threads"
+            print(
+                f"{pool.capitalize()} pool: {concurrency} children x {per_child} "
+                f"(max tasks/child: {max_tasks}, max memory/child: {max_memory} MB)"
+            )
+            return PreforkPool(
+                concurrency, timeout, max_tasks, max_memory, threads, async_tasks
+            )
+        return ProcessPool(concurrency, timeout)
+
+    @staticmethod
+    def fill_pool(pool, buffer, prefetch=0, queues=None):
+        """
+        Hand queued tasks to every free slot of ``pool``.
+
+        Tasks are claimed in one batch per queue, enough for the free slots
+        plus up to ``prefetch`` extra tasks kept in ``buffer`` for the next
+        free slots. ``queues`` maps queue names to weights and defaults to
+        the default queue. A task whose child died before taking it goes
+        back to the front of ``buffer``, and the child is replaced.
+
+        Returns:
+            The number of tasks claimed from the database.
+        """
+        free = pool.free_slots()
+        claimed = 0
+        if free and len(buffer) < free:
+            task_ids = claim_from_queues(
+                free + prefetch - len(buffer), queues or {Task.DEFAULT_QUEUE: 1}
+            )
+            buffer.extend(task_ids)
+            claimed = len(task_ids)
+        while buffer and pool.free_slots():
+            task_id = buffer.popleft()
+            if not pool.submit(task_id):
+                # The child picked for it had died: replace it and try again
+                buffer.appendleft(task_id)
+                pool.reap()
+        return claimed
+
+    @staticmethod
+    def wait_for_pool(pool, interval, listener=None):
+        """
+        Sleep for up to ``interval`` seconds.
+
+        Returns early when a child finishes its task, dies or reaches its
+        timeout, so freed slots are refilled without waiting a full poll.
+        With a ``QueueListener``, a NOTIFY for a new task also wakes it up.
+        """
+        waitables = pool.waitables()
+        if listener is not None:
+            waitables.append(listener)
+        if not waitables:
+            time.sleep(interval)
+            return
+        deadline = pool.next_deadline()
+        if deadline is not None:
+            interval = max(0, min(interval, deadline - time.monotonic()))
+        ready = wait(waitables, timeout=interval)
+        if listener is not None and listener in ready:
+            listener.drain()
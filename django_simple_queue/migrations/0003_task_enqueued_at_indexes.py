@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-16 03:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_enqueued_at(apps, schema_editor):
+    # Existing rows were ordered by "modified"; keep that order
+    Task = apps.get_model('django_simple_queue', 'Task')
+    Task.objects.using(schema_editor.connection.alias).update(enqueued_at=models.F('modified'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0002_task_error_task_log_task_worker_pid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='enqueued_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Enqueued at'),
+        ),
+        migrations.RunPython(backfill_enqueued_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 0)), fields=['enqueued_at'], name='dsq_task_queued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 1), ('worker_pid__isnull', False)), fields=['worker_pid'], name='dsq_task_running_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-16 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0003_task_enqueued_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Lease expires at'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 1)), fields=['lease_expires_at'], name='dsq_task_lease_idx'),
+        ),
+    ]
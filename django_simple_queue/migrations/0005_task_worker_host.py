@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-16 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0004_task_lease_expires_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='task',
+            name='dsq_task_running_idx',
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='worker_boot_id',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='Worker boot ID'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='worker_host',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='Worker host'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 1), ('worker_pid__isnull', False)), fields=['worker_host', 'worker_pid'], name='dsq_task_host_running_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-16 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0005_task_worker_host'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='task',
+            name='dsq_task_queued_idx',
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='priority',
+            field=models.IntegerField(default=0, help_text='Lower values are claimed first.', verbose_name='Priority'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 0)), fields=['priority', 'enqueued_at'], name='dsq_task_queued_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-16 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0006_task_priority'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='task',
+            name='dsq_task_queued_idx',
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='queue',
+            field=models.CharField(default='default', max_length=63, verbose_name='Queue'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 0)), fields=['queue', 'priority', 'enqueued_at'], name='dsq_task_queued_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-16 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0007_task_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='run_after',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Run after'),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='status',
+            field=models.IntegerField(choices=[(0, 'Queued'), (1, 'In progress'), (2, 'Completed'), (3, 'Failed'), (4, 'Cancelled'), (5, 'Scheduled')], default=0, verbose_name='Status'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 5)), fields=['run_after'], name='dsq_task_scheduled_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-16 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0008_task_run_after'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodicTask',
+            fields=[
+                ('name', models.CharField(max_length=127, primary_key=True, serialize=False, verbose_name='Name')),
+                ('last_run_at', models.DateTimeField(blank=True, null=True, verbose_name='Last run at')),
+                ('next_run_at', models.DateTimeField(verbose_name='Next run at')),
+            ],
+            options={
+                'verbose_name': 'Periodic task',
+                'verbose_name_plural': 'Periodic tasks',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0009_periodictask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='Attempts'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='max_retries',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Max retries'),
+        ),
+    ]
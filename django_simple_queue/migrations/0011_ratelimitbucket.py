@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-16 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0010_task_retries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('task', models.CharField(max_length=127, primary_key=True, serialize=False, verbose_name='Task')),
+                ('tokens', models.FloatField(verbose_name='Tokens')),
+                ('updated_at', models.DateTimeField(verbose_name='Updated at')),
+            ],
+            options={
+                'verbose_name': 'Rate limit bucket',
+                'verbose_name_plural': 'Rate limit buckets',
+            },
+        ),
+    ]
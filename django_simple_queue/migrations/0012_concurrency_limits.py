@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-16 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0011_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConcurrencyLock',
+            fields=[
+                ('task', models.CharField(max_length=127, primary_key=True, serialize=False, verbose_name='Task')),
+            ],
+            options={
+                'verbose_name': 'Concurrency lock',
+                'verbose_name_plural': 'Concurrency locks',
+            },
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='concurrency_key',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='Concurrency key'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 1)), fields=['task', 'concurrency_key'], name='dsq_task_running_key_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-16 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0012_concurrency_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='dedupe_key',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='Deduplication key'),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', [0, 1, 5])), fields=('dedupe_key',), name='dsq_task_active_dedupe_uniq'),
+        ),
+    ]
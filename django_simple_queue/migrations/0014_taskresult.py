@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-16 04:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_results(apps, schema_editor):
+    Task = apps.get_model('django_simple_queue', 'Task')
+    TaskResult = apps.get_model('django_simple_queue', 'TaskResult')
+    alias = schema_editor.connection.alias
+    rows = (
+        Task.objects.using(alias)
+        .exclude(output=None, error=None, log=None)
+        .values_list('pk', 'output', 'error', 'log')
+        .iterator(chunk_size=1000)
+    )
+    batch = []
+    for pk, output, error, log in rows:
+        batch.append(TaskResult(task_id=pk, output=output, error=error, log=log))
+        if len(batch) == 1000:
+            TaskResult.objects.using(alias).bulk_create(batch)
+            batch = []
+    TaskResult.objects.using(alias).bulk_create(batch)
+
+
+def restore_results(apps, schema_editor):
+    Task = apps.get_model('django_simple_queue', 'Task')
+    TaskResult = apps.get_model('django_simple_queue', 'TaskResult')
+    alias = schema_editor.connection.alias
+    for result in TaskResult.objects.using(alias).iterator(chunk_size=1000):
+        Task.objects.using(alias).filter(pk=result.task_id).update(
+            output=result.output, error=result.error, log=result.log
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0013_task_dedupe_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskResult',
+            fields=[
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='result', serialize=False, to='django_simple_queue.task', verbose_name='Task')),
+                ('output', models.TextField(blank=True, null=True, verbose_name='Output')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Error')),
+                ('log', models.TextField(blank=True, null=True, verbose_name='Log')),
+            ],
+            options={
+                'verbose_name': 'Task result',
+                'verbose_name_plural': 'Task results',
+            },
+        ),
+        migrations.RunPython(copy_results, restore_results),
+        migrations.RemoveField(
+            model_name='task',
+            name='error',
+        ),
+        migrations.RemoveField(
+            model_name='task',
+            name='log',
+        ),
+        migrations.RemoveField(
+            model_name='task',
+            name='output',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-16 04:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_queue', '0014_taskresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskOutputChunk',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('text', models.TextField(verbose_name='Text')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='output_chunks', to='django_simple_queue.task', verbose_name='Task')),
+            ],
+            options={
+                'verbose_name': 'Task output chunk',
+                'verbose_name_plural': 'Task output chunks',
+            },
+        ),
+    ]
@@ -4,13 +4,17 @@ Task model for django-simple-queue.
 This module defines the Task model which represents a unit of work to be
 executed asynchronously by a worker process.
 """
+from __future__ import annotations
+
 from django.db import models
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 import uuid
-import importlib
 import json
 
+from django_simple_queue.loading import load_callable
+
 
 class Task(models.Model):
     """
@@ -23,13 +27,37 @@ class Task(models.Model):
         id: UUID primary key for the task.
         created: Timestamp when the task was created.
         modified: Timestamp when the task was last modified.
+        enqueued_at: Timestamp when the task was last (re-)queued; workers
+            claim queued tasks oldest first by this field.
+        priority: Tasks with a lower value are claimed first; tasks with the
+            same priority are claimed oldest first.
+        queue: Name of the queue the task belongs to; workers only claim
+            tasks from the queues they subscribe to.
+        run_after: For SCHEDULED tasks, the time from which the task may run;
+            workers then move it to QUEUED.
+        attempts: Number of times the task has been claimed by a worker.
+        concurrency_key: Value of the argument named by the task's
+            concurrency limit, if the limit is per key.
+        dedupe_key: Caller-chosen key; no two active (scheduled, queued or
+            running) tasks can share one.
+        max_retries: Overrides the ``max_retries`` of the task's retry policy;
+            None uses the policy from DJANGO_SIMPLE_QUEUE_RETRY_POLICIES.
         task: Dotted path to the callable (e.g., "myapp.tasks.send_email").
         args: JSON-serialized keyword arguments for the callable.
-        status: Current execution status (QUEUED, PROGRESS, COMPLETED, FAILED, CANCELLED).
-        output: Return value from the callable (stored as text).
+        status: Current execution status (QUEUED, PROGRESS, COMPLETED, FAILED,
+            CANCELLED, SCHEDULED).
+        output: Return value from the callable (stored as text); read from
+            the task's ``TaskResult``.
         worker_pid: Process ID of the worker handling this task.
-        error: Error message and traceback if the task failed.
-        log: Captured stdout/stderr/logging output from task execution.
+        worker_host: Hostname of the machine whose worker claimed the task.
+        worker_boot_id: Boot ID of that machine when the task was claimed;
+            tells a PID from before a reboot apart from a reused one.
+        lease_expires_at: While in PROGRESS, the time by which the worker must
+            renew its lease; past it, the task is considered orphaned.
+        error: Error message and traceback if the task failed; read from
+            the task's ``TaskResult``.
+        log: Captured stdout/stderr/logging output from task execution; read
+            from the task's ``TaskResult``.
 
     Example:
         Creating a task directly (prefer using ``create_task`` utility)::
@@ -48,13 +76,21 @@ class Task(models.Model):
     COMPLETED = 2
     FAILED = 3
     CANCELLED = 4
+    SCHEDULED = 5
+
+    PRIORITY_HIGH = -10
+    PRIORITY_NORMAL = 0
+    PRIORITY_LOW = 10
+
+    DEFAULT_QUEUE = "default"
 
     STATUS_CHOICES = (
         (QUEUED, _("Queued")),
         (PROGRESS, _("In progress")),
         (COMPLETED, _("Completed")),
         (FAILED, _("Failed")),
-        (CANCELLED, _("Cancelled"))
+        (CANCELLED, _("Cancelled")),
+        (SCHEDULED, _("Scheduled")),
     )
 
     id = models.UUIDField(_("ID"), primary_key=True, default=uuid.uuid4, editable=False)
@@ -63,10 +99,18 @@ class Task(models.Model):
     task = models.CharField(_("Task"), max_length=127, help_text="Name of the function to be called.")
     args = models.TextField(_("Arguments"), null=True, blank=True, help_text="Arguments in JSON format")
     status = models.IntegerField(_("Status"), default=QUEUED, choices=STATUS_CHOICES)
-    output = models.TextField(_("Output"), null=True, blank=True)
     worker_pid = models.IntegerField(_("Worker PID"), null=True, blank=True)
-    error = models.TextField(_("Error"), null=True, blank=True)
-    log = models.TextField(_("Log"), null=True, blank=True)
+    worker_host = models.CharField(_("Worker host"), max_length=255, null=True, blank=True)
+    worker_boot_id = models.CharField(_("Worker boot ID"), max_length=64, null=True, blank=True)
+    enqueued_at = models.DateTimeField(_("Enqueued at"), default=timezone.now)
+    priority = models.IntegerField(_("Priority"), default=PRIORITY_NORMAL, help_text="Lower values are claimed first.")
+    queue = models.CharField(_("Queue"), max_length=63, default=DEFAULT_QUEUE)
+    run_after = models.DateTimeField(_("Run after"), null=True, blank=True)
+    attempts = models.PositiveIntegerField(_("Attempts"), default=0)
+    max_retries = models.PositiveIntegerField(_("Max retries"), null=True, blank=True)
+    concurrency_key = models.CharField(_("Concurrency key"), max_length=255, null=True, blank=True)
+    dedupe_key = models.CharField(_("Deduplication key"), max_length=255, null=True, blank=True)
+    lease_expires_at = models.DateTimeField(_("Lease expires at"), null=True, blank=True)
 
     def __str__(self):
         return str(self.id)
@@ -74,6 +118,79 @@ class Task(models.Model):
     class Meta:
         verbose_name = _("Task")
         verbose_name_plural = _("Tasks")
+        indexes = [
+            # Serves the claim query: a queue's rows by priority, oldest first
+            models.Index(
+                fields=["queue", "priority", "enqueued_at"],
+                condition=models.Q(status=0),
+                name="dsq_task_queued_idx",
+            ),
+            # Serves detect_orphaned_tasks(): running rows claimed on a host
+            models.Index(
+                fields=["worker_host", "worker_pid"],
+                condition=models.Q(status=1, worker_pid__isnull=False),
+                name="dsq_task_host_running_idx",
+            ),
+            # Serves enqueue_due_tasks(): scheduled rows by due time
+            models.Index(
+                fields=["run_after"],
+                condition=models.Q(status=5),
+                name="dsq_task_scheduled_idx",
+            ),
+            # Serves the concurrency limits: running rows per task and key
+            models.Index(
+                fields=["task", "concurrency_key"],
+                condition=models.Q(status=1),
+                name="dsq_task_running_key_idx",
+            ),
+            # Serves the lease sweep: running rows by lease expiry
+            models.Index(
+                fields=["lease_expires_at"],
+                condition=models.Q(status=1),
+                name="dsq_task_lease_idx",
+            ),
+        ]
+        constraints = [
+            # Serves create_task(dedupe_key=...): rejects a duplicate of an
+            # active task at insert time
+            models.UniqueConstraint(
+                fields=["dedupe_key"],
+                condition=models.Q(status__in=[0, 1, 5]),
+                name="dsq_task_active_dedupe_uniq",
+            ),
+        ]
+
+    def _result_field(self, name: str) -> str | None:
+        """Value of a ``TaskResult`` field, or None if nothing was stored yet."""
+        try:
+            return getattr(self.result, name)
+        except TaskResult.DoesNotExist:
+            return None
+
+    @property
+    def output(self) -> str | None:
+        """
+        Return value of the callable, from the task's ``TaskResult``.
+
+        A running generator task keeps its ``TaskResult.output`` empty and
+        saves what it yields as ``TaskOutputChunk`` rows; those are read
+        instead until it finishes.
+        """
+        output = self._result_field("output")
+        if self.status == Task.PROGRESS and not output:
+            chunks = self.output_chunks.order_by("pk").values_list("text", flat=True)
+            output = "".join(chunks) or output
+        return output
+
+    @property
+    def error(self) -> str | None:
+        """Error message and traceback, from the task's ``TaskResult``."""
+        return self._result_field("error")
+
+    @property
+    def log(self) -> str | None:
+        """Captured stdout/stderr/logging, from the task's ``TaskResult``."""
+        return self._result_field("log")
 
     @property
     def as_dict(self) -> dict:
@@ -89,11 +206,19 @@ class Task(models.Model):
             "id": str(self.id),
             "created": str(self.created),
             "modified": str(self.modified),
+            "enqueued_at": str(self.enqueued_at),
+            "priority": self.priority,
+            "queue": self.queue,
+            "run_after": str(self.run_after) if self.run_after else None,
+            "attempts": self.attempts,
+            "dedupe_key": self.dedupe_key,
             "task": self.task,
             "args": self.args,
             "status": self.get_status_display(),
             "output": self.output,
             "worker_pid": self.worker_pid,
+            "worker_host": self.worker_host,
+            "lease_expires_at": str(self.lease_expires_at) if self.lease_expires_at else None,
             "error": self.error,
             "log": self.log,
         }
@@ -114,9 +239,7 @@ class Task(models.Model):
             AttributeError: If the function doesn't exist in the module.
             TypeError: If the resolved object is not callable.
         """
-        path = task.split('.')
-        module = importlib.import_module('.'.join(path[:-1]))
-        func = getattr(module, path[-1])
+        func = load_callable(task)
         if callable(func) is False:
             raise TypeError("'{}' is not callable".format(task))
         return func
@@ -165,3 +288,138 @@ class Task(models.Model):
                     params={'error': str(e)}
                 )
             })
+
+
+class TaskResult(models.Model):
+    """
+    Output, error and log of a task.
+
+    Kept out of the ``Task`` row so the rows the worker claims, locks and
+    scans stay narrow however much a task prints or returns. Created the
+    first time a task stores one of these fields; read through
+    ``Task.output``, ``Task.error`` and ``Task.log``.
+
+    Attributes:
+        task: The task, also this row's primary key.
+        output: Return value from the callable (stored as text).
+        error: Error message and traceback if the task failed.
+        log: Captured stdout/stderr/logging output from task execution.
+    """
+
+    task = models.OneToOneField(
+        Task, on_delete=models.CASCADE, primary_key=True, related_name="result",
+        verbose_name=_("Task"),
+    )
+    output = models.TextField(_("Output"), null=True, blank=True)
+    error = models.TextField(_("Error"), null=True, blank=True)
+    log = models.TextField(_("Log"), null=True, blank=True)
+
+    def __str__(self):
+        return str(self.task_id)
+
+    class Meta:
+        verbose_name = _("Task result")
+        verbose_name_plural = _("Task results")
+
+
+class TaskOutputChunk(models.Model):
+    """
+    Output yielded by a running generator task.
+
+    The worker buffers what a generator yields and inserts it as one row
+    per flush, instead of rewriting the whole output on every yield. Once
+    the run ends the chunks are joined into ``TaskResult.output`` and
+    deleted.
+
+    Attributes:
+        task: The task that yielded the output.
+        text: Values yielded since the previous chunk, concatenated.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    task = models.ForeignKey(
+        Task, on_delete=models.CASCADE, related_name="output_chunks",
+        verbose_name=_("Task"),
+    )
+    text = models.TextField(_("Text"))
+
+    def __str__(self):
+        return f"{self.task_id} #{self.pk}"
+
+    class Meta:
+        verbose_name = _("Task output chunk")
+        verbose_name_plural = _("Task output chunks")
+
+
+class PeriodicTask(models.Model):
+    """
+    Scheduling state of one entry of ``DJANGO_SIMPLE_QUEUE_PERIODIC_TASKS``.
+
+    The schedules themselves live in settings; this table only records when
+    each one runs next, so the scheduler can be restarted, or run on several
+    hosts, without skipping or duplicating runs.
+
+    Attributes:
+        name: Key of the entry in ``DJANGO_SIMPLE_QUEUE_PERIODIC_TASKS``.
+        last_run_at: When a task was last enqueued for this schedule.
+        next_run_at: When the next task is due.
+    """
+
+    name = models.CharField(_("Name"), max_length=127, primary_key=True)
+    last_run_at = models.DateTimeField(_("Last run at"), null=True, blank=True)
+    next_run_at = models.DateTimeField(_("Next run at"))
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = _("Periodic task")
+        verbose_name_plural = _("Periodic tasks")
+
+
+class RateLimitBucket(models.Model):
+    """
+    Token bucket of one entry of ``DJANGO_SIMPLE_QUEUE_RATE_LIMITS``.
+
+    Shared by all workers: a worker takes one token per task of that path it
+    claims, in the same transaction as the claim.
+
+    Attributes:
+        task: Dotted path of the rate-limited callable.
+        tokens: Tokens left at ``updated_at``.
+        updated_at: When ``tokens`` was last computed; the bucket refills
+            continuously from that time.
+    """
+
+    task = models.CharField(_("Task"), max_length=127, primary_key=True)
+    tokens = models.FloatField(_("Tokens"))
+    updated_at = models.DateTimeField(_("Updated at"))
+
+    def __str__(self):
+        return self.task
+
+    class Meta:
+        verbose_name = _("Rate limit bucket")
+        verbose_name_plural = _("Rate limit buckets")
+
+
+class ConcurrencyLock(models.Model):
+    """
+    Lock row of one entry of ``DJANGO_SIMPLE_QUEUE_CONCURRENCY_LIMITS``.
+
+    A worker that claims tasks of a concurrency-limited path locks this row
+    while it counts the path's running tasks, so two workers never both
+    take the last free slot.
+
+    Attributes:
+        task: Dotted path of the concurrency-limited callable.
+    """
+
+    task = models.CharField(_("Task"), max_length=127, primary_key=True)
+
+    def __str__(self):
+        return self.task
+
+    class Meta:
+        verbose_name = _("Concurrency lock")
+        verbose_name_plural = _("Concurrency locks")
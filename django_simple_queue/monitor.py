@@ -7,22 +7,56 @@ subprocess failures.
 """
 from __future__ import annotations
 
+import functools
+import itertools
 import os
+import socket
 import uuid
 
+import psutil
 from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
 
 from django_simple_queue import signals
 from django_simple_queue.models import Task
+from django_simple_queue.results import append_error, collect_output
+from django_simple_queue.retry import schedule_retry
+
+
+@functools.lru_cache(maxsize=None)
+def host_identity() -> tuple[str, str]:
+    """
+    Hostname and boot ID of this machine, as recorded on claimed tasks.
+
+    The boot ID changes on every reboot, so a task claimed before a reboot is
+    never mistaken for one running under a reused PID. It is read from
+    ``/proc/sys/kernel/random/boot_id`` on Linux and derived from the boot
+    time elsewhere.
+    """
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            boot_id = f.read().strip()
+    except OSError:
+        boot_id = str(int(psutil.boot_time()))
+    return socket.gethostname(), boot_id
 
 
 def detect_orphaned_tasks() -> None:
     """
     Detect and mark orphaned tasks as failed.
 
-    Scans all tasks with status PROGRESS and checks if their worker process
-    (identified by worker_pid) is still running. If the process is dead,
-    marks the task as FAILED and fires the on_failure signal.
+    A task is orphaned when its worker stopped renewing its lease: running
+    tasks whose ``lease_expires_at`` has passed are marked FAILED and the
+    on_failure signal is fired. This works across hosts, since it only
+    compares timestamps in the database.
+
+    Running tasks claimed on this host are also checked by PID, which
+    catches a crashed worker straight away instead of once its lease runs
+    out. Tasks claimed on other hosts are never checked by PID, and a task
+    claimed before this host rebooted is failed without looking at its PID.
+    Tasks without a host or a lease (claimed before either existed) are
+    checked by PID as well.
 
     This function is called periodically by the task_worker command to clean
     up tasks whose workers crashed unexpectedly.
@@ -32,27 +66,91 @@ def detect_orphaned_tasks() -> None:
         If the PID exists but belongs to a different user (PermissionError),
         the worker is assumed to still be alive.
     """
+    fail_expired_leases()
+    hostname, boot_id = host_identity()
     with transaction.atomic():
-        in_progress = Task.objects.select_for_update(skip_locked=True).filter(
-            status=Task.PROGRESS, worker_pid__isnull=False
-        )
-        for task in in_progress:
+        for task in itertools.chain(*pid_checked_tasks(hostname)):
+            if task.worker_host is None and task.lease_expires_at is not None:
+                continue  # Leased elsewhere; left to the lease sweep
             try:
+                if task.worker_boot_id and task.worker_boot_id != boot_id:
+                    raise ProcessLookupError  # Host rebooted since the claim
                 os.kill(task.worker_pid, 0)
             except ProcessLookupError:
-                task.error = (task.error or "") + (
-                    f"\nTask failed: worker process (PID {task.worker_pid}) no longer running"
+                append_error(
+                    [task.pk],
+                    f"\nTask failed: worker process (PID {task.worker_pid}) no longer running",
                 )
+                collect_output([task.pk])
                 task.status = Task.FAILED
                 task.worker_pid = None
+                task.lease_expires_at = None
                 task.save(
-                    update_fields=["status", "error", "worker_pid", "modified"]
+                    update_fields=["status", "worker_pid", "lease_expires_at", "modified"]
                 )
                 signals.on_failure.send(sender=Task, task=task, error=None)
             except PermissionError:
                 pass  # PID exists, different user — worker is alive
 
 
+def pid_checked_tasks(hostname: str) -> tuple[QuerySet, QuerySet]:
+    """
+    Running tasks that ``detect_orphaned_tasks`` checks by PID.
+
+    Returns two locked querysets, both served by ``dsq_task_host_running_idx``:
+    the tasks claimed on ``hostname`` and the tasks claimed before hosts were
+    recorded. They are kept apart because an OR of the two stops the planner
+    from using the index. Of the latter, only those without a lease are
+    checked; filtering on the lease in SQL would also steer the planner to
+    ``dsq_task_lease_idx``.
+    """
+    running = Task.objects.select_for_update(skip_locked=True).filter(
+        status=Task.PROGRESS, worker_pid__isnull=False
+    )
+    return (
+        running.filter(worker_host=hostname),
+        running.filter(worker_host__isnull=True),
+    )
+
+
+def fail_expired_leases() -> int:
+    """
+    Mark running tasks whose lease has expired as failed.
+
+    The expired rows are found with one query on the ``dsq_task_lease_idx``
+    partial index and failed with one bulk update; on_failure is then fired
+    for each of them.
+
+    Returns:
+        The number of tasks marked as failed.
+    """
+    now = timezone.now()
+    message = "\nTask failed: worker stopped renewing its lease"
+    with transaction.atomic():
+        expired = list(
+            Task.objects.select_for_update(skip_locked=True).filter(
+                status=Task.PROGRESS, lease_expires_at__lt=now
+            )
+        )
+        if not expired:
+            return 0
+        task_ids = [task.pk for task in expired]
+        Task.objects.filter(pk__in=task_ids).update(
+            status=Task.FAILED,
+            worker_pid=None,
+            lease_expires_at=None,
+            modified=now,
+        )
+        append_error(task_ids, message)
+        collect_output(task_ids)
+    for task in expired:
+        task.status = Task.FAILED
+        task.worker_pid = None
+        task.lease_expires_at = None
+        signals.on_failure.send(sender=Task, task=task, error=None)
+    return len(expired)
+
+
 def handle_subprocess_exit(task_id: uuid.UUID, exit_code: int | None) -> None:
     """
     Handle a task subprocess that exited with a non-zero code.
@@ -68,10 +166,12 @@ def handle_subprocess_exit(task_id: uuid.UUID, exit_code: int | None) -> None:
         return
     task = Task.objects.get(id=task_id)
     if task.status == Task.PROGRESS:
-        task.error = (task.error or "") + f"\nWorker subprocess exited with code {exit_code}"
+        append_error([task_id], f"\nWorker subprocess exited with code {exit_code}")
+        collect_output([task_id])
         task.status = Task.FAILED
         task.worker_pid = None
-        task.save(update_fields=["status", "error", "worker_pid", "modified"])
+        task.lease_expires_at = None
+        task.save(update_fields=["status", "worker_pid", "lease_expires_at", "modified"])
         signals.on_failure.send(sender=Task, task=task, error=None)
 
 
@@ -81,7 +181,8 @@ def handle_task_timeout(task_id: uuid.UUID, timeout_seconds: int) -> None:
 
     Called by the task_worker when a subprocess doesn't complete within the
     configured timeout. Marks the task as FAILED and fires the on_failure
-    signal with a TimeoutError.
+    signal with a TimeoutError, unless the task's retry policy retries
+    TimeoutError: then the task is scheduled to run again and on_retry fires.
 
     Args:
         task_id: UUID of the task that timed out.
@@ -89,12 +190,19 @@ def handle_task_timeout(task_id: uuid.UUID, timeout_seconds: int) -> None:
     """
     task = Task.objects.get(id=task_id)
     if task.status == Task.PROGRESS:
-        task.error = (task.error or "") + (
-            f"\nTask timed out after {timeout_seconds} seconds"
-        )
-        task.status = Task.FAILED
+        append_error([task_id], f"\nTask timed out after {timeout_seconds} seconds")
+        collect_output([task_id])
+        error = TimeoutError(f"Task exceeded {timeout_seconds}s timeout")
         task.worker_pid = None
-        task.save(update_fields=["status", "error", "worker_pid", "modified"])
-        signals.on_failure.send(sender=Task, task=task, error=TimeoutError(
-            f"Task exceeded {timeout_seconds}s timeout"
-        ))
+        task.lease_expires_at = None
+        if schedule_retry(task, error):
+            task.save(
+                update_fields=[
+                    "status", "run_after", "worker_pid", "lease_expires_at", "modified"
+                ]
+            )
+            signals.on_retry.send(sender=Task, task=task, error=error)
+        else:
+            task.status = Task.FAILED
+            task.save(update_fields=["status", "worker_pid", "lease_expires_at", "modified"])
+            signals.on_failure.send(sender=Task, task=task, error=error)
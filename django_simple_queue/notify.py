@@ -0,0 +1,122 @@
+"""
+PostgreSQL LISTEN/NOTIFY wakeups for idle workers.
+
+On PostgreSQL, enqueueing a task sends a ``NOTIFY`` on a queue channel and
+idle ``task_worker`` processes block on ``LISTEN`` instead of sleeping, so a
+new task is picked up within milliseconds. On every other backend these
+helpers are no-ops and workers fall back to polling.
+"""
+from __future__ import annotations
+
+import logging
+
+from django.db import DatabaseError, connections, router
+
+from django_simple_queue.conf import get_notify_channel
+from django_simple_queue.models import Task
+
+logger = logging.getLogger(__name__)
+
+
+def notify_workers(using: str | None = None) -> None:
+    """
+    Wake up workers listening for new tasks.
+
+    Sends ``NOTIFY`` on the configured channel. When called inside a
+    transaction, PostgreSQL delivers the notification only once the
+    transaction commits, so workers never wake up for rows they cannot see.
+
+    Args:
+        using: Database alias; defaults to the alias Task rows are written to.
+    """
+    channel = get_notify_channel()
+    if channel is None:
+        return
+    connection = connections[using or router.db_for_write(Task)]
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, '')", [channel])
+
+
+class QueueListener:
+    """
+    Dedicated PostgreSQL connection that LISTENs for new-task notifications.
+
+    The connection is kept outside ``django.db.connections`` so the worker's
+    ``connections.close_all()`` before forking does not drop the LISTEN.
+    Pass the listener to ``multiprocessing.connection.wait`` (it has a
+    ``fileno()``) and call ``drain()`` once it becomes readable.
+
+    Use ``QueueListener.create()`` rather than instantiating directly.
+    """
+
+    def __init__(self, connection, channel: str):
+        self.connection = connection
+        self.channel = channel
+        self.closed = False
+        self.connection.ensure_connection()
+        self.connection.set_autocommit(True)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.connection.ops.quote_name(channel)}")
+
+    @classmethod
+    def create(cls) -> QueueListener | None:
+        """
+        Start listening on the Task database, if it is PostgreSQL.
+
+        Returns:
+            A listener, or None if notifications are disabled or unsupported.
+        """
+        channel = get_notify_channel()
+        if channel is None:
+            return None
+        connection = connections[router.db_for_write(Task)]
+        if connection.vendor != "postgresql":
+            return None
+        try:
+            return cls(connection.copy(), channel)
+        except DatabaseError as e:
+            logger.warning("Could not LISTEN for new tasks, polling instead: %s", e)
+            return None
+
+    def fileno(self) -> int:
+        """File descriptor of the underlying socket."""
+        return self.connection.connection.fileno()
+
+    def drain(self) -> int:
+        """
+        Consume pending notifications.
+
+        If the connection has been lost, the listener closes itself (see
+        ``closed``) so the worker can fall back to polling.
+
+        Returns:
+            The number of notifications received.
+        """
+        raw = self.connection.connection
+        try:
+            with self.connection.wrap_database_errors:
+                if hasattr(raw, "poll"):
+                    # psycopg2
+                    raw.poll()
+                    count = len(raw.notifies)
+                    raw.notifies.clear()
+                    return count
+                # psycopg 3
+                try:
+                    return sum(1 for _ in raw.notifies(timeout=0))
+                except TypeError:
+                    # psycopg < 3.2: running any statement consumes the notifications
+                    with self.connection.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    return 1
+        except DatabaseError as e:
+            logger.warning("Lost LISTEN connection, polling instead: %s", e)
+            self.close()
+            return 0
+
+    def close(self) -> None:
+        """Close the dedicated connection."""
+        self.closed = True
+        self.connection.close()
@@ -0,0 +1,588 @@
+"""
+Execution pools used by the task_worker command.
+
+A pool owns the child processes that execute claimed tasks. Two flavours
+share the same interface:
+
+- ``ProcessPool`` forks a brand new child for every task (the default).
+- ``PreforkPool`` keeps long-lived children around and sends them task IDs
+  over a pipe, so the fork, DB connect and teardown cost is paid once per
+  child instead of once per task. Each child can run several tasks at once
+  on a thread pool, or many coroutine tasks on a single event loop.
+
+Either way the parent keeps per-task log capture, timeout enforcement and
+``handle_subprocess_exit`` semantics.
+"""
+from __future__ import annotations
+
+import codecs
+import os
+import select
+import tempfile
+import threading
+import time
+import uuid
+from multiprocessing import Pipe, Process
+from multiprocessing.reduction import send_handle
+
+import psutil
+from django.db import connections
+
+from django_simple_queue.conf import (
+    get_log_flush_interval,
+    get_log_flush_size,
+    get_max_log_size,
+)
+from django_simple_queue.monitor import handle_subprocess_exit, handle_task_timeout
+from django_simple_queue.results import append_log, save_result
+from django_simple_queue.worker import execute_task, run_async_child, run_child
+
+
+class LogCapture:
+    """
+    Collects everything a child process writes to its log pipe.
+
+    The write end of the pipe is handed to the child; the parent drains the
+    read end on a daemon thread so a chatty task can never block on a full
+    pipe buffer. The output is spooled to a temporary file rather than kept
+    in memory, and saved to the task's log whenever ``flush_size`` bytes
+    are waiting or ``flush_interval`` seconds have passed, so the log of a
+    running task can be read while it runs.
+
+    A log longer than ``max_size`` bytes is cut down to its first and last
+    ``max_size / 2`` bytes. The spool file is compacted as it grows, so it
+    never holds much more than that either.
+
+    Args:
+        task_id: UUID of the task the log belongs to.
+        max_size: Bytes of log kept (default:
+            ``DJANGO_SIMPLE_QUEUE_MAX_LOG_SIZE``).
+        flush_size: Bytes to save at once (default:
+            ``DJANGO_SIMPLE_QUEUE_LOG_FLUSH_SIZE``).
+        flush_interval: Seconds new output may wait before it is saved
+            (default: ``DJANGO_SIMPLE_QUEUE_LOG_FLUSH_INTERVAL``).
+    """
+
+    def __init__(
+        self,
+        task_id: uuid.UUID,
+        max_size: int | None = None,
+        flush_size: int | None = None,
+        flush_interval: float | None = None,
+    ):
+        self.task_id = task_id
+        self.max_size = get_max_log_size() if max_size is None else max_size
+        self.flush_size = get_log_flush_size() if flush_size is None else flush_size
+        self.flush_interval = (
+            get_log_flush_interval() if flush_interval is None else flush_interval
+        )
+        self.read_fd, self.write_fd = os.pipe()
+        self._spool = tempfile.TemporaryFile()
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._lock = threading.Lock()
+        self._written = 0  # Bytes read from the pipe
+        self._unsaved = 0  # Bytes read since the last save
+        self._appended = 0  # Spool offset saved so far, until the log is cut
+        self._saved = False
+        self._finished = False
+        self._last_flush = time.monotonic()
+        self._reader: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Close the parent's copy of the write end and start draining."""
+        os.close(self.write_fd)
+        self._reader = threading.Thread(target=self._drain, daemon=True)
+        self._reader.start()
+
+    @property
+    def _cut(self) -> bool:
+        return self._written > self.max_size
+
+    def _drain(self) -> None:
+        try:
+            while True:
+                wait = None
+                if self._unsaved:
+                    wait = max(self._last_flush + self.flush_interval - time.monotonic(), 0)
+                ready, _, _ = select.select([self.read_fd], [], [], wait)
+                if ready:
+                    chunk = os.read(self.read_fd, 65536)
+                    if not chunk or not self._write(chunk):
+                        break
+                if self._unsaved and (
+                    self._unsaved >= self.flush_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval
+                ):
+                    try:
+                        self.flush()
+                    except Exception as e:
+                        print(f"Could not save the log of task {self.task_id}: {e}")
+                    finally:
+                        # Hold no connection between saves: the worker forks
+                        # children while this thread is running
+                        connections.close_all()
+        finally:
+            os.close(self.read_fd)
+
+    def _write(self, chunk: bytes) -> bool:
+        """Spool ``chunk``. Returns False once the capture has finished."""
+        with self._lock:
+            if self._finished:
+                return False
+            self._spool.seek(0, os.SEEK_END)
+            self._spool.write(chunk)
+            self._written += len(chunk)
+            self._unsaved += len(chunk)
+            if self._cut and self._spool.tell() > self.max_size * 2:
+                # Keep the head, move the latest tail right after it
+                head = self.max_size // 2
+                self._spool.seek(-(self.max_size - head), os.SEEK_END)
+                tail = self._spool.read()
+                self._spool.seek(head)
+                self._spool.write(tail)
+                self._spool.truncate()
+            return True
+
+    def _window(self) -> str:
+        """First and last ``max_size / 2`` bytes of a log that was cut."""
+        head = self.max_size // 2
+        tail = self.max_size - head
+        self._spool.seek(0)
+        start = self._spool.read(head).decode("utf-8", errors="ignore")
+        self._spool.seek(-tail, os.SEEK_END)
+        end = self._spool.read().decode("utf-8", errors="ignore")
+        omitted = self._written - head - tail
+        return f"{start}\n[... {omitted} bytes omitted ...]\n{end}"
+
+    def flush(self, final: bool = False) -> None:
+        """
+        Save the output spooled since the last flush to the task's log.
+
+        The first save of a run replaces the log left by any earlier run;
+        later ones append to it, until the log is cut and the whole window
+        is rewritten instead.
+
+        Args:
+            final: Whether no more output will follow.
+        """
+        with self._lock:
+            if self._spool.closed:
+                return
+            self._last_flush = time.monotonic()
+            if self._cut:
+                save_result(self.task_id, log=self._window())
+            else:
+                state = self._decoder.getstate()
+                self._spool.seek(self._appended)
+                text = self._decoder.decode(self._spool.read(), final)
+                try:
+                    if not self._saved:
+                        save_result(self.task_id, log=text or None)
+                    elif text:
+                        append_log(self.task_id, text)
+                except Exception:
+                    self._decoder.setstate(state)
+                    raise
+                self._appended = self._written
+            self._saved = True
+            self._unsaved = 0
+
+    def discard(self) -> None:
+        """Close the pipe and spool of a capture that was never started."""
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+        self._spool.close()
+
+    def finish(self, timeout: float = 5) -> None:
+        """
+        Wait for the reader to hit EOF and save the rest of the log.
+
+        Args:
+            timeout: Seconds to wait for the reader thread; output written
+                after that is dropped.
+        """
+        if self._reader is not None:
+            self._reader.join(timeout=timeout)
+        with self._lock:
+            self._finished = True
+        try:
+            if self._unsaved or not self._saved:
+                self.flush(final=True)
+        finally:
+            self._spool.close()
+
+
+class RunningTask:
+    """
+    Parent-side bookkeeping for a task handed to a child process.
+
+    Args:
+        task_id: UUID of the claimed task.
+        timeout: Maximum execution time in seconds, or None for no limit.
+    """
+
+    def __init__(self, task_id: uuid.UUID, timeout: int | None):
+        self.task_id = task_id
+        self.timeout = timeout
+        self.capture = LogCapture(task_id)
+        self.started_at = time.monotonic()
+
+    @property
+    def deadline(self) -> float | None:
+        """Monotonic time after which the task is considered timed out."""
+        if self.timeout is None:
+            return None
+        return self.started_at + self.timeout
+
+    def is_expired(self, now: float) -> bool:
+        """Return True if the task has run past its deadline."""
+        return self.deadline is not None and now >= self.deadline
+
+    def settle(self, exit_code: int | None = None, timed_out: bool = False) -> None:
+        """
+        Persist the captured log and settle the task's final state.
+
+        Args:
+            exit_code: Exit code of the child that ran the task, if it exited.
+            timed_out: Whether the child was terminated for exceeding its timeout.
+        """
+        # Store the rest of the log. The child cleared the PID and lease when
+        # the run ended; the handlers below do it if the run never ended.
+        self.capture.finish()
+
+        if timed_out:
+            handle_task_timeout(self.task_id, self.timeout)
+        else:
+            handle_subprocess_exit(self.task_id, exit_code)
+
+
+def stop_process(process: Process) -> None:
+    """Stop a child: SIGTERM first, SIGKILL if it does not exit."""
+    process.terminate()
+    process.join(timeout=5)  # Give it 5 seconds to terminate gracefully
+
+    if process.is_alive():
+        # Still alive? Force kill
+        print(f"Child process {process.pid} did not terminate, killing...")
+        process.kill()
+        process.join(timeout=2)
+
+
+class ProcessPool:
+    """
+    Runs every task in a freshly forked child process.
+
+    Args:
+        size: Maximum number of tasks running at the same time.
+        timeout: Per-task timeout in seconds, or None for no limit.
+    """
+
+    def __init__(self, size: int, timeout: int | None):
+        self.size = size
+        self.timeout = timeout
+        self.running: list[tuple[Process, RunningTask]] = []
+
+    def free_slots(self) -> int:
+        """Number of tasks that can be submitted right now."""
+        return self.size - len(self.running)
+
+    def is_idle(self) -> bool:
+        """Return True when no task is running."""
+        return not self.running
+
+    def running_task_ids(self) -> list[uuid.UUID]:
+        """IDs of the tasks currently running."""
+        return [running.task_id for _, running in self.running]
+
+    def submit(self, task_id: uuid.UUID) -> bool:
+        """
+        Fork a child that executes ``task_id``.
+
+        Returns:
+            True, as a freshly forked child always takes the task.
+        """
+        running = RunningTask(task_id, self.timeout)
+        process = Process(target=execute_task, args=(task_id, running.capture.write_fd))
+        # since parent connections are copied to the child process
+        # avoid corruption by closing all connections
+        connections.close_all()
+        process.start()
+        running.capture.start()
+        self.running.append((process, running))
+        return True
+
+    def waitables(self) -> list:
+        """Objects that become ready when a child needs attention."""
+        return [process.sentinel for process, _ in self.running]
+
+    def next_deadline(self) -> float | None:
+        """Earliest deadline among running tasks, if any."""
+        deadlines = [r.deadline for _, r in self.running if r.deadline is not None]
+        return min(deadlines, default=None)
+
+    def reap(self) -> None:
+        """Settle every finished or timed-out task."""
+        now = time.monotonic()
+        still_running = []
+        for process, running in self.running:
+            if process.exitcode is not None:
+                running.settle(exit_code=process.exitcode)
+            elif running.is_expired(now):
+                print(
+                    f"Task {running.task_id} timed out after {running.timeout}s, terminating..."
+                )
+                stop_process(process)
+                running.settle(timed_out=True)
+            else:
+                still_running.append((process, running))
+        self.running = still_running
+
+    def shutdown(self) -> None:
+        """Nothing to do: children exit on their own once their task ends."""
+
+
+class PreforkChild:
+    """
+    Parent-side handle for one long-lived child process.
+
+    Args:
+        timeout: Per-task timeout in seconds, or None for no limit.
+        capacity: Number of tasks the child runs at the same time. Above 1,
+            the child runs tasks on a thread pool of that size.
+        asynchronous: Run tasks as coroutines on a single event loop in the
+            child instead of on threads.
+    """
+
+    def __init__(
+        self, timeout: int | None, capacity: int = 1, asynchronous: bool = False
+    ):
+        self.timeout = timeout
+        self.capacity = capacity
+        self.conn, child_conn = Pipe()
+        self.process = Process(
+            target=run_async_child if asynchronous else run_child,
+            args=(child_conn, capacity),
+            daemon=True,
+        )
+        connections.close_all()
+        self.process.start()
+        child_conn.close()
+        self.running: dict[uuid.UUID, RunningTask] = {}
+        self.tasks_run = 0
+        self.retiring = False
+
+    def free_slots(self) -> int:
+        """Number of tasks the child can accept right now."""
+        if self.retiring or not self.process.is_alive():
+            return 0
+        return self.capacity - len(self.running)
+
+    def assign(self, task_id: uuid.UUID) -> bool:
+        """
+        Send ``task_id`` and the write end of a fresh log pipe to the child.
+
+        Returns:
+            False if the child died before it could take the task. The child
+            is then stopped, so ``is_alive()`` reports it as dead.
+        """
+        running = RunningTask(task_id, self.timeout)
+        try:
+            self.conn.send(task_id)
+            send_handle(self.conn, running.capture.write_fd, self.process.pid)
+        except (EOFError, OSError):
+            running.capture.discard()
+            stop_process(self.process)
+            return False
+        self.running[task_id] = running
+        running.capture.start()
+        return True
+
+    def finished(self) -> list[tuple[RunningTask, int]]:
+        """
+        Collect the tasks the child reported as done.
+
+        Returns:
+            ``(task, exit_code)`` pairs; the exit code is non-zero when
+            ``execute_task`` itself raised in the child.
+        """
+        done = []
+        while self.running and self.conn.poll():
+            try:
+                task_id, exit_code = self.conn.recv()
+            except (EOFError, OSError):
+                break  # Child died; the caller checks is_alive()
+            running = self.running.pop(task_id, None)
+            if running is not None:
+                self.tasks_run += 1
+                done.append((running, exit_code))
+        return done
+
+    def memory_usage(self) -> float:
+        """Resident set size of the child in MB."""
+        try:
+            rss = psutil.Process(self.process.pid).memory_info().rss
+        except psutil.Error:
+            return 0.0
+        return rss / (1024 * 1024)
+
+    def stop(self) -> None:
+        """Ask the child to exit after its current tasks, then reap it."""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            stop_process(self.process)
+        self.conn.close()
+
+
+class PreforkPool:
+    """
+    Runs tasks in a fixed set of long-lived child processes.
+
+    Each child runs ``threads`` tasks at the same time: one by default, or
+    several on a thread pool for I/O-bound work, where a single process can
+    keep dozens of tasks waiting on the network for the memory cost of one.
+    With ``async_tasks``, each child instead runs up to that many tasks as
+    coroutines on one event loop, which scales to thousands of in-flight
+    ``async def`` tasks per process.
+
+    Children are replaced once they have run ``max_tasks_per_child`` tasks or
+    their resident memory grows past ``max_memory_per_child`` MB, which keeps
+    slow leaks in task code bounded. A child that crashes is replaced
+    straight away. A thread cannot be killed on its own, so when a task in
+    a multi-threaded (or async) child times out, the child stops accepting tasks and is
+    terminated once every task still running in it has finished or expired.
+
+    Args:
+        size: Number of child processes.
+        timeout: Per-task timeout in seconds, or None for no limit.
+        max_tasks_per_child: Recycle a child after this many tasks (None: never).
+        max_memory_per_child: Recycle a child above this RSS in MB (None: never).
+        threads: Number of tasks each child runs at the same time.
+        async_tasks: If set, each child runs up to this many tasks on an
+            event loop instead of using threads.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        timeout: int | None,
+        max_tasks_per_child: int | None = None,
+        max_memory_per_child: float | None = None,
+        threads: int = 1,
+        async_tasks: int | None = None,
+    ):
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self.max_memory_per_child = max_memory_per_child
+        self.threads = threads
+        self.async_tasks = async_tasks
+        self.children = [self._spawn() for _ in range(size)]
+
+    def _spawn(self) -> PreforkChild:
+        if self.async_tasks:
+            return PreforkChild(self.timeout, self.async_tasks, asynchronous=True)
+        return PreforkChild(self.timeout, self.threads)
+
+    def free_slots(self) -> int:
+        """Number of tasks that can be submitted right now."""
+        return sum(child.free_slots() for child in self.children)
+
+    def is_idle(self) -> bool:
+        """Return True when no task is running."""
+        return not any(child.running for child in self.children)
+
+    def running_task_ids(self) -> list[uuid.UUID]:
+        """IDs of the tasks currently running."""
+        return [task_id for child in self.children for task_id in child.running]
+
+    def submit(self, task_id: uuid.UUID) -> bool:
+        """
+        Hand ``task_id`` to the least busy child.
+
+        Returns:
+            False if that child had died and the task was not handed over;
+            ``reap()`` replaces the child.
+        """
+        child = max(self.children, key=lambda child: child.free_slots())
+        return child.assign(task_id)
+
+    def waitables(self) -> list:
+        """Objects that become ready when a child needs attention."""
+        ready = []
+        for child in self.children:
+            ready.append(child.process.sentinel)
+            if child.running:
+                ready.append(child.conn)
+        return ready
+
+    def next_deadline(self) -> float | None:
+        """Earliest upcoming deadline among running tasks, if any."""
+        now = time.monotonic()
+        deadlines = [
+            running.deadline
+            for child in self.children
+            for running in child.running.values()
+            if running.deadline is not None and running.deadline > now
+        ]
+        return min(deadlines, default=None)
+
+    def reap(self) -> None:
+        """Settle finished tasks and replace dead, expired or worn-out children."""
+        now = time.monotonic()
+        for index, child in enumerate(self.children):
+            if self._reap_child(child, now):
+                child.stop()
+                self.children[index] = self._spawn()
+
+    def _reap_child(self, child: PreforkChild, now: float) -> bool:
+        """Settle ``child``'s finished tasks. Returns True to replace the child."""
+        for running, exit_code in child.finished():
+            running.settle(exit_code=exit_code)
+            if self._worn_out(child):
+                child.retiring = True
+
+        if not child.process.is_alive():
+            running_tasks = list(child.running.values())
+            child.running.clear()
+            for running in running_tasks:
+                running.settle(exit_code=child.process.exitcode)
+            return True
+
+        expired = [r for r in child.running.values() if r.is_expired(now)]
+        if expired and len(expired) == len(child.running):
+            for running in expired:
+                print(
+                    f"Task {running.task_id} timed out after {running.timeout}s, terminating..."
+                )
+            child.running.clear()
+            stop_process(child.process)
+            for running in expired:
+                running.settle(timed_out=True)
+            return True
+        if expired and not child.retiring:
+            print(
+                f"Task {expired[0].task_id} timed out after {expired[0].timeout}s; "
+                f"terminating child {child.process.pid} once its other tasks finish..."
+            )
+            child.retiring = True
+
+        return child.retiring and not child.running
+
+    def _worn_out(self, child: PreforkChild) -> bool:
+        if (
+            self.max_tasks_per_child is not None
+            and child.tasks_run >= self.max_tasks_per_child
+        ):
+            return True
+        return (
+            self.max_memory_per_child is not None
+            and child.memory_usage() >= self.max_memory_per_child
+        )
+
+    def shutdown(self) -> None:
+        """Stop every child process."""
+        for child in self.children:
+            child.stop()
@@ -0,0 +1,90 @@
+"""
+Rate limits per task path.
+
+Each entry of ``DJANGO_SIMPLE_QUEUE_RATE_LIMITS`` has a token bucket in the
+``RateLimitBucket`` table, shared by every worker. ``claim_tasks`` leaves
+tasks whose bucket is empty in the queue, so they never hold up other work,
+and takes one token for each rate-limited task it claims.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+
+from django.core.exceptions import ImproperlyConfigured
+
+from django_simple_queue.conf import get_rate_limits
+from django_simple_queue.models import RateLimitBucket
+
+
+class Rate:
+    """
+    A rate such as ``"50/m"``: at most 50 tasks per minute.
+
+    The bucket holds up to ``capacity`` tokens and refills at
+    ``capacity`` per period.
+
+    Raises:
+        ValueError: If the rate is malformed.
+    """
+
+    PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+    def __init__(self, value: str):
+        count, _, period = str(value).partition("/")
+        if period not in self.PERIODS or not count.isdigit() or int(count) < 1:
+            raise ValueError(f"Invalid rate {value!r}, expected e.g. '50/m'")
+        self.capacity = int(count)
+        self.per_second = self.capacity / self.PERIODS[period]
+
+    def refill(self, tokens: float, since: datetime, now: datetime) -> float:
+        """Tokens in a bucket that held ``tokens`` at ``since``, as of ``now``."""
+        elapsed = max((now - since).total_seconds(), 0)
+        return min(self.capacity, tokens + elapsed * self.per_second)
+
+
+def load_rate_limits() -> dict[str, Rate]:
+    """
+    Rate limits from settings, by task path.
+
+    Raises:
+        ImproperlyConfigured: If a rate is malformed.
+    """
+    try:
+        return {path: Rate(value) for path, value in get_rate_limits().items()}
+    except ValueError as e:
+        raise ImproperlyConfigured(f"DJANGO_SIMPLE_QUEUE_RATE_LIMITS: {e}")
+
+
+def exhausted_tasks(using: str, limits: dict[str, Rate], now: datetime) -> list[str]:
+    """Task paths whose bucket has no whole token left."""
+    return [
+        bucket.task
+        for bucket in RateLimitBucket.objects.using(using).filter(task__in=limits)
+        if limits[bucket.task].refill(bucket.tokens, bucket.updated_at, now) < 1
+    ]
+
+
+def take_tokens(using: str, task_path: str, rate: Rate, wanted: int, now: datetime) -> int:
+    """
+    Take up to ``wanted`` tokens from the bucket of ``task_path``.
+
+    Must be called inside a transaction: the bucket row stays locked until
+    it ends, so concurrent claims never spend the same tokens.
+
+    Returns:
+        The number of tokens taken.
+    """
+    buckets = RateLimitBucket.objects.using(using).select_for_update()
+    bucket = buckets.filter(task=task_path).first()
+    if bucket is None:
+        RateLimitBucket.objects.using(using).bulk_create(
+            [RateLimitBucket(task=task_path, tokens=rate.capacity, updated_at=now)],
+            ignore_conflicts=True,
+        )
+        bucket = buckets.get(task=task_path)
+    tokens = rate.refill(bucket.tokens, bucket.updated_at, now)
+    taken = min(wanted, int(tokens))
+    bucket.tokens = tokens - taken
+    bucket.updated_at = now
+    bucket.save(using=using, update_fields=["tokens", "updated_at"])
+    return taken
@@ -0,0 +1,194 @@
+"""
+Writing task results.
+
+Output, error and log live in the ``TaskResult`` table, one row per task,
+created by the first write. These helpers write them without reading the
+row first: ``save_result`` upserts, ``append_error`` and ``append_log``
+append in SQL.
+
+What a generator task yields goes through an ``OutputBuffer`` instead,
+which saves it as ``TaskOutputChunk`` rows while the task runs.
+"""
+from __future__ import annotations
+
+import time
+import uuid
+from collections import defaultdict
+
+import django
+from asgiref.sync import sync_to_async
+from django.db import connections, router, transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Concat
+
+from django_simple_queue.conf import (
+    get_output_flush_count,
+    get_output_flush_interval,
+    get_output_flush_size,
+)
+from django_simple_queue.models import TaskOutputChunk, TaskResult
+
+
+def save_result(task_id: uuid.UUID, **fields) -> None:
+    """
+    Store result fields of a task, creating its ``TaskResult`` if needed.
+
+    A single ``INSERT ... ON CONFLICT DO UPDATE`` statement on Django 4.1
+    and later, on backends that support it.
+
+    Args:
+        task_id: UUID of the task.
+        **fields: ``output``, ``error`` and/or ``log`` values to store;
+            other fields of the row are left alone.
+    """
+    result = TaskResult(task_id=task_id, **fields)
+    using = router.db_for_write(TaskResult)
+    features = connections[using].features
+    if django.VERSION < (4, 1) or not features.supports_update_conflicts_with_target:
+        if not TaskResult.objects.using(using).filter(task_id=task_id).update(**fields):
+            result.save(using=using, force_insert=True)
+        return
+    TaskResult.objects.using(using).bulk_create(
+        [result],
+        update_conflicts=True,
+        unique_fields=["task"],
+        update_fields=list(fields),
+    )
+
+
+async def asave_result(task_id: uuid.UUID, **fields) -> None:
+    """Async counterpart of ``save_result``."""
+    await sync_to_async(save_result)(task_id, **fields)
+
+
+def append_error(task_ids: list[uuid.UUID], message: str) -> None:
+    """
+    Append ``message`` to the error of each task.
+
+    Two queries whatever the number of tasks: one creating the missing
+    ``TaskResult`` rows, one appending to all of them.
+    """
+    TaskResult.objects.bulk_create(
+        [TaskResult(task_id=task_id) for task_id in task_ids], ignore_conflicts=True
+    )
+    TaskResult.objects.filter(task_id__in=task_ids).update(
+        error=Concat(Coalesce("error", Value("")), Value(message))
+    )
+
+
+def append_log(task_id: uuid.UUID, text: str) -> None:
+    """Append ``text`` to the log of a task whose ``TaskResult`` exists."""
+    TaskResult.objects.filter(task_id=task_id).update(
+        log=Concat(Coalesce("log", Value("")), Value(text))
+    )
+
+
+class OutputBuffer:
+    """
+    Buffers the values yielded by a generator task.
+
+    Buffered values are inserted as a single ``TaskOutputChunk`` row once
+    ``flush_count`` values or ``flush_size`` bytes are waiting, or when a
+    value arrives ``flush_interval`` seconds after the previous flush, so
+    each value is written once instead of rewriting the whole output on
+    every yield. ``finish`` stores the complete output in the task's
+    ``TaskResult`` and deletes the chunks.
+
+    Args:
+        task_id: UUID of the task.
+        flush_count: Values per chunk (default:
+            ``DJANGO_SIMPLE_QUEUE_OUTPUT_FLUSH_COUNT``).
+        flush_size: Bytes per chunk (default:
+            ``DJANGO_SIMPLE_QUEUE_OUTPUT_FLUSH_SIZE``).
+        flush_interval: Seconds between chunks (default:
+            ``DJANGO_SIMPLE_QUEUE_OUTPUT_FLUSH_INTERVAL``).
+    """
+
+    def __init__(
+        self,
+        task_id: uuid.UUID,
+        flush_count: int | None = None,
+        flush_size: int | None = None,
+        flush_interval: float | None = None,
+    ):
+        self.task_id = task_id
+        self.flush_count = get_output_flush_count() if flush_count is None else flush_count
+        self.flush_size = get_output_flush_size() if flush_size is None else flush_size
+        self.flush_interval = (
+            get_output_flush_interval() if flush_interval is None else flush_interval
+        )
+        self.pending: list[str] = []
+        self.pending_size = 0
+        self.chunks = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, text: str) -> bool:
+        """Buffer ``text``. Returns True if the buffer should be flushed now."""
+        self.pending.append(text)
+        self.pending_size += len(text.encode())
+        return (
+            len(self.pending) >= self.flush_count
+            or self.pending_size >= self.flush_size
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        )
+
+    def _take(self) -> TaskOutputChunk | None:
+        """The buffered values as an unsaved chunk, emptying the buffer."""
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return None
+        chunk = TaskOutputChunk(task_id=self.task_id, text="".join(self.pending))
+        self.pending = []
+        self.pending_size = 0
+        self.chunks += 1
+        return chunk
+
+    def flush(self) -> None:
+        """Insert the buffered values as one chunk."""
+        chunk = self._take()
+        if chunk is not None:
+            chunk.save(force_insert=True)
+
+    async def aflush(self) -> None:
+        """Async counterpart of ``flush``."""
+        chunk = self._take()
+        if chunk is not None:
+            await chunk.asave(force_insert=True)
+
+    def finish(self, output: str | None, **fields) -> None:
+        """
+        Store the task's complete output and drop its chunks.
+
+        Args:
+            output: Everything the task yielded, or its return value.
+            **fields: Other ``TaskResult`` fields to store in the same write.
+        """
+        self.pending = []
+        if not self.chunks:
+            save_result(self.task_id, output=output, **fields)
+            return
+        with transaction.atomic():
+            save_result(self.task_id, output=output, **fields)
+            TaskOutputChunk.objects.filter(task_id=self.task_id).delete()
+
+    async def afinish(self, output: str | None, **fields) -> None:
+        """Async counterpart of ``finish``."""
+        await sync_to_async(self.finish)(output, **fields)
+
+
+def collect_output(task_ids: list[uuid.UUID]) -> None:
+    """
+    Join the chunks left by generator runs that never finished (the worker
+    died or timed out) into their tasks' output.
+    """
+    texts = defaultdict(list)
+    chunks = TaskOutputChunk.objects.filter(task_id__in=task_ids).order_by("pk")
+    for task_id, text in chunks.values_list("task_id", "text"):
+        texts[task_id].append(text)
+    if not texts:
+        return
+    for task_id, parts in texts.items():
+        TaskResult.objects.filter(task_id=task_id).update(
+            output=Concat(Coalesce("output", Value("")), Value("".join(parts)))
+        )
+    TaskOutputChunk.objects.filter(task_id__in=texts).delete()
@@ -0,0 +1,130 @@
+"""
+Automatic retries.
+
+Retry policies are declared per task in ``DJANGO_SIMPLE_QUEUE_RETRY_POLICIES``.
+When a task with a policy raises (or times out), ``schedule_retry`` moves it
+to SCHEDULED with a ``run_after`` in the future instead of failing it, so the
+worker slot is freed straight away and the task only comes back to the queue
+once its backoff has elapsed.
+
+Every claim increments the task's ``attempts`` counter; once ``attempts``
+exceeds the policy's ``max_retries`` the task fails as usual.
+"""
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from django_simple_queue.backoff import exponential_backoff
+from django_simple_queue.conf import get_retry_policies
+from django_simple_queue.models import Task
+
+
+def _import_error(path: str) -> type[BaseException]:
+    """Exception class from a dotted path; bare names are builtins."""
+    return import_string(path if "." in path else f"builtins.{path}")
+
+
+class RetryPolicy:
+    """
+    How often and how soon a failed task is run again.
+
+    Args:
+        max_retries: Number of runs allowed after the first one.
+        backoff_base: Delay in seconds before the first retry; it doubles
+            with every further retry.
+        backoff_cap: Maximum delay in seconds.
+        jitter: Whether to randomize each delay between half and all of it.
+        retry_on: Exception classes, or their dotted paths, that are retried;
+            other exceptions fail the task straight away.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        backoff_base: float = 10,
+        backoff_cap: float = 3600,
+        jitter: bool = True,
+        retry_on=(Exception,),
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.jitter = jitter
+        self.retry_on = tuple(
+            _import_error(error) if isinstance(error, str) else error
+            for error in retry_on
+        )
+
+    def should_retry(self, attempts: int, error: BaseException | None) -> bool:
+        """Whether a task that failed on run number ``attempts`` runs again."""
+        return (
+            error is not None
+            and attempts <= self.max_retries
+            and isinstance(error, self.retry_on)
+        )
+
+    def delay(self, attempts: int) -> float:
+        """Seconds to wait before the run following run number ``attempts``."""
+        return exponential_backoff(
+            max(attempts - 1, 0), self.backoff_base, self.backoff_cap, self.jitter
+        )
+
+
+def load_retry_policies() -> dict[str, RetryPolicy]:
+    """
+    Retry policies from settings, by task path.
+
+    Raises:
+        ImproperlyConfigured: If a policy has unknown options or names an
+            exception class that cannot be imported.
+    """
+    policies = {}
+    for task_path, options in get_retry_policies().items():
+        try:
+            policies[task_path] = RetryPolicy(**options)
+        except (TypeError, ImportError) as e:
+            raise ImproperlyConfigured(f"Retry policy for {task_path!r}: {e}")
+    return policies
+
+
+def get_retry_policy(task: Task) -> RetryPolicy | None:
+    """
+    The retry policy that applies to ``task``.
+
+    The task's own ``max_retries``, when set, overrides the one from its
+    policy; a task with ``max_retries`` but no policy uses the defaults of
+    ``RetryPolicy`` for everything else.
+
+    Returns:
+        The policy, or None if the task is never retried.
+    """
+    policy = load_retry_policies().get(task.task)
+    if task.max_retries is not None:
+        policy = policy or RetryPolicy()
+        policy.max_retries = task.max_retries
+    return policy
+
+
+def schedule_retry(task: Task, error: BaseException | None) -> bool:
+    """
+    Schedule the next run of a failed task if its retry policy allows it.
+
+    Sets ``status`` and ``run_after`` on ``task`` without saving it.
+
+    Args:
+        task: The task that just failed.
+        error: The exception it failed with.
+
+    Returns:
+        True if the task will be retried, False if it should be failed.
+    """
+    policy = get_retry_policy(task)
+    if policy is None or not policy.should_retry(task.attempts, error):
+        return False
+    task.status = Task.SCHEDULED
+    task.run_after = timezone.now() + timedelta(seconds=policy.delay(task.attempts))
+    return True
@@ -0,0 +1,232 @@
+"""
+Periodic tasks.
+
+Recurring tasks are declared in ``DJANGO_SIMPLE_QUEUE_PERIODIC_TASKS`` with
+either a cron expression or an interval. The ``task_scheduler`` command (or
+``task_worker --scheduler``) calls ``run_due_periodic_tasks`` on every tick,
+which enqueues every due task with a single bulk insert.
+
+When each schedule runs next is stored in the ``PeriodicTask`` table. A tick
+only enqueues a task after advancing that row with a conditional ``UPDATE``,
+so when several schedulers run on different hosts, every occurrence is
+still enqueued exactly once.
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from django_simple_queue.concurrency import concurrency_key
+from django_simple_queue.conf import get_periodic_tasks, is_task_allowed
+from django_simple_queue.models import PeriodicTask, Task
+from django_simple_queue.notify import notify_workers
+
+
+class CronSchedule:
+    """
+    A standard five-field cron expression: minute, hour, day of month,
+    month and day of week (0 or 7 is Sunday).
+
+    Each field accepts ``*``, numbers, ranges (``1-5``), steps (``*/15``,
+    ``0-30/10``) and comma-separated lists of those. As in cron, when both
+    day of month and day of week are restricted, a day matching either runs.
+    Times are evaluated in the current Django time zone.
+
+    Raises:
+        ValueError: If the expression is malformed.
+    """
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        fields = [
+            self._parse_field(part, low, high)
+            for part, (low, high) in zip(parts, self.FIELDS)
+        ]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> set[int]:
+        values = set()
+        for item in field.split(","):
+            spec, _, step = item.partition("/")
+            if spec == "*":
+                start, end = low, high
+            elif "-" in spec:
+                start, end = (int(bound) for bound in spec.split("-", 1))
+            else:
+                start = end = int(spec)
+            step = int(step) if step else 1
+            if not (low <= start <= end <= high) or step < 1:
+                raise ValueError(f"Invalid cron field {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, day: datetime) -> bool:
+        in_days = day.day in self.days
+        # Python: Monday is 0; cron: Sunday is 0
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return in_weekdays
+        if self.any_weekday:
+            return in_days
+        return in_days or in_weekdays
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Earliest time matching the expression strictly after ``moment``."""
+        aware = timezone.is_aware(moment)
+        wall = timezone.localtime(moment).replace(tzinfo=None) if aware else moment
+        wall = wall.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = wall + timedelta(days=366 * 4)
+        while wall < limit:
+            if wall.month not in self.months:
+                wall = (wall.replace(day=1) + timedelta(days=32)).replace(
+                    day=1, hour=0, minute=0
+                )
+            elif not self._day_matches(wall):
+                wall = wall.replace(hour=0, minute=0) + timedelta(days=1)
+            elif wall.hour not in self.hours:
+                wall = wall.replace(minute=0) + timedelta(hours=1)
+            elif wall.minute not in self.minutes:
+                wall += timedelta(minutes=1)
+            else:
+                return timezone.make_aware(wall) if aware else wall
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+
+class IntervalSchedule:
+    """Runs every ``interval``, counted from the previous run."""
+
+    def __init__(self, interval: timedelta):
+        if interval <= timedelta(0):
+            raise ValueError("Interval must be positive")
+        self.interval = interval
+
+    def next_after(self, moment: datetime) -> datetime:
+        """``moment`` plus the interval."""
+        return moment + self.interval
+
+
+def parse_schedule(value) -> CronSchedule | IntervalSchedule:
+    """
+    Build a schedule from a ``"schedule"`` entry.
+
+    Args:
+        value: A cron expression, a number of seconds or a ``timedelta``.
+    """
+    if isinstance(value, str):
+        return CronSchedule(value)
+    if isinstance(value, timedelta):
+        return IntervalSchedule(value)
+    return IntervalSchedule(timedelta(seconds=value))
+
+
+def load_periodic_tasks() -> dict[str, dict]:
+    """
+    Validated periodic task definitions from settings.
+
+    Returns:
+        Definitions by name, each with its ``schedule`` parsed.
+
+    Raises:
+        ImproperlyConfigured: If an entry has no task or an invalid schedule,
+            or its task is not in DJANGO_SIMPLE_QUEUE_ALLOWED_TASKS.
+    """
+    definitions = {}
+    for name, entry in get_periodic_tasks().items():
+        if "task" not in entry or "schedule" not in entry:
+            raise ImproperlyConfigured(
+                f"Periodic task {name!r} needs a 'task' and a 'schedule'."
+            )
+        if not is_task_allowed(entry["task"]):
+            raise ImproperlyConfigured(
+                f"Periodic task {name!r}: '{entry['task']}' is not in "
+                f"DJANGO_SIMPLE_QUEUE_ALLOWED_TASKS."
+            )
+        try:
+            schedule = parse_schedule(entry["schedule"])
+        except (TypeError, ValueError) as e:
+            raise ImproperlyConfigured(f"Periodic task {name!r}: {e}")
+        definitions[name] = {**entry, "schedule": schedule}
+    return definitions
+
+
+def run_due_periodic_tasks(now: datetime | None = None) -> int:
+    """
+    Enqueue every periodic task that is due.
+
+    Schedules seen for the first time are stored with their next run time
+    and do not fire straight away. Missed runs (e.g. while no scheduler
+    was running) are not caught up: a late schedule fires once and then
+    moves to its next time after ``now``.
+
+    Args:
+        now: Current time; defaults to ``timezone.now()``.
+
+    Returns:
+        The number of tasks enqueued.
+    """
+    now = now or timezone.now()
+    definitions = load_periodic_tasks()
+    if not definitions:
+        return 0
+
+    states = {
+        state.name: state
+        for state in PeriodicTask.objects.filter(name__in=definitions)
+    }
+    new_states = [
+        PeriodicTask(name=name, next_run_at=definition["schedule"].next_after(now))
+        for name, definition in definitions.items()
+        if name not in states
+    ]
+    if new_states:
+        PeriodicTask.objects.bulk_create(new_states, ignore_conflicts=True)
+
+    tasks = []
+    with transaction.atomic():
+        for name, state in states.items():
+            if state.next_run_at > now:
+                continue
+            definition = definitions[name]
+            # Only the scheduler that advances the row enqueues the task
+            advanced = PeriodicTask.objects.filter(
+                pk=name, next_run_at=state.next_run_at
+            ).update(last_run_at=now, next_run_at=definition["schedule"].next_after(now))
+            if advanced:
+                args = definition.get("args", {})
+                tasks.append(
+                    Task(
+                        task=definition["task"],
+                        args=json.dumps(args),
+                        queue=definition.get("queue", Task.DEFAULT_QUEUE),
+                        priority=definition.get("priority", Task.PRIORITY_NORMAL),
+                        concurrency_key=concurrency_key(definition["task"], args),
+                    )
+                )
+        if tasks:
+            Task.objects.bulk_create(tasks)
+    if tasks:
+        notify_workers()
+    return len(tasks)
+
+
+def next_periodic_run() -> datetime | None:
+    """Earliest upcoming run among the configured periodic tasks."""
+    return (
+        PeriodicTask.objects.filter(name__in=get_periodic_tasks())
+        .order_by("next_run_at")
+        .values_list("next_run_at", flat=True)
+        .first()
+    )
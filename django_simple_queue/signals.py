@@ -18,6 +18,12 @@ Signals:
         - task: The failed Task instance
         - error: The exception that caused the failure (may be None for orphaned tasks)
 
+    on_retry: Fired instead of on_failure when a failed task's retry policy
+        schedules another run.
+        - sender: Task class
+        - task: The Task instance, now SCHEDULED with its next ``run_after``
+        - error: The exception (or TimeoutError) the run failed with
+
     before_loop: Fired before each iteration of a generator task.
         - sender: Task class
         - task: The Task instance
@@ -54,6 +60,9 @@ on_success = django.dispatch.Signal()
 on_failure = django.dispatch.Signal()
 """Signal fired when a task fails. Provides: task, error."""
 
+on_retry = django.dispatch.Signal()
+"""Signal fired when a failed task is scheduled to run again. Provides: task, error."""
+
 before_loop = django.dispatch.Signal()
 """Signal fired before each generator iteration. Provides: task, iteration."""
 
@@ -29,3 +29,50 @@ def sleep_task(seconds=1, **kwargs):
 
     time.sleep(seconds)
     return f"slept for {seconds} seconds"
+
+
+def print_marker(marker="", seconds=0, **kwargs):
+    """Task that logs a marker around a sleep, for log isolation tests."""
+    import logging
+    import os
+    import time
+
+    print(f"start {marker}")
+    time.sleep(seconds)
+    logging.info(f"end {marker}")
+    return str(os.getpid())
+
+
+def print_from_thread(**kwargs):
+    """Task whose output is produced by a helper thread it starts."""
+    import logging
+    import threading
+
+    def helper():
+        print("from helper thread")
+        logging.warning("logged from helper thread")
+
+    thread = threading.Thread(target=helper)
+    thread.start()
+    thread.join()
+    return "done"
+
+
+async def async_marker(marker="", seconds=0, **kwargs):
+    """Coroutine task that logs a marker around a non-blocking sleep."""
+    import asyncio
+    import os
+
+    print(f"start {marker}")
+    await asyncio.sleep(seconds)
+    print(f"end {marker}")
+    return str(os.getpid())
+
+
+async def async_counter(count=3, **kwargs):
+    """Async generator task yielding `count` chunks."""
+    import asyncio
+
+    for i in range(count):
+        await asyncio.sleep(0)
+        yield f"{i};"
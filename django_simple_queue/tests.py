@@ -1,18 +1,68 @@
+import json
 import os
+import signal
 import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
 from multiprocessing import Process
-
-from django.core.exceptions import ValidationError
-from django.test import Client, TestCase, TransactionTestCase, override_settings
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import (
+    Client,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from django_simple_queue import signals
-from django_simple_queue.models import Task
+from django_simple_queue.backoff import IdleBackoff, exponential_backoff
+from django_simple_queue.claim import (
+    claim_from_queues,
+    claim_tasks,
+    enqueue_due_tasks,
+    extend_leases,
+    next_due_time,
+    queued_tasks,
+    release_tasks,
+)
+from django_simple_queue.models import (
+    PeriodicTask,
+    RateLimitBucket,
+    Task,
+    TaskOutputChunk,
+    TaskResult,
+)
+from django_simple_queue.management.commands.task_worker import (
+    Command as WorkerCommand,
+    parse_queues,
+)
 from django_simple_queue.monitor import (
     detect_orphaned_tasks,
     handle_subprocess_exit,
     handle_task_timeout,
+    host_identity,
+    pid_checked_tasks,
+)
+from django_simple_queue.notify import QueueListener, notify_workers
+from django_simple_queue.concurrency import _running_counts, load_concurrency_limits
+from django_simple_queue.loading import load_callable, preload_tasks
+from django_simple_queue.pool import LogCapture, PreforkPool, ProcessPool, RunningTask
+from django_simple_queue.ratelimit import Rate, load_rate_limits
+from django_simple_queue.retry import RetryPolicy, load_retry_policies
+from django_simple_queue.scheduler import (
+    CronSchedule,
+    IntervalSchedule,
+    next_periodic_run,
+    run_due_periodic_tasks,
 )
-from django_simple_queue.utils import TaskNotAllowedError, create_task
+from django_simple_queue.utils import TaskNotAllowedError, create_task, create_tasks
 from django_simple_queue.worker import execute_task
 
 
@@ -44,6 +94,24 @@ class ExecuteTaskTest(TransactionTestCase):
         self.assertEqual(task.status, Task.FAILED)
         self.assertIn("ValueError", task.error)
 
+    def test_async_task(self):
+        task = Task.objects.create(
+            task="django_simple_queue.test_tasks.async_marker", args="{}"
+        )
+        execute_task(task.id)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.COMPLETED)
+        self.assertEqual(task.output, str(os.getpid()))
+
+    def test_async_generator_task(self):
+        task = Task.objects.create(
+            task="django_simple_queue.test_tasks.async_counter", args='{"count": 3}'
+        )
+        execute_task(task.id)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.COMPLETED)
+        self.assertEqual(task.output, "0;1;2;")
+
 
 class FieldSeparationTest(TransactionTestCase):
     def test_output_only_has_return_value(self):
@@ -77,6 +145,69 @@ class FieldSeparationTest(TransactionTestCase):
         self.assertIsNone(task.error)
 
 
+class TaskResultTest(TransactionTestCase):
+    def test_result_is_stored_outside_the_task_row(self):
+        task = Task.objects.create(
+            task="django_simple_queue.test_tasks.return_hello", args="{}"
+        )
+        self.assertIsNone(task.output)
+        execute_task(task.id)
+        self.assertEqual(TaskResult.objects.get(task=task).output, "hello")
+        self.assertNotIn("output", [field.name for field in Task._meta.concrete_fields])
+
+    def test_status_view_loads_task_and_result_in_one_query(self):
+        task = Task.objects.create(task="django_simple_queue.test_tasks.return_hello", args="{}")
+        TaskResult.objects.create(task=task, output="hello", log="a log line")
+        with self.assertNumQueries(1):
+            data = Client().get(f"/task?task_id={task.id}&type=json").json()
+        self.assertEqual((data["output"], data["log"], data["error"]), ("hello", "a log line", None))
+
+
+class QueryCountTest(TransactionTestCase):
+    """Database round trips of a task's lifecycle."""
+
+    def assertNumStatements(self, count, func, *args):
+        """Like assertNumQueries, not counting BEGIN and COMMIT."""
+        with CaptureQueriesContext(connection) as ctx:
+            result = func(*args)
+        statements = [
+            q["sql"] for q in ctx.captured_queries if q["sql"] not in ("BEGIN", "COMMIT")
+        ]
+        self.assertEqual(len(statements), count, statements)
+        return result
+
+    def claim(self, task_path):
+        Task.objects.create(task=task_path, args="{}")
+        (task_id,) = self.assertNumStatements(1, claim_tasks, 1)
+        return task_id
+
+    def test_plain_task(self):
+        task_id = self.claim("django_simple_queue.test_tasks.return_hello")
+        # Load the task, store its output, update status, PID and lease
+        self.assertNumStatements(3, execute_task, task_id)
+
+        running = RunningTask(task_id, None)
+        write_fd = os.dup(running.capture.write_fd)
+        running.capture.start()
+        os.write(write_fd, b"log line\n")
+        os.close(write_fd)
+        # Store the log; nothing else is left for the parent to write
+        self.assertNumStatements(1, running.settle, 0)
+
+        task = Task.objects.select_related("result").get(id=task_id)
+        self.assertEqual(task.status, Task.COMPLETED)
+        self.assertEqual((task.output, task.log), ("hello", "log line\n"))
+        self.assertIsNone(task.worker_pid)
+        self.assertIsNone(task.lease_expires_at)
+
+    def test_failing_task(self):
+        task_id = self.claim("django_simple_queue.test_tasks.raise_error")
+        self.assertNumStatements(3, execute_task, task_id)
+        task = Task.objects.get(id=task_id)
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertIsNone(task.lease_expires_at)
+
+
 class OrphanDetectionTest(TransactionTestCase):
     def test_dead_pid_marks_task_failed(self):
         task = Task.objects.create(
@@ -215,6 +346,43 @@ class SignalTest(TransactionTestCase):
             signals.after_loop.disconnect(on_after_loop)
 
 
+class GeneratorOutputTest(TransactionTestCase):
+    @override_settings(
+        DJANGO_SIMPLE_QUEUE_OUTPUT_FLUSH_COUNT=2,
+        DJANGO_SIMPLE_QUEUE_OUTPUT_FLUSH_INTERVAL=60,
+    )
+    def test_yielded_values_are_saved_in_chunks(self):
+        seen = []
+
+        def on_before_loop(sender, task, iteration, **kw):
+            saved = Task.objects.get(id=task.id)
+            chunks = list(saved.output_chunks.values_list("text", flat=True))
+            seen.append((chunks, saved.output))
+
+        signals.before_loop.connect(on_before_loop)
+        try:
+            task = Task.objects.create(
+                task="django_simple_queue.test_tasks.gen_abc", args="{}", status=Task.PROGRESS
+            )
+            execute_task(task.id)
+        finally:
+            signals.before_loop.disconnect(on_before_loop)
+        self.assertEqual(seen, [([], ""), ([], ""), (["ab"], "ab")])
+        self.assertEqual(Task.objects.get(id=task.id).output, "abc")
+        self.assertFalse(TaskOutputChunk.objects.exists())
+
+    def test_chunks_of_a_crashed_run_are_kept(self):
+        task = Task.objects.create(
+            task="django_simple_queue.test_tasks.gen_abc", args="{}", status=Task.PROGRESS
+        )
+        TaskResult.objects.create(task=task, output="")
+        TaskOutputChunk.objects.create(task=task, text="ab")
+        TaskOutputChunk.objects.create(task=task, text="c")
+        handle_subprocess_exit(task.id, -9)
+        self.assertEqual(Task.objects.get(id=task.id).output, "abc")
+        self.assertFalse(TaskOutputChunk.objects.exists())
+
+
 class PipeLogCaptureTest(TransactionTestCase):
     def test_stdout_captured_in_pipe(self):
         from django.db import connections
@@ -255,6 +423,1262 @@ class PipeLogCaptureTest(TransactionTestCase):
         self.assertEqual(task.output, "result")  # output is clean
 
 
+
+class LogCaptureTest(TransactionTestCase):
+    def setUp(self):
+        self.task = Task.objects.create(
+            task="django_simple_queue.test_tasks.print_and_return", args="{}"
+        )
+
+    def start_capture(self, **options):
+        capture = LogCapture(self.task.id, **options)
+        write_fd = os.dup(capture.write_fd)  # Stands in for the child's end
+        capture.start()
+        return capture, write_fd
+
+    def test_log_is_saved_while_the_task_runs(self):
+        TaskResult.objects.create(task=self.task, log="log of an earlier run")
+        capture, write_fd = self.start_capture(flush_size=10, flush_interval=60)
+        os.write(write_fd, "first line\n".encode())
+        deadline = time.monotonic() + 5
+        while TaskResult.objects.get(task=self.task).log != "first line\n":
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+
+        os.write(write_fd, "é".encode()[:1])  # Split character
+        os.write(write_fd, "é\nend".encode()[1:])
+        os.close(write_fd)
+        capture.finish()
+        self.assertEqual(TaskResult.objects.get(task=self.task).log, "first line\né\nend")
+
+    def test_long_log_keeps_head_and_tail(self):
+        capture, write_fd = self.start_capture(max_size=20, flush_size=1000)
+        for i in range(200):
+            os.write(write_fd, f"{i:04}\n".encode())
+        os.close(write_fd)
+        capture.finish()
+        self.assertEqual(
+            TaskResult.objects.get(task=self.task).log,
+            "0000\n0001\n\n[... 980 bytes omitted ...]\n0198\n0199\n",
+        )
+
+    def test_no_output_clears_earlier_log(self):
+        TaskResult.objects.create(task=self.task, log="log of an earlier run")
+        capture, write_fd = self.start_capture()
+        os.close(write_fd)
+        capture.finish()
+        self.assertIsNone(TaskResult.objects.get(task=self.task).log)
+
+def run_pool_until_idle(pool):
+    """Drive a worker pool until every submitted task has been settled."""
+    while not pool.is_idle():
+        WorkerCommand.wait_for_pool(pool, 1)
+        pool.reap()
+
+
+class ProcessPoolTest(TransactionTestCase):
+    def test_runs_task_and_stores_log(self):
+        task = Task.objects.create(
+            task="django_simple_queue.test_tasks.print_and_return",
+            args="{}",
+            status=Task.PROGRESS,
+            worker_pid=os.getpid(),
+        )
+        pool = ProcessPool(1, timeout=None)
+        pool.submit(task.id)
+        run_pool_until_idle(pool)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.COMPLETED)
+        self.assertEqual(task.output, "result")
+        self.assertIn("log line from stdout", task.log)
+        self.assertIsNone(task.worker_pid)
+
+    def test_tasks_run_side_by_side(self):
+        for _ in range(2):
+            Task.objects.create(
+                task="django_simple_queue.test_tasks.sleep_task",
+                args='{"seconds": 1}',
+            )
+        pool = ProcessPool(2, timeout=None)
+        self.assertEqual(WorkerCommand.fill_pool(pool, deque()), 2)
+        self.assertEqual(claim_tasks(), [])
+        self.assertTrue(all(p.exitcode is None for p, _ in pool.running))
+        run_pool_until_idle(pool)
+        self.assertEqual(
+            Task.objects.filter(status=Task.COMPLETED).count(), 2
+        )
+
+    def test_expired_task_is_terminated(self):
+        task = Task.objects.create(
+            task="django_simple_queue.test_tasks.sleep_task",
+            args='{"seconds": 30}',
+            status=Task.PROGRESS,
+        )
+        pool = ProcessPool(1, timeout=1)
+        pool.submit(task.id)
+        run_pool_until_idle(pool)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertIn("timed out after 1 seconds", task.error)
+
+    def test_log_includes_output_of_helper_threads(self):
+        task = Task.objects.create(
+            task="django_simple_queue.test_tasks.print_from_thread",
+            args="{}",
+            status=Task.PROGRESS,
+        )
+        pool = ProcessPool(1, timeout=None)
+        pool.submit(task.id)
+        run_pool_until_idle(pool)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.COMPLETED)
+        self.assertIn("from helper thread", task.log)
+        self.assertIn("logged from helper thread", task.log)
+
+
+class PreforkPoolTest(TransactionTestCase):
+    def test_child_is_reused_across_tasks(self):
+        pool = PreforkPool(1, timeout=None)
+        try:
+            pid = pool.children[0].process.pid
+            for _ in range(3):
+                task = Task.objects.create(
+                    task="django_simple_queue.test_tasks.print_and_return",
+                    args="{}",
+                    status=Task.PROGRESS,
+                )
+                pool.submit(task.id)
+                run_pool_until_idle(pool)
+                task.refresh_from_db()
+                self.assertEqual(task.status, Task.COMPLETED)
+                self.assertEqual(task.output, "result")
+                self.assertIn("log line from stdout", task.log)
+            self.assertEqual(pool.children[0].process.pid, pid)
+        finally:
+            pool.shutdown()
+
+    def test_child_recycled_after_max_tasks(self):
+        pool = PreforkPool(1, timeout=None, max_tasks_per_child=2)
+        try:
+            pids = []
+            for _ in range(3):
+                pids.append(pool.children[0].process.pid)
+                task = Task.objects.create(
+                    task="django_simple_queue.test_tasks.return_hello",
+                    args="{}",
+                    status=Task.PROGRESS,
+                )
+                pool.submit(task.id)
+                run_pool_until_idle(pool)
+            self.assertEqual(pids[0], pids[1])
+            self.assertNotEqual(pids[1], pids[2])
+        finally:
+            pool.shutdown()
+
+    def test_expired_task_replaces_child(self):
+        task = Task.objects.create(
+            task="django_simple_queue.test_tasks.sleep_task",
+            args='{"seconds": 30}',
+            status=Task.PROGRESS,
+        )
+        pool = PreforkPool(1, timeout=1)
+        try:
+            pid = pool.children[0].process.pid
+            pool.submit(task.id)
+            run_pool_until_idle(pool)
+            task.refresh_from_db()
+            self.assertEqual(task.status, Task.FAILED)
+            self.assertIn("timed out after 1 seconds", task.error)
+            self.assertNotEqual(pool.children[0].process.pid, pid)
+            self.assertEqual(pool.free_slots(), 1)
+        finally:
+            pool.shutdown()
+
+    def test_dead_child_does_not_take_task(self):
+        task = Task.objects.create(
+            task="django_simple_queue.test_tasks.return_hello",
+            args="{}",
+            status=Task.PROGRESS,
+        )
+        pool = PreforkPool(1, timeout=None)
+        try:
+            pid = pool.children[0].process.pid
+            os.kill(pid, signal.SIGKILL)
+            pool.children[0].process.join()
+            self.assertFalse(pool.submit(task.id))
+            self.assertEqual(pool.running_task_ids(), [])
+            pool.reap()
+            self.assertNotEqual(pool.children[0].process.pid, pid)
+            self.assertTrue(pool.submit(task.id))
+            run_pool_until_idle(pool)
+            task.refresh_from_db()
+            self.assertEqual(task.status, Task.COMPLETED)
+        finally:
+            pool.shutdown()
+
+    def test_log_includes_output_of_helper_threads(self):
+        pool = PreforkPool(1, timeout=None)
+        try:
+            # Twice, to check the redirect is undone between tasks
+            for _ in range(2):
+                task = Task.objects.create(
+                    task="django_simple_queue.test_tasks.print_from_thread",
+                    args="{}",
+                    status=Task.PROGRESS,
+                )
+                pool.submit(task.id)
+                run_pool_until_idle(pool)
+                task.refresh_from_db()
+                self.assertEqual(task.status, Task.COMPLETED)
+                self.assertIn("from helper thread", task.log)
+                self.assertIn("logged from helper thread", task.log)
+        finally:
+            pool.shutdown()
+
+
+class ThreadPoolModeTest(TransactionTestCase):
+    def _enqueue(self, marker, seconds):
+        return Task.objects.create(
+            task="django_simple_queue.test_tasks.print_marker",
+            args=json.dumps({"marker": marker, "seconds": seconds}),
+            status=Task.PROGRESS,
+        )
+
+    def test_tasks_share_one_child_with_separate_logs(self):
+        tasks = [self._enqueue(marker, 1) for marker in ("one", "two", "three")]
+        pool = PreforkPool(1, timeout=None, threads=3)
+        try:
+            self.assertEqual(pool.free_slots(), 3)
+            start = time.monotonic()
+            for task in tasks:
+                pool.submit(task.id)
+            self.assertEqual(pool.free_slots(), 0)
+            run_pool_until_idle(pool)
+            self.assertLess(time.monotonic() - start, 2.5)
+        finally:
+            pool.shutdown()
+
+        pids = set()
+        for task, marker in zip(tasks, ("one", "two", "three")):
+            task.refresh_from_db()
+            self.assertEqual(task.status, Task.COMPLETED)
+            pids.add(task.output)
+            self.assertIn(f"start {marker}", task.log)
+            self.assertIn(f"end {marker}", task.log)
+            for other in {"one", "two", "three"} - {marker}:
+                self.assertNotIn(other, task.log)
+        self.assertEqual(len(pids), 1)
+
+    def test_timeout_retires_child_after_other_tasks(self):
+        slow = self._enqueue("slow", 30)
+        fast = self._enqueue("fast", 0)
+        pool = PreforkPool(1, timeout=2, threads=2)
+        try:
+            pid = pool.children[0].process.pid
+            pool.submit(slow.id)
+            pool.submit(fast.id)
+            run_pool_until_idle(pool)
+            self.assertNotEqual(pool.children[0].process.pid, pid)
+        finally:
+            pool.shutdown()
+        slow.refresh_from_db()
+        fast.refresh_from_db()
+        self.assertEqual(fast.status, Task.COMPLETED)
+        self.assertEqual(slow.status, Task.FAILED)
+        self.assertIn("timed out after 2 seconds", slow.error)
+
+
+class AsyncPoolTest(TransactionTestCase):
+    def _enqueue(self, task, **args):
+        return Task.objects.create(
+            task=f"django_simple_queue.test_tasks.{task}",
+            args=json.dumps(args),
+            status=Task.PROGRESS,
+        )
+
+    def test_coroutines_share_one_event_loop(self):
+        markers = [f"m{i}" for i in range(20)]
+        tasks = [self._enqueue("async_marker", marker=m, seconds=1) for m in markers]
+        pool = PreforkPool(1, timeout=None, async_tasks=50)
+        try:
+            self.assertEqual(pool.free_slots(), 50)
+            start = time.monotonic()
+            for task in tasks:
+                pool.submit(task.id)
+            run_pool_until_idle(pool)
+            self.assertLess(time.monotonic() - start, 5)
+        finally:
+            pool.shutdown()
+
+        pids = set()
+        for task, marker in zip(tasks, markers):
+            task.refresh_from_db()
+            self.assertEqual(task.status, Task.COMPLETED)
+            pids.add(task.output)
+            self.assertIn(f"start {marker}\n", task.log)
+            self.assertIn(f"end {marker}\n", task.log)
+            self.assertEqual(task.log.count("start"), 1)
+        self.assertEqual(len(pids), 1)
+
+    def test_sync_and_generator_tasks(self):
+        tasks = [
+            self._enqueue("return_hello"),
+            self._enqueue("gen_abc"),
+            self._enqueue("async_counter", count=2),
+            self._enqueue("raise_error"),
+        ]
+        pool = PreforkPool(1, timeout=None, async_tasks=10)
+        try:
+            for task in tasks:
+                pool.submit(task.id)
+            run_pool_until_idle(pool)
+        finally:
+            pool.shutdown()
+        for task in tasks:
+            task.refresh_from_db()
+        self.assertEqual(
+            [task.status for task in tasks],
+            [Task.COMPLETED, Task.COMPLETED, Task.COMPLETED, Task.FAILED],
+        )
+        self.assertEqual(
+            [task.output for task in tasks[:3]], ["hello", "abc", "0;1;"]
+        )
+        self.assertIn("ValueError", tasks[3].error)
+
+    def test_blocking_sync_task_does_not_hold_up_coroutines(self):
+        blocking = self._enqueue("sleep_task", seconds=2)
+        quick = self._enqueue("async_marker")
+        pool = PreforkPool(1, timeout=None, async_tasks=10)
+        try:
+            start = timezone.now()
+            pool.submit(blocking.id)
+            pool.submit(quick.id)
+            run_pool_until_idle(pool)
+        finally:
+            pool.shutdown()
+        blocking.refresh_from_db()
+        quick.refresh_from_db()
+        self.assertEqual((blocking.status, quick.status), (Task.COMPLETED, Task.COMPLETED))
+        self.assertLess(quick.modified - start, timedelta(seconds=1))
+        self.assertGreaterEqual(blocking.modified - start, timedelta(seconds=2))
+
+
+class ClaimTasksTest(TransactionTestCase):
+    def _enqueue(self, count):
+        return [
+            Task.objects.create(
+                task="django_simple_queue.test_tasks.return_hello", args="{}"
+            ).id
+            for _ in range(count)
+        ]
+
+    def test_claims_oldest_tasks_up_to_limit(self):
+        task_ids = self._enqueue(5)
+        claimed = claim_tasks(3, worker_pid=1234)
+        self.assertCountEqual(claimed, task_ids[:3])
+        for task in Task.objects.filter(id__in=claimed):
+            self.assertEqual(task.status, Task.PROGRESS)
+            self.assertEqual(task.worker_pid, 1234)
+        self.assertEqual(Task.objects.filter(status=Task.QUEUED).count(), 2)
+
+    def test_claims_by_priority_then_age(self):
+        path = "django_simple_queue.test_tasks.return_hello"
+        low = create_task(path, {}, priority=Task.PRIORITY_LOW)
+        normal = self._enqueue(2)
+        high = create_task(path, {}, priority=Task.PRIORITY_HIGH)
+        self.assertEqual(claim_tasks(1), [high])
+        self.assertEqual(claim_tasks(1), [normal[0]])
+        self.assertEqual(claim_tasks(1), [normal[1]])
+        self.assertEqual(claim_tasks(1), [low])
+
+    def test_claims_only_subscribed_queues(self):
+        path = "django_simple_queue.test_tasks.return_hello"
+        email = create_task(path, {}, queue="emails")
+        report = create_task(path, {}, queue="reports")
+        self.assertEqual(claim_tasks(5, queues=["emails"]), [email])
+        self.assertEqual(claim_tasks(5, queues=["emails"]), [])
+        self.assertEqual(claim_tasks(5), [report])
+
+    def test_claim_from_weighted_queues(self):
+        path = "django_simple_queue.test_tasks.return_hello"
+        for queue in ("emails", "reports") * 3:
+            create_task(path, {}, queue=queue)
+        claimed = claim_from_queues(4, {"emails": 3, "reports": 1})
+        self.assertEqual(len(claimed), 4)
+        self.assertEqual(len(claim_from_queues(4, {"emails": 1, "reports": 1})), 2)
+
+    def test_parse_queues(self):
+        self.assertEqual(
+            parse_queues("emails:3, reports"), {"emails": 3.0, "reports": 1.0}
+        )
+        with self.assertRaises(ValueError):
+            parse_queues("emails:0")
+
+    def test_claim_is_one_statement(self):
+        self._enqueue(3)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(len(claim_tasks(3)), 3)
+        statements = [
+            q["sql"] for q in ctx.captured_queries
+            if q["sql"] not in ("BEGIN", "COMMIT")
+        ]
+        self.assertEqual(len(statements), 1)
+        self.assertIn("RETURNING", statements[0])
+
+    def test_fallback_without_returning(self):
+        task_ids = self._enqueue(3)
+        with mock.patch(
+            "django_simple_queue.claim._supports_update_returning", return_value=False
+        ):
+            claimed = claim_tasks(2)
+        self.assertCountEqual(claimed, task_ids[:2])
+        self.assertEqual(Task.objects.filter(status=Task.PROGRESS).count(), 2)
+
+    def test_empty_queue(self):
+        self.assertEqual(claim_tasks(5), [])
+
+    def test_claimed_tasks_are_not_claimed_again(self):
+        self._enqueue(2)
+        first = claim_tasks(2)
+        self.assertEqual(claim_tasks(2), [])
+        self.assertEqual(release_tasks(first), 2)
+        self.assertCountEqual(claim_tasks(2), first)
+
+    def test_release_keeps_queue_position(self):
+        task_ids = self._enqueue(3)
+        claimed = claim_tasks(1)
+        self.assertEqual(claimed, [task_ids[0]])
+        release_tasks(claimed)
+        self.assertEqual(claim_tasks(1), [task_ids[0]])
+
+    def test_fill_pool_keeps_prefetched_tasks(self):
+        task_ids = self._enqueue(4)
+        pool = ProcessPool(1, timeout=None)
+        buffer = deque()
+        with mock.patch.object(
+            pool, "submit", side_effect=lambda task_id: pool.running.append(task_id) or True
+        ):
+            self.assertEqual(WorkerCommand.fill_pool(pool, buffer, prefetch=2), 3)
+            self.assertEqual(len(pool.running), 1)
+            self.assertEqual(len(buffer), 2)
+            self.assertEqual(Task.objects.filter(status=Task.QUEUED).count(), 1)
+
+            # A freed slot is refilled from the buffer without claiming
+            pool.running.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(WorkerCommand.fill_pool(pool, buffer, prefetch=2), 0)
+            self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(len(buffer), 1)
+        self.assertIn(buffer[0], task_ids)
+
+    def test_fill_pool_retries_task_refused_by_dead_child(self):
+        (task_id,) = self._enqueue(1)
+        pool = ProcessPool(1, timeout=None)
+        submitted = []
+
+        def submit(task_id):
+            submitted.append(task_id)
+            if len(submitted) == 1:
+                return False  # The child died before taking the task
+            pool.running.append(task_id)
+            return True
+
+        with mock.patch.object(pool, "submit", side_effect=submit), mock.patch.object(
+            pool, "reap"
+        ) as reap:
+            self.assertEqual(WorkerCommand.fill_pool(pool, deque()), 1)
+        self.assertEqual(submitted, [task_id, task_id])
+        self.assertEqual(pool.running, [task_id])
+        reap.assert_called_once_with()
+
+
+class ScheduledTaskTest(TransactionTestCase):
+    path = "django_simple_queue.test_tasks.return_hello"
+
+    def test_countdown_schedules_task(self):
+        task_id = create_task(self.path, {}, countdown=60)
+        task = Task.objects.get(id=task_id)
+        self.assertEqual(task.status, Task.SCHEDULED)
+        self.assertGreater(task.run_after, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(enqueue_due_tasks(), 0)
+        self.assertEqual(claim_tasks(1), [])
+        self.assertEqual(next_due_time(), task.run_after)
+
+    def test_due_task_is_queued_in_run_after_order(self):
+        now = timezone.now()
+        later = create_task(self.path, {}, eta=now + timedelta(seconds=60))
+        queued = create_task(self.path, {})
+        Task.objects.filter(id=later).update(run_after=now - timedelta(seconds=60))
+        self.assertEqual(enqueue_due_tasks(), 1)
+        self.assertEqual(next_due_time(), None)
+        self.assertEqual(claim_tasks(1), [later])
+        self.assertEqual(claim_tasks(1), [queued])
+
+    def test_past_eta_is_queued_immediately(self):
+        task_id = create_task(self.path, {}, eta=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(Task.objects.get(id=task_id).status, Task.QUEUED)
+
+    def test_eta_and_countdown_are_exclusive(self):
+        with self.assertRaises(ValueError):
+            create_task(self.path, {}, eta=timezone.now(), countdown=10)
+
+
+class RetryTest(TransactionTestCase):
+    path = "django_simple_queue.test_tasks.raise_error"
+
+    def run_claimed(self, task_id):
+        self.assertEqual(claim_tasks(1), [task_id])
+        execute_task(task_id)
+        return Task.objects.get(id=task_id)
+
+    def test_failure_without_policy_fails(self):
+        task = self.run_claimed(create_task(self.path, {}))
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertEqual(task.attempts, 1)
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_RETRY_POLICIES={
+        "django_simple_queue.test_tasks.raise_error": {
+            "max_retries": 2, "backoff_base": 60, "jitter": False,
+        },
+    })
+    def test_retries_with_backoff_until_max_retries(self):
+        task_id = create_task(self.path, {})
+        retried = []
+
+        def on_retry(sender, task, error=None, **kw):
+            retried.append(task.id)
+
+        signals.on_retry.connect(on_retry)
+        try:
+            for attempt, delay in ((1, 60), (2, 120)):
+                before = timezone.now()
+                task = self.run_claimed(task_id)
+                self.assertEqual(task.status, Task.SCHEDULED)
+                self.assertEqual(task.attempts, attempt)
+                self.assertIn("test error", task.error)
+                self.assertGreaterEqual(task.run_after, before + timedelta(seconds=delay))
+                # The task stays out of the queue until its backoff has elapsed
+                self.assertEqual(enqueue_due_tasks(), 0)
+                Task.objects.filter(id=task_id).update(run_after=timezone.now())
+                self.assertEqual(enqueue_due_tasks(), 1)
+            task = self.run_claimed(task_id)
+        finally:
+            signals.on_retry.disconnect(on_retry)
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertEqual(task.attempts, 3)
+        self.assertEqual(retried, [task_id, task_id])
+
+    def test_success_after_retry_clears_error(self):
+        for path in (
+            "django_simple_queue.test_tasks.return_hello",
+            "django_simple_queue.test_tasks.gen_abc",
+        ):
+            with self.subTest(path=path):
+                task_id = create_task(self.path, {}, max_retries=1)
+                task = self.run_claimed(task_id)
+                self.assertEqual(task.status, Task.SCHEDULED)
+                self.assertIn("test error", task.error)
+                # The next attempt runs a task that succeeds
+                Task.objects.filter(id=task_id).update(task=path, status=Task.QUEUED)
+                task = self.run_claimed(task_id)
+                self.assertEqual(task.status, Task.COMPLETED)
+                self.assertIsNone(task.error)
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_RETRY_POLICIES={
+        "django_simple_queue.test_tasks.raise_error": {"retry_on": ["KeyError"]},
+    })
+    def test_other_exceptions_are_not_retried(self):
+        task = self.run_claimed(create_task(self.path, {}))
+        self.assertEqual(task.status, Task.FAILED)
+
+    def test_task_max_retries_without_policy(self):
+        task = self.run_claimed(create_task(self.path, {}, max_retries=1))
+        self.assertEqual(task.status, Task.SCHEDULED)
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_RETRY_POLICIES={
+        "django_simple_queue.test_tasks.sleep_task": {"retry_on": [TimeoutError]},
+    })
+    def test_timeout_is_retried(self):
+        task_id = create_task("django_simple_queue.test_tasks.sleep_task", {})
+        claim_tasks(1)
+        handle_task_timeout(task_id, 5)
+        task = Task.objects.get(id=task_id)
+        self.assertEqual(task.status, Task.SCHEDULED)
+        self.assertIsNone(task.worker_pid)
+
+    def test_released_claim_is_not_an_attempt(self):
+        task_id = create_task(self.path, {})
+        claim_tasks(1)
+        release_tasks([task_id])
+        self.assertEqual(Task.objects.get(id=task_id).attempts, 0)
+
+    def test_policy_delay_is_capped(self):
+        policy = RetryPolicy(backoff_base=10, backoff_cap=30, jitter=False)
+        self.assertEqual([policy.delay(n) for n in (1, 2, 3, 4)], [10, 20, 30, 30])
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_RETRY_POLICIES={
+        "django_simple_queue.test_tasks.raise_error": {"retries": 3},
+    })
+    def test_invalid_policy_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            load_retry_policies()
+
+
+@override_settings(DJANGO_SIMPLE_QUEUE_RATE_LIMITS={
+    "django_simple_queue.test_tasks.return_hello": "2/m",
+})
+class RateLimitTest(TransactionTestCase):
+    path = "django_simple_queue.test_tasks.return_hello"
+
+    def test_claims_only_as_many_tasks_as_tokens(self):
+        limited = [create_task(self.path, {}) for _ in range(3)]
+        other = create_task("django_simple_queue.test_tasks.gen_abc", {})
+        claimed = claim_tasks(10)
+        self.assertEqual(len(claimed), 3)
+        self.assertIn(other, claimed)
+        self.assertEqual(
+            Task.objects.get(id=(set(limited) - set(claimed)).pop()).status,
+            Task.QUEUED,
+        )
+        self.assertEqual(RateLimitBucket.objects.get(task=self.path).tokens, 0)
+
+    def test_exhausted_task_does_not_block_the_queue(self):
+        for _ in range(3):
+            create_task(self.path, {})
+        self.assertEqual(len(claim_tasks(2)), 2)
+        other = create_task("django_simple_queue.test_tasks.gen_abc", {})
+        self.assertEqual(claim_tasks(1), [other])
+        self.assertEqual(claim_tasks(1), [])
+
+    def test_bucket_refills_over_time(self):
+        for _ in range(3):
+            create_task(self.path, {})
+        claim_tasks(3)
+        RateLimitBucket.objects.filter(task=self.path).update(
+            updated_at=timezone.now() - timedelta(seconds=30)
+        )
+        self.assertEqual(len(claim_tasks(3)), 1)
+
+    def test_claim_losing_the_race_for_tokens_is_undone(self):
+        task_id = create_task(self.path, {})
+        RateLimitBucket.objects.create(task=self.path, tokens=0, updated_at=timezone.now())
+        # Another worker empties the bucket between the check and the claim
+        with mock.patch("django_simple_queue.claim.exhausted_tasks", return_value=[]):
+            self.assertEqual(claim_tasks(1), [])
+        task = Task.objects.get(id=task_id)
+        self.assertEqual((task.status, task.attempts, task.worker_pid), (Task.QUEUED, 0, None))
+
+    def test_rate_parsing(self):
+        rate = Rate("50/m")
+        self.assertEqual((rate.capacity, rate.per_second), (50, 50 / 60))
+        for value in ("50", "0/s", "5/w", "x/m"):
+            with self.assertRaises(ValueError):
+                Rate(value)
+        with override_settings(DJANGO_SIMPLE_QUEUE_RATE_LIMITS={self.path: "5/w"}):
+            with self.assertRaises(ImproperlyConfigured):
+                load_rate_limits()
+
+
+class ConcurrencyLimitTest(TransactionTestCase):
+    path = "django_simple_queue.test_tasks.return_hello"
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_CONCURRENCY_LIMITS={
+        "django_simple_queue.test_tasks.return_hello": 2,
+    })
+    def test_path_limit_counts_running_tasks(self):
+        for _ in range(3):
+            create_task(self.path, {})
+        other = create_task("django_simple_queue.test_tasks.gen_abc", {})
+        claimed = claim_tasks(10)
+        self.assertEqual(len(claimed), 3)
+        self.assertIn(other, claimed)
+        self.assertEqual(claim_tasks(1), [])
+        Task.objects.filter(id=claimed[0]).update(status=Task.COMPLETED)
+        self.assertEqual(len(claim_tasks(1)), 1)
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_CONCURRENCY_LIMITS={
+        "django_simple_queue.test_tasks.return_hello": {"limit": 1, "key": "account"},
+    })
+    def test_key_limit_is_per_argument_value(self):
+        first = create_task(self.path, {"account": 1})
+        create_task(self.path, {"account": 1})
+        second = create_task(self.path, {"account": 2})
+        self.assertEqual(Task.objects.get(id=first).concurrency_key, "1")
+        self.assertEqual(sorted(claim_tasks(10)), sorted([first, second]))
+        self.assertEqual(claim_tasks(10), [])
+        self.assertEqual(
+            _running_counts("default", [self.path]),
+            {(self.path, "1"): 1, (self.path, "2"): 1},
+        )
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_CONCURRENCY_LIMITS={
+        "django_simple_queue.test_tasks.return_hello": 1,
+    })
+    def test_claim_losing_the_race_for_a_slot_is_undone(self):
+        running = create_task(self.path, {})
+        claim_tasks(1)
+        waiting = create_task(self.path, {})
+        # Another worker claims the last slot between the check and the claim
+        with mock.patch("django_simple_queue.claim.saturated", return_value=None):
+            self.assertEqual(claim_tasks(1), [])
+        task = Task.objects.get(id=waiting)
+        self.assertEqual((task.status, task.attempts), (Task.QUEUED, 0))
+        self.assertEqual(Task.objects.get(id=running).status, Task.PROGRESS)
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_CONCURRENCY_LIMITS={
+        "django_simple_queue.test_tasks.return_hello": {"limit": 0},
+    })
+    def test_invalid_limit_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            load_concurrency_limits()
+
+
+class CreateTasksTest(TransactionTestCase):
+    path = "django_simple_queue.test_tasks.return_hello"
+
+    def test_inserts_in_batches_from_a_generator(self):
+        with CaptureQueriesContext(connection) as ctx:
+            ids = create_tasks(self.path, ({"n": n} for n in range(25)), batch_size=10)
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(len(ids), 25)
+        tasks = Task.objects.in_bulk(ids)
+        self.assertEqual([json.loads(tasks[pk].args)["n"] for pk in ids], list(range(25)))
+        self.assertTrue(all(task.status == Task.QUEUED for task in tasks.values()))
+
+    def test_countdown_schedules_all_tasks(self):
+        ids = create_tasks(self.path, [{}, {}], countdown=60)
+        self.assertEqual(
+            Task.objects.filter(id__in=ids, status=Task.SCHEDULED).count(), 2
+        )
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_ALLOWED_TASKS={"myapp.tasks.other"})
+    def test_allowlist_is_checked_before_consuming_args(self):
+        consumed = []
+        args = (consumed.append(n) or {} for n in range(3))
+        with self.assertRaises(TaskNotAllowedError):
+            create_tasks(self.path, args)
+        self.assertEqual(consumed, [])
+
+    def test_rejects_non_dict_args(self):
+        with self.assertRaises(TypeError):
+            create_tasks(self.path, [{}, "x"])
+        self.assertEqual(Task.objects.count(), 0)
+
+
+class EnqueueOnCommitTest(TransactionTestCase):
+    path = "django_simple_queue.test_tasks.return_hello"
+
+    def test_tasks_are_inserted_in_one_batch_on_commit(self):
+        with CaptureQueriesContext(connection) as ctx:
+            with transaction.atomic():
+                ids = [create_task(self.path, {"n": n}, on_commit=True) for n in range(3)]
+                self.assertEqual(Task.objects.count(), 0)
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(set(Task.objects.values_list("id", flat=True)), set(ids))
+
+    def test_rollback_discards_tasks(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                create_task(self.path, {}, on_commit=True)
+                raise RuntimeError
+        with transaction.atomic():
+            task_id = create_task(self.path, {}, on_commit=True)
+        self.assertEqual(list(Task.objects.values_list("id", flat=True)), [task_id])
+
+    def test_savepoint_rollback_discards_only_its_tasks(self):
+        with transaction.atomic():
+            kept = create_task(self.path, {}, on_commit=True)
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    create_task(self.path, {}, on_commit=True)
+                    raise RuntimeError
+            also_kept = create_task(self.path, {}, on_commit=True)
+        self.assertEqual(
+            set(Task.objects.values_list("id", flat=True)), {kept, also_kept}
+        )
+
+    def test_on_commit_internals_have_expected_layout(self):
+        # _commit_batch reads these private attributes of the connection
+        def callback():
+            pass
+
+        with transaction.atomic():
+            with transaction.atomic():
+                transaction.on_commit(callback)
+                self.assertIsInstance(connection.savepoint_ids, list)
+                self.assertEqual(len(connection.savepoint_ids), 1)
+                ((sids, func, *_),) = connection.run_on_commit
+                self.assertEqual(set(sids), set(connection.savepoint_ids))
+                self.assertIs(func, callback)
+
+    def test_released_savepoint_joins_the_transaction_batch(self):
+        with CaptureQueriesContext(connection) as ctx:
+            with transaction.atomic():
+                with transaction.atomic():
+                    first = create_task(self.path, {}, on_commit=True)
+                second = create_task(self.path, {}, on_commit=True)
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(set(Task.objects.values_list("id", flat=True)), {first, second})
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_ENQUEUE_ON_COMMIT=True)
+    def test_outside_a_transaction_tasks_are_created_immediately(self):
+        task_id = create_task(self.path, {})
+        self.assertTrue(Task.objects.filter(id=task_id).exists())
+
+
+class DedupeKeyTest(TransactionTestCase):
+    path = "django_simple_queue.test_tasks.return_hello"
+
+    def test_duplicate_of_active_task_is_collapsed(self):
+        first = create_task(self.path, {}, dedupe_key="order-1")
+        self.assertEqual(create_task(self.path, {}, dedupe_key="order-1"), first)
+        claim_tasks(1)
+        self.assertEqual(create_task(self.path, {}, dedupe_key="order-1"), first)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_key_is_free_once_the_task_finished(self):
+        first = create_task(self.path, {}, dedupe_key="order-1")
+        Task.objects.filter(id=first).update(status=Task.COMPLETED)
+        second = create_task(self.path, {}, dedupe_key="order-1")
+        self.assertNotEqual(second, first)
+        self.assertEqual(Task.objects.count(), 2)
+
+    def test_duplicate_inside_transaction_keeps_it_usable(self):
+        with transaction.atomic():
+            first = create_task(self.path, {}, dedupe_key="order-1")
+            self.assertEqual(create_task(self.path, {}, dedupe_key="order-1"), first)
+            create_task(self.path, {})
+        self.assertEqual(Task.objects.count(), 2)
+
+    def test_on_commit_batch_drops_duplicates(self):
+        first = create_task(self.path, {}, dedupe_key="order-1")
+        with transaction.atomic():
+            create_task(self.path, {}, dedupe_key="order-1", on_commit=True)
+            create_task(self.path, {}, dedupe_key="order-2", on_commit=True)
+        self.assertEqual(
+            set(Task.objects.values_list("dedupe_key", flat=True)), {"order-1", "order-2"}
+        )
+        self.assertTrue(Task.objects.filter(id=first).exists())
+
+    def test_duplicate_is_looked_up_without_partial_index(self):
+        with mock.patch.object(connection.features, "supports_partial_indexes", False):
+            first = create_task(self.path, {}, dedupe_key="order-1")
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(create_task(self.path, {}, dedupe_key="order-1"), first)
+        self.assertFalse(any("INSERT" in q["sql"] for q in ctx.captured_queries))
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_on_commit_batch_drops_duplicates_without_partial_index(self):
+        with mock.patch.object(connection.features, "supports_partial_indexes", False):
+            first = create_task(self.path, {}, dedupe_key="order-1")
+            with transaction.atomic():
+                for key in ("order-1", "order-2", "order-2"):
+                    create_task(self.path, {}, dedupe_key=key, on_commit=True)
+        self.assertEqual(
+            sorted(Task.objects.values_list("dedupe_key", flat=True)), ["order-1", "order-2"]
+        )
+        self.assertTrue(Task.objects.filter(id=first).exists())
+
+
+class CronScheduleTest(SimpleTestCase):
+    def test_next_after(self):
+        start = datetime(2024, 3, 15, 10, 7, 30)  # a Friday
+        cases = [
+            ("*/15 * * * *", datetime(2024, 3, 15, 10, 15)),
+            ("0 3 * * *", datetime(2024, 3, 16, 3, 0)),
+            ("30 9 * * 1-5", datetime(2024, 3, 18, 9, 30)),
+            ("0 0 1 */3 *", datetime(2024, 4, 1, 0, 0)),
+            ("0 12 31 * 0", datetime(2024, 3, 17, 12, 0)),  # day OR weekday
+        ]
+        for expression, expected in cases:
+            with self.subTest(expression):
+                self.assertEqual(CronSchedule(expression).next_after(start), expected)
+
+    def test_invalid_expressions(self):
+        for expression in ("* * * *", "60 * * * *", "*/0 * * * *", "0 0 30 2 *"):
+            with self.subTest(expression), self.assertRaises(ValueError):
+                CronSchedule(expression).next_after(datetime(2024, 1, 1))
+
+
+@override_settings(
+    DJANGO_SIMPLE_QUEUE_PERIODIC_TASKS={
+        "hello": {
+            "task": "django_simple_queue.test_tasks.return_hello",
+            "schedule": 60,
+            "queue": "periodic",
+        },
+    }
+)
+class PeriodicSchedulerTest(TransactionTestCase):
+    def test_enqueues_each_run_once(self):
+        now = timezone.now()
+        self.assertEqual(run_due_periodic_tasks(now), 0)
+        state = PeriodicTask.objects.get(name="hello")
+        self.assertEqual(state.next_run_at, now + timedelta(seconds=60))
+
+        later = now + timedelta(seconds=61)
+        self.assertEqual(run_due_periodic_tasks(later), 1)
+        self.assertEqual(run_due_periodic_tasks(later), 0)
+        task = Task.objects.get()
+        self.assertEqual(task.task, "django_simple_queue.test_tasks.return_hello")
+        self.assertEqual(task.queue, "periodic")
+        state.refresh_from_db()
+        self.assertEqual(state.last_run_at, later)
+        self.assertEqual(state.next_run_at, later + timedelta(seconds=60))
+        self.assertEqual(next_periodic_run(), state.next_run_at)
+
+    @override_settings(
+        DJANGO_SIMPLE_QUEUE_MIN_POLL_INTERVAL=300,
+        DJANGO_SIMPLE_QUEUE_MAX_POLL_INTERVAL=600,
+    )
+    def test_worker_wakes_up_for_next_periodic_run(self):
+        command = WorkerCommand()
+        command.wait_for_pool = mock.Mock(side_effect=[None, None, KeyboardInterrupt])
+        with mock.patch(
+            "django_simple_queue.management.commands.task_worker.QueueListener.create",
+            return_value=None,
+        ):
+            command.handle(concurrency=1, pool="fork", scheduler=True)
+        # The first pass stores the schedule, due in 60 seconds
+        delay = command.wait_for_pool.call_args_list[1].args[1]
+        self.assertLessEqual(delay, 60)
+        self.assertGreater(delay, 50)
+
+    def test_concurrent_scheduler_fires_only_once(self):
+        now = timezone.now()
+        run_due_periodic_tasks(now)
+        PeriodicTask.objects.update(next_run_at=now)
+        next_after = IntervalSchedule.next_after
+
+        def race(schedule, moment):
+            # Another scheduler advances the row between our read and update
+            PeriodicTask.objects.update(next_run_at=moment + timedelta(hours=1))
+            return next_after(schedule, moment)
+
+        with mock.patch.object(IntervalSchedule, "next_after", race):
+            self.assertEqual(run_due_periodic_tasks(now + timedelta(seconds=1)), 0)
+        self.assertFalse(Task.objects.exists())
+
+
+class LeaseTest(TransactionTestCase):
+    def _claim(self):
+        Task.objects.create(
+            task="django_simple_queue.test_tasks.return_hello", args="{}"
+        )
+        (task_id,) = claim_tasks(1)
+        return Task.objects.get(id=task_id)
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_LEASE_DURATION=30)
+    def test_claim_grants_lease_and_heartbeat_extends_it(self):
+        before = timezone.now()
+        task = self._claim()
+        self.assertGreaterEqual(task.lease_expires_at, before + timedelta(seconds=30))
+        Task.objects.filter(id=task.id).update(lease_expires_at=before)
+        self.assertEqual(extend_leases([task.id]), 1)
+        task.refresh_from_db()
+        self.assertGreater(task.lease_expires_at, before + timedelta(seconds=29))
+
+    def test_heartbeat_skips_task_claimed_by_another_worker(self):
+        task = self._claim()
+        expires = timezone.now()
+        Task.objects.filter(id=task.id).update(
+            worker_pid=999999, lease_expires_at=expires
+        )
+        self.assertEqual(extend_leases([task.id]), 0)
+        task.refresh_from_db()
+        self.assertEqual(task.lease_expires_at, expires)
+
+    def test_expired_lease_fails_task_even_with_live_pid(self):
+        task = self._claim()
+        self.assertEqual(task.worker_pid, os.getpid())
+        Task.objects.filter(id=task.id).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        failures = []
+        handler = lambda sender, task, **kwargs: failures.append(task.id)
+        signals.on_failure.connect(handler)
+        try:
+            detect_orphaned_tasks()
+        finally:
+            signals.on_failure.disconnect(handler)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertIn("stopped renewing its lease", task.error)
+        self.assertIsNone(task.lease_expires_at)
+        self.assertEqual(failures, [task.id])
+
+    def test_live_lease_on_other_host_is_not_checked_by_pid(self):
+        task = self._claim()
+        Task.objects.filter(id=task.id).update(
+            worker_pid=999999, worker_host="some-other-host"
+        )
+        detect_orphaned_tasks()
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.PROGRESS)
+
+    def test_task_writes_do_not_clobber_renewed_lease(self):
+        task = self._claim()
+        Task.objects.filter(id=task.id).update(task="django_simple_queue.test_tasks.gen_abc")
+        renewed = timezone.now() + timedelta(hours=1)
+        Task.objects.filter(id=task.id).update(lease_expires_at=renewed)
+        leases = []
+
+        def on_after_loop(sender, task, **kw):
+            leases.append(Task.objects.get(id=task.id).lease_expires_at)
+
+        signals.after_loop.connect(on_after_loop)
+        try:
+            execute_task(task.id)
+        finally:
+            signals.after_loop.disconnect(on_after_loop)
+        self.assertEqual(leases, [renewed] * 3)
+        # The final write ends the lease along with the run
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.COMPLETED)
+        self.assertIsNone(task.lease_expires_at)
+
+    def _run_after(self, task, **changes):
+        """Run ``task`` after applying ``changes`` to it, as a sweep would."""
+        fired = []
+
+        def on_before_job(sender, task, **kw):
+            Task.objects.filter(id=task.id).update(**changes)
+
+        def on_success(sender, task, **kw):
+            fired.append(task.id)
+
+        signals.before_job.connect(on_before_job)
+        signals.on_success.connect(on_success)
+        try:
+            execute_task(task.id)
+        finally:
+            signals.before_job.disconnect(on_before_job)
+            signals.on_success.disconnect(on_success)
+        task.refresh_from_db()
+        return fired
+
+    def test_run_ending_after_sweep_keeps_failed_status(self):
+        task = self._claim()
+        fired = self._run_after(
+            task, status=Task.FAILED, worker_pid=None, lease_expires_at=None
+        )
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertEqual(fired, [])
+
+    def test_run_ending_after_reclaim_leaves_new_claim(self):
+        task = self._claim()
+        fired = self._run_after(task, worker_pid=999999)
+        self.assertEqual(task.status, Task.PROGRESS)
+        self.assertEqual(task.worker_pid, 999999)
+        self.assertIsNotNone(task.lease_expires_at)
+        self.assertEqual(fired, [])
+
+
+class HostAwareOrphanTest(TransactionTestCase):
+    def _running(self, host, boot_id, pid):
+        return Task.objects.create(
+            task="django_simple_queue.test_tasks.return_hello",
+            args="{}",
+            status=Task.PROGRESS,
+            worker_pid=pid,
+            worker_host=host,
+            worker_boot_id=boot_id,
+        )
+
+    def test_claim_records_host(self):
+        Task.objects.create(
+            task="django_simple_queue.test_tasks.return_hello", args="{}"
+        )
+        (task_id,) = claim_tasks(1)
+        task = Task.objects.get(id=task_id)
+        self.assertEqual((task.worker_host, task.worker_boot_id), host_identity())
+
+    def test_only_local_tasks_are_checked_by_pid(self):
+        hostname, boot_id = host_identity()
+        local = self._running(hostname, boot_id, 999999)
+        remote = self._running("some-other-host", "other-boot", 999999)
+        detect_orphaned_tasks()
+        local.refresh_from_db()
+        remote.refresh_from_db()
+        self.assertEqual(local.status, Task.FAILED)
+        self.assertEqual(remote.status, Task.PROGRESS)
+
+    def test_task_from_before_reboot_is_failed(self):
+        hostname, _ = host_identity()
+        task = self._running(hostname, "previous-boot", os.getpid())
+        Task.objects.filter(id=task.id).update(
+            lease_expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        detect_orphaned_tasks()
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertIsNone(task.lease_expires_at)
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_ORPHAN_CHECK_INTERVAL=3600)
+    def test_worker_checks_orphans_on_interval(self):
+        command = WorkerCommand()
+        command.wait_for_pool = mock.Mock(side_effect=[None, None, KeyboardInterrupt])
+        with mock.patch(
+            "django_simple_queue.management.commands.task_worker.detect_orphaned_tasks"
+        ) as detect:
+            command.handle(concurrency=1, pool="fork")
+        self.assertEqual(detect.call_count, 1)
+
+
+class CallableLoadingTest(SimpleTestCase):
+    def setUp(self):
+        load_callable.cache_clear()
+
+    def test_callable_is_resolved_once_per_path(self):
+        from django_simple_queue import test_tasks
+
+        with mock.patch(
+            "django_simple_queue.loading.importlib.import_module",
+            return_value=test_tasks,
+        ) as import_module:
+            first = load_callable("django_simple_queue.test_tasks.return_hello")
+            second = load_callable("django_simple_queue.test_tasks.return_hello")
+        self.assertIs(first, test_tasks.return_hello)
+        self.assertIs(second, first)
+        self.assertEqual(import_module.call_count, 1)
+
+    def test_failures_are_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(AttributeError):
+                load_callable("django_simple_queue.test_tasks.missing")
+        self.assertEqual(load_callable.cache_info().currsize, 0)
+
+    def test_preload_skips_paths_that_cannot_be_resolved(self):
+        loaded = preload_tasks(
+            {"django_simple_queue.test_tasks.return_hello", "no_such_module.task"}
+        )
+        self.assertEqual(loaded, 1)
+        self.assertEqual(load_callable.cache_info().currsize, 1)
+
+    @override_settings(
+        DJANGO_SIMPLE_QUEUE_ALLOWED_TASKS={"django_simple_queue.test_tasks.return_hello"}
+    )
+    def test_worker_preloads_before_starting_children(self):
+        command = WorkerCommand()
+        command.create_pool = mock.Mock(side_effect=KeyboardInterrupt)
+        with mock.patch(
+            "django_simple_queue.management.commands.task_worker.QueueListener.create",
+            return_value=None,
+        ):
+            command.handle(concurrency=1, pool="fork", preload=True)
+        self.assertEqual(load_callable.cache_info().currsize, 1)
+        command.create_pool.assert_called_once()
+
+    def test_worker_preload_requires_allowed_tasks(self):
+        with self.assertRaises(CommandError):
+            WorkerCommand().handle(concurrency=1, pool="fork", preload=True)
+
+
+class IndexUsageTest(TestCase):
+    """EXPLAIN-based checks that the hot queries are served by indexes."""
+
+    def setUp(self):
+        for status in (Task.QUEUED, Task.PROGRESS, Task.COMPLETED, Task.FAILED) * 25:
+            Task.objects.create(
+                task="django_simple_queue.test_tasks.return_hello",
+                args="{}",
+                status=status,
+                worker_pid=os.getpid() if status == Task.PROGRESS else None,
+            )
+
+    def explain(self, qs):
+        if connection.vendor == "postgresql":
+            # Tiny test tables are cheaper to scan; make the planner show
+            # whether it *can* use the index.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        return qs.explain()
+
+    def test_claim_query_uses_queued_index(self):
+        plan = self.explain(queued_tasks("default", ["default"]).values("pk")[:10])
+        self.assertIn("dsq_task_queued_idx", plan)
+
+    def test_orphan_scan_uses_host_index(self):
+        for qs in pid_checked_tasks("web-1"):
+            self.assertIn("dsq_task_host_running_idx", self.explain(qs))
+
+    def test_lease_sweep_uses_lease_index(self):
+        plan = self.explain(
+            Task.objects.filter(status=Task.PROGRESS, lease_expires_at__lt=timezone.now())
+        )
+        self.assertIn("dsq_task_lease_idx", plan)
+
+    def test_due_scan_uses_scheduled_index(self):
+        plan = self.explain(
+            Task.objects.filter(status=Task.SCHEDULED, run_after__lte=timezone.now())
+        )
+        self.assertIn("dsq_task_scheduled_idx", plan)
+
+    def test_concurrency_count_uses_running_key_index(self):
+        plan = self.explain(
+            Task.objects.filter(
+                status=Task.PROGRESS, task__in=["django_simple_queue.test_tasks.return_hello"]
+            ).values_list("task", "concurrency_key")
+        )
+        self.assertIn("dsq_task_running_key_idx", plan)
+
+
+class IdleBackoffTest(SimpleTestCase):
+    def test_delay_grows_up_to_maximum(self):
+        backoff = IdleBackoff(0.5, 4)
+        delays = [backoff.next_delay() for _ in range(10)]
+        self.assertTrue(all(0.5 <= d <= 4 for d in delays))
+        self.assertLessEqual(delays[0], 0.5)
+        self.assertGreaterEqual(delays[-1], 2)
+
+    def test_reset_returns_to_minimum(self):
+        backoff = IdleBackoff(0.5, 4)
+        for _ in range(5):
+            backoff.next_delay()
+        backoff.reset()
+        self.assertEqual(backoff.next_delay(), 0.5)
+
+    def test_exponential_backoff_without_jitter(self):
+        self.assertEqual(
+            [exponential_backoff(n, 1, 10, jitter=False) for n in range(6)],
+            [1, 2, 4, 8, 10, 10],
+        )
+
+
+class NotifyTest(TestCase):
+    def test_notify_is_noop_without_postgresql(self):
+        with self.assertNumQueries(0):
+            notify_workers()
+
+    def test_listener_requires_postgresql(self):
+        self.assertIsNone(QueueListener.create())
+
+    def test_notify_sends_pg_notify_on_postgresql(self):
+        connection = mock.MagicMock(vendor="postgresql")
+        cursor = connection.cursor.return_value.__enter__.return_value
+        with mock.patch(
+            "django_simple_queue.notify.connections", {"default": connection}
+        ):
+            notify_workers()
+        cursor.execute.assert_called_once_with(
+            "SELECT pg_notify(%s, '')", ["django_simple_queue"]
+        )
+
+    @override_settings(DJANGO_SIMPLE_QUEUE_NOTIFY_CHANNEL=None)
+    def test_notify_can_be_disabled(self):
+        with mock.patch("django_simple_queue.notify.connections") as connections:
+            notify_workers()
+        connections.__getitem__.assert_not_called()
+
+    def test_create_task_notifies_workers(self):
+        with mock.patch("django_simple_queue.utils.notify_workers") as notify:
+            create_task(task="django_simple_queue.test_tasks.return_hello", args={})
+        notify.assert_called_once_with()
+
+
 # =============================================================================
 # Security Tests
 # =============================================================================
@@ -287,8 +1711,8 @@ class XSSProtectionTest(TestCase):
             task="django_simple_queue.test_tasks.return_hello",
             args="{}",
             status=Task.COMPLETED,
-            output="<img src=x onerror=alert('xss')>",
         )
+        TaskResult.objects.create(task=task, output="<img src=x onerror=alert('xss')>")
         response = self.client.get(f"/task?task_id={task.id}")
         self.assertEqual(response.status_code, 200)
         content = response.content.decode()
@@ -2,9 +2,22 @@ from __future__ import annotations
 
 import json
 import uuid
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from itertools import islice
 
-from django_simple_queue.conf import is_task_allowed, get_allowed_tasks
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from django_simple_queue.concurrency import concurrency_key, load_concurrency_limits
+from django_simple_queue.conf import (
+    get_allowed_tasks,
+    get_enqueue_on_commit,
+    is_task_allowed,
+)
 from django_simple_queue.models import Task
+from django_simple_queue.notify import notify_workers
 
 
 class TaskNotAllowedError(Exception):
@@ -12,19 +25,195 @@ class TaskNotAllowedError(Exception):
     pass
 
 
-def create_task(task: str, args: dict) -> uuid.UUID:
+def _check_task_allowed(task: str) -> None:
+    """Raise TaskNotAllowedError if ``task`` is not in the allowlist."""
+    if not is_task_allowed(task):
+        allowed = get_allowed_tasks()
+        if allowed is not None:
+            raise TaskNotAllowedError(
+                f"Task '{task}' is not in the allowed list. "
+                f"Add it to DJANGO_SIMPLE_QUEUE_ALLOWED_TASKS in settings.py"
+            )
+
+
+def _resolve_eta(eta: datetime | None, countdown: float | None) -> datetime | None:
+    """The time a task may run from, given either ``eta`` or ``countdown``."""
+    if eta is not None and countdown is not None:
+        raise ValueError("Pass either eta or countdown, not both.")
+    if countdown is not None:
+        eta = timezone.now() + timedelta(seconds=countdown)
+    return eta
+
+
+def _enforces_dedupe(using: str) -> bool:
+    """
+    Whether ``dsq_task_active_dedupe_uniq`` exists on ``using``.
+
+    It is a partial unique constraint, which MySQL and MariaDB skip; there,
+    ``dedupe_key`` is enforced by a locked lookup of the active tasks instead.
+    """
+    return connections[using].features.supports_partial_indexes
+
+
+def _active_tasks(using: str) -> QuerySet[Task]:
+    """Tasks holding their ``dedupe_key``: scheduled, queued or running."""
+    return Task.objects.using(using).filter(
+        status__in=(Task.QUEUED, Task.PROGRESS, Task.SCHEDULED)
+    )
+
+
+def _without_duplicates(using: str, tasks: list[Task]) -> list[Task]:
+    """
+    Drop the tasks whose ``dedupe_key`` an active task or an earlier task
+    of ``tasks`` holds. The active tasks found are locked until the end of
+    the transaction.
+    """
+    keys = {task.dedupe_key for task in tasks if task.dedupe_key}
+    if not keys:
+        return tasks
+    taken = set(
+        _active_tasks(using)
+        .select_for_update()
+        .filter(dedupe_key__in=keys)
+        .values_list("dedupe_key", flat=True)
+    )
+    kept = []
+    for task in tasks:
+        if task.dedupe_key:
+            if task.dedupe_key in taken:
+                continue
+            taken.add(task.dedupe_key)
+        kept.append(task)
+    return kept
+
+
+class _CommitBatch:
+    """
+    Tasks created in one transaction (or savepoint) with ``on_commit``.
+
+    Registered as a single ``transaction.on_commit`` callback: once the
+    transaction commits, all its tasks are inserted with one
+    ``bulk_create`` and workers are woken once. If it rolls back, Django
+    drops the callback and the tasks with it.
+    """
+
+    def __init__(self, using: str):
+        self.using = using
+        self.tasks = []
+
+    def __call__(self):
+        # Tasks whose dedupe_key is taken by an active task are dropped
+        if _enforces_dedupe(self.using):
+            ignore_conflicts = any(task.dedupe_key for task in self.tasks)
+            Task.objects.using(self.using).bulk_create(
+                self.tasks, ignore_conflicts=ignore_conflicts
+            )
+        else:
+            with transaction.atomic(using=self.using):
+                Task.objects.using(self.using).bulk_create(
+                    _without_duplicates(self.using, self.tasks)
+                )
+        if any(task.status == Task.QUEUED for task in self.tasks):
+            notify_workers(self.using)
+
+
+def _commit_batch(using: str) -> _CommitBatch:
+    """
+    The batch collecting tasks for the current transaction of ``using``.
+
+    Tasks join the earliest pending batch that is discarded exactly when
+    they must be: one registered in every savepoint still open, which covers
+    the whole transaction once a savepoint is released. A task created
+    inside a savepoint that no batch covers starts a batch registered within
+    it, so rolling back the savepoint discards only those tasks.
+    """
+    connection = transaction.get_connection(using)
+    # Django internals, pinned by EnqueueOnCommitTest: the open savepoints,
+    # and each pending callback as (savepoint IDs open when registered,
+    # callback, ...)
+    open_sids = set(connection.savepoint_ids)
+    for sids, callback, *_ in connection.run_on_commit:
+        if isinstance(callback, _CommitBatch) and open_sids <= set(sids):
+            return callback
+    batch = _CommitBatch(using)
+    transaction.on_commit(batch, using=using)
+    return batch
+
+
+def _create_unique(using: str, fields: dict) -> tuple[Task, bool]:
+    """
+    Insert a task with a ``dedupe_key``, unless an active task has that key.
+
+    The insert runs in a savepoint and relies on the
+    ``dsq_task_active_dedupe_uniq`` constraint, so the active task is only
+    looked up after a conflict. Backends without the constraint look it up
+    first, under a lock held until the insert.
+
+    Returns:
+        The new task and True, or the active task with the key and False.
+    """
+    active = _active_tasks(using).filter(dedupe_key=fields["dedupe_key"])
+    if not _enforces_dedupe(using):
+        with transaction.atomic(using=using):
+            existing = active.select_for_update().first()
+            if existing is not None:
+                return existing, False
+            return Task.objects.using(using).create(**fields), True
+    for attempt in range(3):
+        try:
+            with transaction.atomic(using=using):
+                return Task.objects.using(using).create(**fields), True
+        except IntegrityError:
+            existing = active.first()
+            if existing is not None:
+                return existing, False
+            # The active task finished in the meantime; insert again
+            if attempt == 2:
+                raise
+
+
+def create_task(
+    task: str,
+    args: dict,
+    priority: int = Task.PRIORITY_NORMAL,
+    queue: str = Task.DEFAULT_QUEUE,
+    eta: datetime | None = None,
+    countdown: float | None = None,
+    max_retries: int | None = None,
+    on_commit: bool | None = None,
+    dedupe_key: str | None = None,
+) -> uuid.UUID:
     """
     Create a new task to be executed by the worker.
 
     Args:
         task: Dotted path to the callable (e.g., "myapp.tasks.process_order")
         args: Dictionary of keyword arguments to pass to the callable
+        priority: Tasks with a lower value are claimed first (e.g.
+            ``Task.PRIORITY_HIGH``); defaults to ``Task.PRIORITY_NORMAL``
+        queue: Name of the queue to put the task on; only workers started
+            with ``--queues`` including it will run it
+        eta: Do not run the task before this time
+        countdown: Do not run the task before this many seconds from now
+        max_retries: Retry the task up to this many times when it fails,
+            overriding ``max_retries`` from DJANGO_SIMPLE_QUEUE_RETRY_POLICIES
+        on_commit: When called inside a transaction, only insert the task
+            once the transaction commits, together with the other tasks
+            created in it; defaults to DJANGO_SIMPLE_QUEUE_ENQUEUE_ON_COMMIT
+        dedupe_key: If an active (scheduled, queued or running) task already
+            has this key, no task is created and the existing one's UUID is
+            returned; enforced by a unique index, so only a duplicate costs
+            an extra query (on MySQL/MariaDB, which lack the index, the
+            active task is looked up first). With ``on_commit``, a duplicate
+            is dropped when the batch is inserted and the returned UUID
+            never exists
 
     Returns:
-        UUID of the created task
+        UUID of the created task, or of the active task with ``dedupe_key``
 
     Raises:
         TypeError: If args is not a dict
+        ValueError: If both eta and countdown are given
         TaskNotAllowedError: If task is not in DJANGO_SIMPLE_QUEUE_ALLOWED_TASKS
 
     Example:
@@ -37,17 +226,121 @@ def create_task(task: str, args: dict) -> uuid.UUID:
     """
     if not isinstance(args, dict):
         raise TypeError("args should be of type dict.")
+    _check_task_allowed(task)
+    eta = _resolve_eta(eta, countdown)
+    scheduled = eta is not None and eta > timezone.now()
 
-    if not is_task_allowed(task):
-        allowed = get_allowed_tasks()
-        if allowed is not None:
-            raise TaskNotAllowedError(
-                f"Task '{task}' is not in the allowed list. "
-                f"Add it to DJANGO_SIMPLE_QUEUE_ALLOWED_TASKS in settings.py"
-            )
-
-    obj = Task.objects.create(
+    fields = dict(
         task=task,
-        args=json.dumps(args)
+        args=json.dumps(args),
+        priority=priority,
+        queue=queue,
+        status=Task.SCHEDULED if scheduled else Task.QUEUED,
+        run_after=eta,
+        max_retries=max_retries,
+        concurrency_key=concurrency_key(task, args),
+        dedupe_key=dedupe_key,
     )
+    if on_commit is None:
+        on_commit = get_enqueue_on_commit()
+    using = router.db_for_write(Task)
+    if on_commit and transaction.get_connection(using).in_atomic_block:
+        obj = Task(**fields)
+        _commit_batch(using).tasks.append(obj)
+        return obj.id
+
+    if dedupe_key is None:
+        obj = Task.objects.create(**fields)
+    else:
+        obj, created = _create_unique(using, fields)
+        if not created:
+            return obj.id
+    if not scheduled:
+        notify_workers()
     return obj.id
+
+
+def create_tasks(
+    task: str,
+    args_list: Iterable[dict],
+    priority: int = Task.PRIORITY_NORMAL,
+    queue: str = Task.DEFAULT_QUEUE,
+    eta: datetime | None = None,
+    countdown: float | None = None,
+    max_retries: int | None = None,
+    batch_size: int = 1000,
+) -> list[uuid.UUID]:
+    """
+    Create many tasks of the same callable with one INSERT per batch.
+
+    The allowlist is checked once, and ``args_list`` is consumed lazily,
+    ``batch_size`` items at a time, so a generator of millions of argument
+    dicts never has to be held in memory. Each batch is committed on its
+    own (unless called inside a transaction), and workers are woken after
+    every batch, so they can start on the first tasks while the rest are
+    still being inserted.
+
+    Args:
+        task: Dotted path to the callable
+        args_list: Keyword arguments of each task, as an iterable of dicts
+        priority: See ``create_task``
+        queue: See ``create_task``
+        eta: See ``create_task``
+        countdown: See ``create_task``
+        max_retries: See ``create_task``
+        batch_size: Number of tasks inserted per ``bulk_create``
+
+    Returns:
+        UUIDs of the created tasks, in the order of ``args_list``
+
+    Raises:
+        TypeError: If an item of args_list is not a dict; the batches
+            before it are already inserted
+        ValueError: If both eta and countdown are given
+        TaskNotAllowedError: If task is not in DJANGO_SIMPLE_QUEUE_ALLOWED_TASKS
+
+    Example:
+        from django_simple_queue.utils import create_tasks
+
+        task_ids = create_tasks(
+            "myapp.tasks.send_newsletter",
+            ({"user_id": pk} for pk in User.objects.values_list("pk", flat=True).iterator()),
+        )
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1.")
+    _check_task_allowed(task)
+    eta = _resolve_eta(eta, countdown)
+    scheduled = eta is not None and eta > timezone.now()
+    status = Task.SCHEDULED if scheduled else Task.QUEUED
+    limits = load_concurrency_limits()
+
+    ids = []
+    args_iter = iter(args_list)
+    while True:
+        batch = list(islice(args_iter, batch_size))
+        if not batch:
+            break
+        now = timezone.now()
+        objs = []
+        for args in batch:
+            if not isinstance(args, dict):
+                raise TypeError("args should be of type dict.")
+            objs.append(
+                Task(
+                    task=task,
+                    args=json.dumps(args),
+                    priority=priority,
+                    queue=queue,
+                    status=status,
+                    run_after=eta,
+                    max_retries=max_retries,
+                    concurrency_key=concurrency_key(task, args, limits),
+                    enqueued_at=now,
+                )
+            )
+        Task.objects.bulk_create(objs)
+        ids.extend(obj.id for obj in objs)
+        if not scheduled:
+            notify_workers()
+    return ids
@@ -32,7 +32,7 @@ def view_task_status(request):
         return HttpResponseBadRequest("Missing task_id parameter.")
 
     try:
-        task = Task.objects.get(id=task_id)
+        task = Task.objects.select_related("result").get(id=task_id)
     except Task.DoesNotExist:
         return HttpResponseBadRequest("Task not found.")
     except (ValueError, TypeError, ValidationError):
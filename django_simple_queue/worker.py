@@ -2,19 +2,140 @@
 Task execution worker module.
 
 This module contains the core logic for executing tasks in a subprocess,
-including support for generator functions and log capture.
+including support for generator functions, coroutines and log capture.
 """
 import asyncio
-import importlib
+import contextlib
+import contextvars
+import functools
 import inspect
 import json
 import logging
 import os
 import sys
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.reduction import recv_handle
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.utils import timezone
 
 from django_simple_queue import signals
-from django_simple_queue.models import Task
+from django_simple_queue.loading import load_callable
+from django_simple_queue.models import Task, TaskResult
+from django_simple_queue.results import OutputBuffer, asave_result, save_result
+from django_simple_queue.retry import schedule_retry
+
+
+# Log file of the task running in the current thread (or asyncio task)
+_task_log = contextvars.ContextVar("django_simple_queue_task_log", default=None)
+
+
+class TaskLogStream:
+    """
+    Stand-in for ``sys.stdout``/``sys.stderr`` while tasks are captured.
+
+    Writes go to the log file of the task running in the current context,
+    so several tasks running on different threads of the same process each
+    capture only their own output. Outside a task, writes go to the stream
+    that was replaced.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def _target(self):
+        log_file = _task_log.get()
+        return self.fallback if log_file is None else log_file
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+class TaskLogHandler(logging.Handler):
+    """Logging handler that writes records to the current task's log file."""
+
+    def emit(self, record):
+        log_file = _task_log.get()
+        if log_file is None:
+            return
+        try:
+            log_file.write(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+
+_LOG_FORMAT = "%(asctime)s %(name)s %(levelname)s %(message)s"
+
+_capture_lock = threading.Lock()
+
+
+def install_log_capture():
+    """
+    Route stdout, stderr and logging to the current task's log file.
+
+    Installs ``TaskLogStream`` proxies and a root ``TaskLogHandler`` once
+    per process; calling it again is a no-op.
+    """
+    with _capture_lock:
+        if not isinstance(sys.stdout, TaskLogStream):
+            sys.stdout = TaskLogStream(sys.stdout)
+        if not isinstance(sys.stderr, TaskLogStream):
+            sys.stderr = TaskLogStream(sys.stderr)
+        if not any(isinstance(h, TaskLogHandler) for h in logging.root.handlers):
+            handler = TaskLogHandler()
+            handler.setFormatter(logging.Formatter(_LOG_FORMAT))
+            logging.root.addHandler(handler)
+            logging.root.setLevel(logging.DEBUG)
+
+
+@contextlib.contextmanager
+def _capture_task_log(log_fd, exclusive):
+    """
+    Send a task's stdout, stderr and logging to ``log_fd``.
+
+    When the process runs one task at a time (``exclusive``), ``sys.stdout``,
+    ``sys.stderr`` and the root logger are redirected process-wide, so output
+    from threads the task starts is captured too. Otherwise the capture is
+    context-local (see ``install_log_capture``) so that tasks sharing the
+    process keep their output apart.
+    """
+    if log_fd is None:
+        yield
+        return
+
+    log_file = os.fdopen(log_fd, "w")
+    if exclusive:
+        old_stdout, old_stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = log_file
+        handler = logging.StreamHandler(log_file)
+        handler.setFormatter(logging.Formatter(_LOG_FORMAT))
+        logging.root.addHandler(handler)
+        logging.root.setLevel(logging.DEBUG)
+        try:
+            yield
+        finally:
+            logging.root.removeHandler(handler)
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+            log_file.flush()
+            log_file.close()
+    else:
+        install_log_capture()
+        token = _task_log.set(log_file)
+        try:
+            yield
+        finally:
+            _task_log.reset(token)
+            log_file.flush()
+            log_file.close()
 
 
 class ManagedEventLoop:
@@ -45,90 +166,402 @@ class ManagedEventLoop:
             self.loop.close()
 
 
-def execute_task(task_id, log_fd=None):
+def _iterate_async_gen(loop, agen):
+    """Drive an async generator from synchronous code, one item at a time."""
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(agen.aclose())
+
+
+def _call_in_thread(func, *args, **kwargs):
+    """
+    Call ``func`` on a pool thread, then close the connections it made
+    there that are past ``CONN_MAX_AGE``.
+    """
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def _run_in_thread(func):
+    """
+    Wrap a synchronous task callable for async code.
+
+    It runs on a thread of its own rather than Django's shared sync thread,
+    which the async ORM calls of every other task in the child go through,
+    so a slow synchronous task cannot hold them up.
+    """
+    return sync_to_async(functools.partial(_call_in_thread, func), thread_sensitive=False)
+
+
+async def _iterate_in_thread(gen):
+    """Drive a synchronous generator from async code without blocking the loop."""
+    next_item = _run_in_thread(next)
+    done = object()
+    while True:
+        item = await next_item(gen, done)
+        if item is done:
+            return
+        yield item
+
+
+def _claim(task_obj):
+    """Fields identifying the claim a task is being run under."""
+    return {
+        "status": task_obj.status,
+        "worker_pid": task_obj.worker_pid,
+        "worker_boot_id": task_obj.worker_boot_id,
+    }
+
+
+def _ended(task_obj, claim, *fields):
+    """
+    Clear the PID and lease of a task whose run is over.
+
+    Returns the queryset and values of the update that saves the run's
+    outcome, so the run ends with a single write and the parent has nothing
+    left to update on the task but its log. The update only matches the task
+    while it still has the status, PID and boot ID of ``claim``: if its lease
+    was swept in the meantime, the task may already have been failed,
+    scheduled for a retry or claimed again, and the run must leave it alone.
+    """
+    task_obj.worker_pid = None
+    task_obj.lease_expires_at = None
+    task_obj.modified = timezone.now()
+    fields = ["status", *fields, "worker_pid", "lease_expires_at", "modified"]
+    return Task.objects.filter(pk=task_obj.pk, **claim), {
+        field: getattr(task_obj, field) for field in fields
+    }
+
+
+def _end_run(task_obj, claim, *fields):
+    """
+    Save the outcome of a run with ``_ended``.
+
+    Returns:
+        False if the task is no longer held by this run and was left as is.
+    """
+    queryset, values = _ended(task_obj, claim, *fields)
+    if queryset.update(**values):
+        return True
+    print(f"Task id {task_obj.pk} is no longer held by this worker; status left unchanged")
+    return False
+
+
+async def _aend_run(task_obj, claim, *fields):
+    """Async counterpart of ``_end_run``."""
+    queryset, values = _ended(task_obj, claim, *fields)
+    if await queryset.aupdate(**values):
+        return True
+    print(f"Task id {task_obj.pk} is no longer held by this worker; status left unchanged")
+    return False
+
+
+async def _asend(signal, **kwargs):
+    """Send ``signal`` from async code; receivers may use the sync ORM."""
+    await sync_to_async(signal.send)(sender=Task, **kwargs)
+
+
+def execute_task(task_id, log_fd=None, exclusive=True):
     """
     Execute a task by its ID.
 
     This function is called in a subprocess by the task_worker command.
     It handles loading the callable, executing it with the provided arguments,
-    and updating the task status/output in the database.
+    and updating the task status/output in the database. A plain function
+    costs three queries: loading the task, storing its result and one
+    targeted update of the task's status, PID and lease.
 
-    For generator functions, each yielded value is appended to the output,
-    and before_loop/after_loop signals are fired for each iteration.
+    For generator functions, each yielded value is appended to the output
+    through an ``OutputBuffer``, which saves it in chunks, and
+    before_loop/after_loop signals are fired for each iteration.
+    ``async def`` functions and async generators are run to completion on
+    the managed event loop.
 
     Args:
         task_id: UUID of the task to execute.
         log_fd: Optional file descriptor for capturing stdout/stderr/logging.
-            If provided, all output is redirected to this descriptor.
+            If provided, all output produced by the task is redirected to
+            this descriptor.
+        exclusive: Whether the process runs this task alone. If so, the
+            capture is process-wide and includes output from threads the
+            task starts; otherwise it is limited to the calling thread so
+            that tasks running on other threads are not captured.
 
     Signals Fired:
         - before_job: Before execution starts
         - on_success: If task completes successfully
         - on_failure: If task raises an exception
+        - on_retry: Instead of on_failure, if its retry policy schedules
+          another run
         - before_loop/after_loop: For each generator iteration
     """
-    log_file = None
-    log_handler = None
-    if log_fd is not None:
-        log_file = os.fdopen(log_fd, "w")
-        sys.stdout = log_file
-        sys.stderr = log_file
-        log_handler = logging.StreamHandler(log_file)
-        log_handler.setFormatter(
-            logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s")
-        )
-        logging.root.addHandler(log_handler)
-        logging.root.setLevel(logging.DEBUG)
-
-    try:
+    with _capture_task_log(log_fd, exclusive):
         task_obj = Task.objects.get(id=task_id)
+        claim = _claim(task_obj)
         print(f"Initiating task id: {task_id}")
         if task_obj.status in (Task.QUEUED, Task.PROGRESS):
-            with ManagedEventLoop():
+            with ManagedEventLoop() as loop:
                 signals.before_job.send(sender=Task, task=task_obj)
+                # Also becomes task_obj.result, read by signal receivers
+                result = TaskResult(task=task_obj)
+                buffer = OutputBuffer(task_id)
                 try:
-                    path = task_obj.task.split(".")
-                    module = importlib.import_module(".".join(path[:-1]))
-                    func = getattr(module, path[-1])
+                    func = load_callable(task_obj.task)
                     args = json.loads(task_obj.args)
-                    task_obj.output = ""
-                    task_obj.save()
+                    result.output = ""
 
-                    if inspect.isgeneratorfunction(func):
+                    if inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(
+                        func
+                    ):
+                        # Drop any earlier run's output before saving chunks
+                        save_result(task_id, output="")
                         gen = func(**args)
+                        if inspect.isasyncgen(gen):
+                            gen = _iterate_async_gen(loop, gen)
                         iteration = 0
-                        for output in gen:
-                            signals.before_loop.send(
-                                sender=Task, task=task_obj, iteration=iteration
+                        with contextlib.closing(gen):
+                            for output in gen:
+                                signals.before_loop.send(
+                                    sender=Task, task=task_obj, iteration=iteration
+                                )
+                                result.output += output
+                                if buffer.add(output):
+                                    buffer.flush()
+                                signals.after_loop.send(
+                                    sender=Task,
+                                    task=task_obj,
+                                    output=output,
+                                    iteration=iteration,
+                                )
+                                iteration += 1
+                        buffer.finish(result.output, error=None)
+                    else:
+                        value = func(**args)
+                        if inspect.isawaitable(value):
+                            value = loop.run_until_complete(value)
+                        result.output = value
+                        save_result(task_id, output=value, error=None)
+
+                    task_obj.status = Task.COMPLETED
+                    if _end_run(task_obj, claim):
+                        signals.on_success.send(sender=Task, task=task_obj)
+                except Exception as e:
+                    error = f"{repr(e)}\n\n{traceback.format_exc()}"
+                    buffer.finish(result.output, error=error)
+                    result.error = error
+                    if schedule_retry(task_obj, e):
+                        if _end_run(task_obj, claim, "run_after"):
+                            signals.on_retry.send(sender=Task, task=task_obj, error=e)
+                    else:
+                        task_obj.status = Task.FAILED
+                        if _end_run(task_obj, claim):
+                            signals.on_failure.send(sender=Task, task=task_obj, error=e)
+                finally:
+                    print(f"Finished task id: {task_id}")
+
+
+async def aexecute_task(task_id, log_fd=None):
+    """
+    Execute a task by its ID on the running event loop.
+
+    Async counterpart of ``execute_task`` used by the async pool: status and
+    output updates go through Django's async ORM, so many tasks can run
+    concurrently on a single event loop. ``async def`` functions and async
+    generators are awaited directly; plain functions and generators are run
+    on a thread pool so they block neither the loop nor the async ORM.
+
+    Args:
+        task_id: UUID of the task to execute.
+        log_fd: Optional file descriptor for capturing stdout/stderr/logging.
+            Output produced by the task (in its asyncio task) is redirected
+            to this descriptor.
+
+    Signals Fired:
+        Same as ``execute_task``. Receivers are called from a thread, so they
+        may keep using the synchronous ORM.
+    """
+    with _capture_task_log(log_fd, exclusive=False):
+        task_obj = await Task.objects.aget(id=task_id)
+        claim = _claim(task_obj)
+        print(f"Initiating task id: {task_id}")
+        if task_obj.status in (Task.QUEUED, Task.PROGRESS):
+            await _asend(signals.before_job, task=task_obj)
+            # Also becomes task_obj.result, read by signal receivers
+            result = TaskResult(task=task_obj)
+            buffer = OutputBuffer(task_id)
+            try:
+                func = load_callable(task_obj.task)
+                args = json.loads(task_obj.args)
+                result.output = ""
+
+                if inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func):
+                    await asave_result(task_id, output="")
+                    gen = func(**args)
+                    if not inspect.isasyncgen(gen):
+                        gen = _iterate_in_thread(gen)
+                    iteration = 0
+                    try:
+                        async for output in gen:
+                            await _asend(
+                                signals.before_loop, task=task_obj, iteration=iteration
                             )
-                            task_obj.output += output
-                            task_obj.save()
-                            signals.after_loop.send(
-                                sender=Task,
+                            result.output += output
+                            if buffer.add(output):
+                                await buffer.aflush()
+                            await _asend(
+                                signals.after_loop,
                                 task=task_obj,
                                 output=output,
                                 iteration=iteration,
                             )
                             iteration += 1
+                    finally:
+                        await gen.aclose()
+                    await buffer.afinish(result.output, error=None)
+                else:
+                    if inspect.iscoroutinefunction(func):
+                        value = await func(**args)
                     else:
-                        task_obj.output = func(**args)
-                        task_obj.save()
+                        value = await _run_in_thread(func)(**args)
+                    result.output = value
+                    await asave_result(task_id, output=value, error=None)
 
-                    task_obj.status = Task.COMPLETED
-                    task_obj.save()
-                    signals.on_success.send(sender=Task, task=task_obj)
-                except Exception as e:
-                    task_obj.error = f"{repr(e)}\n\n{traceback.format_exc()}"
+                task_obj.status = Task.COMPLETED
+                if await _aend_run(task_obj, claim):
+                    await _asend(signals.on_success, task=task_obj)
+            except Exception as e:
+                error = f"{repr(e)}\n\n{traceback.format_exc()}"
+                await buffer.afinish(result.output, error=error)
+                result.error = error
+                if schedule_retry(task_obj, e):
+                    if await _aend_run(task_obj, claim, "run_after"):
+                        await _asend(signals.on_retry, task=task_obj, error=e)
+                else:
                     task_obj.status = Task.FAILED
-                    task_obj.save()
-                    signals.on_failure.send(sender=Task, task=task_obj, error=e)
-                finally:
-                    print(f"Finished task id: {task_id}")
-    finally:
-        if log_file is not None:
-            if log_handler is not None:
-                logging.root.removeHandler(log_handler)
-            sys.stdout = sys.__stdout__
-            sys.stderr = sys.__stderr__
-            log_file.flush()
-            log_file.close()
+                    if await _aend_run(task_obj, claim):
+                        await _asend(signals.on_failure, task=task_obj, error=e)
+            finally:
+                print(f"Finished task id: {task_id}")
+
+
+def run_child(conn, threads=1):
+    """
+    Serve tasks sent by the parent worker until told to stop.
+
+    This is the main loop of a long-lived ``PreforkPool`` child. The parent
+    sends a task ID followed by the write end of a log pipe; the child runs
+    the task through ``execute_task`` and replies with ``(task_id, exit_code)``,
+    where a non-zero exit code means ``execute_task`` itself raised. Database
+    connections are kept between tasks, subject to ``CONN_MAX_AGE``.
+
+    Args:
+        conn: Child end of a ``multiprocessing.Pipe`` shared with the parent.
+            Receiving ``None`` (or EOF) makes the child exit once its running
+            tasks have finished.
+        threads: Number of tasks run at the same time. Above 1, tasks run on
+            a thread pool, each thread with its own database connection.
+    """
+    send_lock = threading.Lock()
+
+    def run(task_id, log_fd):
+        exit_code = 0
+        try:
+            execute_task(task_id, log_fd, exclusive=threads == 1)
+        except Exception:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            close_old_connections()
+        with send_lock:
+            try:
+                conn.send((task_id, exit_code))
+            except OSError:
+                pass  # Parent went away
+
+    executor = None
+    if threads > 1:
+        executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="task")
+    while True:
+        try:
+            task_id = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if task_id is None:
+            break
+        log_fd = recv_handle(conn)
+        if executor is None:
+            run(task_id, log_fd)
+        else:
+            executor.submit(run, task_id, log_fd)
+    if executor is not None:
+        executor.shutdown(wait=True)
+    conn.close()
+
+
+def run_async_child(conn, tasks=100):
+    """
+    Serve tasks sent by the parent worker on a single event loop.
+
+    Same protocol as ``run_child``, but every task runs as an asyncio task
+    through ``aexecute_task``, so one process can keep thousands of
+    I/O-bound coroutines in flight.
+
+    Args:
+        conn: Child end of a ``multiprocessing.Pipe`` shared with the parent.
+        tasks: Maximum number of tasks in flight at the same time.
+    """
+    try:
+        asyncio.run(_serve_async(conn, tasks))
+    except KeyboardInterrupt:
+        pass
+    conn.close()
+
+
+async def _serve_async(conn, tasks):
+    loop = asyncio.get_running_loop()
+    inbox = asyncio.Queue()
+    slots = asyncio.Semaphore(tasks)
+    in_flight = set()
+
+    def on_readable():
+        try:
+            task_id = conn.recv()
+            log_fd = recv_handle(conn) if task_id is not None else None
+        except (EOFError, OSError):
+            task_id, log_fd = None, None
+        if task_id is None:
+            loop.remove_reader(conn.fileno())
+        inbox.put_nowait((task_id, log_fd))
+
+    async def run(task_id, log_fd):
+        exit_code = 0
+        async with slots:
+            try:
+                await aexecute_task(task_id, log_fd)
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                await sync_to_async(close_old_connections)()
+        try:
+            conn.send((task_id, exit_code))
+        except OSError:
+            pass  # Parent went away
+
+    loop.add_reader(conn.fileno(), on_readable)
+    while True:
+        task_id, log_fd = await inbox.get()
+        if task_id is None:
+            break
+        task = asyncio.create_task(run(task_id, log_fd))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.gather(*in_flight, return_exceptions=True)